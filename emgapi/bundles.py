@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+ZIP and tar archives of download files, generated while they are streamed:
+the files are read from RESULTS_DIR in chunks and written to the response,
+without temporary files.
+
+Every archive starts with a manifest.tsv listing its files with the checksums
+stored in the database (file_checksum), so they can be verified once extracted.
+"""
+
+import logging
+import os
+import tarfile
+import time
+import zipfile
+from collections import namedtuple
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+ARCHIVE_FORMATS = {
+    'zip': 'application/zip',
+    'tar': 'application/x-tar',
+}
+
+# ZIP timestamps can't be older than 1980
+ZIP_EPOCH = 315619200
+
+MANIFEST_NAME = 'manifest.tsv'
+MANIFEST_HEADER = ('path', 'checksum', 'checksum_algorithm', 'description')
+
+# path is the path in the archive, file_path the path in RESULTS_DIR, or None for in-memory data
+BundleFile = namedtuple('BundleFile', ['path', 'file_path', 'size', 'mtime', 'data'])
+
+
+def download_path(result_directory, download):
+    """Path of a download file in RESULTS_DIR"""
+    parts = [settings.RESULTS_DIR, result_directory.lstrip('/')]
+    if download.subdir is not None:
+        parts.append(download.subdir.subdir)
+    parts.append(download.realname)
+    return os.path.join(*parts)
+
+
+def bundle_files(root, downloads):
+    """The files of an archive: the manifest and the download files that exist.
+    :param root: directory of the archive everything is in, usually the accession
+    :param downloads: iterable of (directory in the archive, result directory, download) tuples
+    :return: list of BundleFile
+    """
+    files = []
+    manifest = ['\t'.join(MANIFEST_HEADER)]
+    paths = set()
+    for directory, result_directory, download in downloads:
+        path = '/'.join(p for p in (root, directory, download.alias) if p)
+        if path in paths:
+            continue
+        file_path = download_path(result_directory, download)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            logger.warning('Download file {} not found, left out of the archive'.format(file_path))
+            continue
+        paths.add(path)
+        files.append(BundleFile(path, file_path, stat.st_size, stat.st_mtime, None))
+        manifest.append('\t'.join((
+            path,
+            download.file_checksum or '',
+            download.checksum_algorithm.name if download.checksum_algorithm else '',
+            download.description.description_label if download.description else '',
+        )))
+    data = ('\n'.join(manifest) + '\n').encode()
+    return [BundleFile(root + '/' + MANIFEST_NAME, None, len(data), time.time(), data)] + files
+
+
+def _read(bundle_file):
+    """The content of a bundle file in chunks, exactly `size` bytes of it"""
+    if bundle_file.data is not None:
+        yield bundle_file.data
+        return
+    remaining = bundle_file.size
+    with open(bundle_file.file_path, 'rb') as f:
+        while remaining:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise IOError('{} is shorter than when the archive was started'.format(bundle_file.file_path))
+            remaining -= len(chunk)
+            yield chunk
+
+
+class _Buffer(object):
+    """Write-only, unseekable file collecting what zipfile writes until it is popped"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(files):
+    """ZIP archive of the files, uncompressed (most result files are gzipped already).
+    The archive is written to an unseekable buffer, so zipfile uses data descriptors,
+    and ZIP64 records for the files and archives over 4 GB.
+    """
+    return (chunk for chunk in _zip_chunks(files) if chunk)
+
+
+def _zip_chunks(files):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for bundle_file in files:
+            info = zipfile.ZipInfo(bundle_file.path, date_time=time.localtime(max(bundle_file.mtime, ZIP_EPOCH))[:6])
+            info.file_size = bundle_file.size
+            with archive.open(info, mode='w') as entry:
+                for chunk in _read(bundle_file):
+                    entry.write(chunk)
+                    yield buffer.pop()
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+def stream_tar(files):
+    """tar archive of the files, with PAX headers for the long paths and the files over 8 GB"""
+    for bundle_file in files:
+        info = tarfile.TarInfo(bundle_file.path)
+        info.size = bundle_file.size
+        info.mtime = bundle_file.mtime
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+        yield from _read(bundle_file)
+        remainder = bundle_file.size % tarfile.BLOCKSIZE
+        if remainder:
+            yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+    # end of archive
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+
+
+def _param_list(request, name):
+    return [v for value in request.GET.getlist(name) for v in value.split(',') if v]
+
+
+def filter_downloads(request, queryset):
+    """Select the downloads of the group (download group types, e.g. Taxonomic analysis)
+    and pipeline (release versions) params, both lists.
+    """
+    groups = _param_list(request, 'group')
+    if groups:
+        queryset = queryset.filter(group_type__group_type__in=groups)
+    pipelines = _param_list(request, 'pipeline')
+    if pipelines:
+        queryset = queryset.filter(pipeline__release_version__in=pipelines)
+    return queryset
+
+
+def bundle_response(request, root, downloads):
+    """Stream the archive of the downloads, in the format of the archive param (zip by default).
+    :param downloads: see bundle_files
+    """
+    archive_format = request.GET.get('archive', 'zip')
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValidationError({'archive': 'Must be one of: {}.'.format(', '.join(ARCHIVE_FORMATS))})
+    files = bundle_files(root, downloads)
+    content = stream_zip(files) if archive_format == 'zip' else stream_tar(files)
+    response = StreamingHttpResponse(content, content_type=ARCHIVE_FORMATS[archive_format])
+    response['Content-Disposition'] = 'attachment; filename={0}.{1}'.format(root, archive_format)
+    return response
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import json
+import os
+from collections import namedtuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from . import models as emg_models
+
+
+ExportColumn = namedtuple('ExportColumn', ['name', 'lookup', 'type', 'convert'], defaults=(None,))
+
+METADATA_PREFIX = 'metadata.'
+
+# Study summary matrices are stored next to the TSV with this extension
+MATRIX_EXTENSION = '.arrow'
+# Schema metadata key listing the term (non-count) columns of a matrix
+MATRIX_KEY_COLUMNS = b'emg.key_columns'
+
+
+def study_accession(pk):
+    return 'MGYS{pk:0>8}'.format(pk=pk) if pk is not None else None
+
+
+def analysis_accession(pk):
+    return 'MGYA{pk:0>8}'.format(pk=pk) if pk is not None else None
+
+
+def to_float(value):
+    return float(value) if value is not None else None
+
+
+STUDY_EXPORT_COLUMNS = (
+    ExportColumn('accession', 'study_id', pa.string(), study_accession),
+    ExportColumn('secondary_accession', 'secondary_accession', pa.string()),
+    ExportColumn('bioproject', 'project_id', pa.string()),
+    ExportColumn('study_name', 'study_name', pa.string()),
+    ExportColumn('centre_name', 'centre_name', pa.string()),
+    ExportColumn('data_origination', 'data_origination', pa.string()),
+    ExportColumn('biome', 'biome__lineage', pa.string()),
+    ExportColumn('samples_count', 'samples_count', pa.int64()),
+    ExportColumn('public_release_date', 'public_release_date', pa.date32()),
+    ExportColumn('last_update', 'last_update', pa.timestamp('s')),
+)
+
+SAMPLE_EXPORT_COLUMNS = (
+    ExportColumn('accession', 'accession', pa.string()),
+    ExportColumn('biosample', 'primary_accession', pa.string()),
+    ExportColumn('sample_name', 'sample_name', pa.string()),
+    ExportColumn('sample_desc', 'sample_desc', pa.string()),
+    ExportColumn('sample_alias', 'sample_alias', pa.string()),
+    ExportColumn('species', 'species', pa.string()),
+    ExportColumn('host_tax_id', 'host_tax_id', pa.int64()),
+    ExportColumn('environment_biome', 'environment_biome', pa.string()),
+    ExportColumn('environment_feature', 'environment_feature', pa.string()),
+    ExportColumn('environment_material', 'environment_material', pa.string()),
+    ExportColumn('geo_loc_name', 'geo_loc_name', pa.string()),
+    ExportColumn('latitude', 'latitude', pa.float64(), to_float),
+    ExportColumn('longitude', 'longitude', pa.float64(), to_float),
+    ExportColumn('collection_date', 'collection_date', pa.date32()),
+    ExportColumn('biome', 'biome__lineage', pa.string()),
+    ExportColumn('last_update', 'last_update', pa.timestamp('s')),
+)
+
+ANALYSIS_EXPORT_COLUMNS = (
+    ExportColumn('accession', 'job_id', pa.string(), analysis_accession),
+    ExportColumn('study', 'study_id', pa.string(), study_accession),
+    ExportColumn('sample', 'sample__accession', pa.string()),
+    ExportColumn('run', 'run__accession', pa.string()),
+    ExportColumn('assembly', 'assembly__accession', pa.string()),
+    ExportColumn('pipeline_version', 'pipeline__release_version', pa.string()),
+    ExportColumn('experiment_type', 'experiment_type__experiment_type', pa.string()),
+    ExportColumn('analysis_status', 'analysis_status__analysis_status', pa.string()),
+    ExportColumn('instrument_platform', 'instrument_platform', pa.string()),
+    ExportColumn('instrument_model', 'instrument_model', pa.string()),
+    ExportColumn('complete_time', 'complete_time', pa.timestamp('s')),
+)
+
+
+class ColumnarExport(object):
+    """
+    Builds Arrow record batches from a queryset, reading `batch_size` rows
+    of values_list at a time so memory is bounded by the batch size.
+
+    If `sample_metadata` is set the queryset must be a Sample queryset,
+    each SampleAnn variable is added as a `metadata.<variable name>` column.
+    """
+
+    def __init__(self, queryset, columns, sample_metadata=False):
+        # prefetches are meaningless for values_list, and break it
+        self.queryset = queryset.prefetch_related(None)
+        self.columns = columns
+        self.metadata_names = []
+        if sample_metadata:
+            self.metadata_names = list(
+                emg_models.VariableNames.objects
+                .filter(sampleann__sample__in=self.queryset.values('pk'))
+                .order_by('var_name')
+                .values_list('var_name', flat=True)
+                .distinct()
+            )
+        self.schema = pa.schema(
+            [pa.field(c.name, c.type) for c in self.columns] +
+            [pa.field(METADATA_PREFIX + name, pa.string()) for name in self.metadata_names]
+        )
+
+    def batches(self, batch_size):
+        lookups = ['pk'] + [c.lookup for c in self.columns]
+        rows = self.queryset.values_list(*lookups).iterator(chunk_size=batch_size)
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                break
+            yield self._record_batch(chunk)
+            if len(chunk) < batch_size:
+                break
+
+    def _record_batch(self, chunk):
+        pks = [row[0] for row in chunk]
+        arrays = []
+        for index, column in enumerate(self.columns, start=1):
+            values = [row[index] for row in chunk]
+            if column.convert is not None:
+                values = [column.convert(v) for v in values]
+            arrays.append(pa.array(values, type=column.type))
+        if self.metadata_names:
+            arrays.extend(self._metadata_arrays(pks))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def _metadata_arrays(self, sample_ids):
+        values = dict((name, {}) for name in self.metadata_names)
+        annotations = emg_models.SampleAnn.objects \
+            .filter(sample_id__in=sample_ids) \
+            .values_list('sample_id', 'var__var_name', 'var_val_ucv')
+        for sample_id, var_name, value in annotations:
+            if var_name in values:
+                values[var_name][sample_id] = value
+        return [
+            pa.array([values[name].get(pk) for pk in sample_ids], type=pa.string())
+            for name in self.metadata_names
+        ]
+
+
+def matrix_path(tsv_path):
+    """Path of the columnar copy of a study summary TSV.
+    """
+    return os.path.splitext(tsv_path)[0] + MATRIX_EXTENSION
+
+
+def write_matrix(df, path, batch_size=10000):
+    """
+    Writes a study summary matrix (terms x analyses) as an uncompressed
+    Arrow IPC file, so that it can be memory-mapped by StudyMatrix.
+    The non-numeric columns are the term columns (e.g. IPR, description),
+    every numeric column holds the counts of one analysis.
+    """
+    key_columns = [c for c in df.select_dtypes(exclude='number').columns]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({MATRIX_KEY_COLUMNS: json.dumps(key_columns)})
+    # write to a temporary file so readers never map a partial matrix
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=batch_size)
+    os.replace(tmp_path, path)
+
+
+class StudyMatrix(object):
+    """
+    Memory-mapped study summary matrix written by `write_matrix`.
+    Reading is zero-copy, only the pages of the selected columns
+    are loaded when a slice is materialised.
+    """
+
+    def __init__(self, path):
+        reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+        self.table = reader.read_all()
+        metadata = self.table.schema.metadata or {}
+        self.key_columns = json.loads(metadata.get(MATRIX_KEY_COLUMNS, b'[]'))
+        self.analyses = [c for c in self.table.column_names if c not in self.key_columns]
+
+    def slice(self, terms=None, analyses=None):
+        """
+        Selects the rows of `terms` (matched on the first term column)
+        and the columns of `analyses`. None selects everything.
+        :raises KeyError: for analyses that are not in the matrix
+        """
+        if analyses is None:
+            analyses = self.analyses
+        unknown = [a for a in analyses if a not in self.analyses]
+        if unknown:
+            raise KeyError(', '.join(unknown))
+        table = self.table.select(self.key_columns + list(analyses))
+        if terms is not None and self.key_columns:
+            mask = pc.is_in(
+                table.column(self.key_columns[0]).cast(pa.string()),
+                value_set=pa.array(terms, type=pa.string())
+            )
+            table = table.filter(mask)
+        return table
@@ -245,6 +245,13 @@ class QueryArrayWidget(widgets.BaseCSVWidget, forms.TextInput):
         return list(set(ret))
 
 
+class CharInFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    """Multiple values filter that doesn't validate them against a queryset,
+    for the filters that match the values on more than one field.
+    """
+    pass
+
+
 class SuperStudyFilter(django_filters.FilterSet):
 
     biome_name = django_filters.CharFilter(
@@ -965,13 +972,11 @@ class GenomeFilter(django_filters.FilterSet):
         help_text="Pan-genome accessory size less/equal value",
     )
 
-    accession = filters.ModelMultipleChoiceFilter(
-        queryset=emg_models.Genome.objects,
-        to_field_name="accession",
+    accession = CharInFilter(
         method="filter_accession",
         distinct=True,
         label="Accession",
-        help_text="Select by MGnify, NCBI, IMG or Patric accession",
+        help_text="Select by MGnify, ENA, NCBI, IMG or Patric accession",
         widget=QueryArrayWidget,
     )
 
@@ -984,26 +989,44 @@ class GenomeFilter(django_filters.FilterSet):
         - PATRIC genome accesssion
         """
         if values:
-            qs = qs.filter(
-                Q(accession__in=values)
-                | Q(ena_genome_accession__in=values)
-                | Q(ena_sample_accession__in=values)
-                | Q(ena_study_accession__in=values)
-                | Q(ncbi_genome_accession__in=values)
-                | Q(ncbi_sample_accession__in=values)
-                | Q(ncbi_study_accession__in=values)
-                | Q(img_genome_accession__in=values)
-                | Q(patric_genome_accession__in=values)
-            )
+            qs = qs.filter(emg_utils.genome_accession_query(values))
         return qs
 
     taxon_lineage = django_filters.CharFilter(
-        field_name="taxon_lineage",
-        lookup_expr="contains",
+        method="filter_taxon_lineage",
         help_text="Taxon lineage",
         label="Taxon lineage",
     )
 
+    def filter_taxon_lineage(self, qs, name, value):
+        """Filter the genomes whose lineage contains value (case-sensitive).
+        Values made of consecutive ranks, e.g. g__Bacteroides or p__Bacteroidota;c__Bacteroidia,
+        are first narrowed down on the (indexed) rank fields rather than by scanning the lineages:
+        the last rank matches as a prefix (g__Bacteroides includes g__Bacteroides_A), the others exactly.
+        Those lookups follow the collation of the columns (case-insensitive on MySQL),
+        the lineage is then matched case-sensitively on the remaining genomes only.
+        """
+        if not value:
+            return qs
+        ranks = list(emg_models.Genome.TAXON_RANKS)
+        taxa = [taxon.partition("__") for taxon in value.split(";")]
+        prefixes = [prefix for prefix, _, _ in taxa]
+        if (
+            all(separator and taxon for _, separator, taxon in taxa)
+            and all(prefix in ranks for prefix in prefixes)
+            and [ranks.index(prefix) for prefix in prefixes]
+            == list(range(ranks.index(prefixes[0]), ranks.index(prefixes[0]) + len(prefixes)))
+        ):
+            lookups = {}
+            for index, (prefix, _, taxon) in enumerate(taxa):
+                field = emg_models.Genome.TAXON_RANKS[prefix]
+                if index == len(taxa) - 1:
+                    lookups[field + "__istartswith"] = taxon
+                else:
+                    lookups[field] = taxon
+            qs = qs.filter(**lookups)
+        return qs.filter(taxon_lineage__contains=value)
+
     mag_type = django_filters.ChoiceFilter(
         field_name="type",
         help_text="MAG or isolate",
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Krona charts (taxonomy-summary/**/krona.html) served precompressed.
+
+The compressed copies are stored next to the chart (krona.html.gz, krona.html.br)
+by import_taxonomy, or the first time the chart is requested. A copy older than
+the chart is written again. Brotli copies are only written if brotli is installed.
+
+Behind NGINX the response is an X-Accel-Redirect to the chart itself: NGINX doesn't pass
+the Content-Encoding, ETag and Vary headers of the upstream response on an internal redirect,
+so it has to pick the copy and set them. The results location needs the static modules on:
+
+    location /results/ {
+        internal;
+        alias /path/to/results/;
+        gzip_static on;
+        gzip_vary on;
+        brotli_static on;  # ngx_brotli, optional
+    }
+
+With DOWNLOADS_BYPASS_NGINX the copy is streamed by Django, with those headers.
+"""
+
+import gzip
+import logging
+import os
+import shutil
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+KRONA_FILE = 'krona.html'
+CONTENT_TYPE = 'text/html; charset=utf-8'
+
+
+def _gzip(path, compressed_path):
+    with open(path, 'rb') as src, gzip.GzipFile(compressed_path, 'wb', compresslevel=9, mtime=0) as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def _brotli(path, compressed_path):
+    with open(path, 'rb') as src, open(compressed_path, 'wb') as dst:
+        dst.write(brotli.compress(src.read()))
+
+
+# Content-Encoding -> (extension, compressor), in order of preference
+ENCODINGS = [('gzip', ('.gz', _gzip))]
+if brotli is not None:
+    ENCODINGS.insert(0, ('br', ('.br', _brotli)))
+ENCODINGS = dict(ENCODINGS)
+
+
+def krona_path(result_directory, subdir=None):
+    """Path of the Krona chart of an analysis.
+    :param subdir: lsu, ssu, unite or itsonedb; None for the chart of the older pipelines
+    """
+    base_path = os.path.join(settings.RESULTS_DIR, result_directory, 'taxonomy-summary')
+    if subdir is None:
+        path = base_path
+    elif subdir in ['unite', 'itsonedb']:
+        path = os.path.join(base_path, 'its', subdir)
+    else:
+        path = os.path.join(base_path, subdir.upper())
+
+    if subdir == 'ssu' and not os.path.exists(path):
+        # Older pipelines (1, 2...?) have SSU-only Krona in un-nested directory.
+        path = base_path
+    return os.path.abspath(os.path.join(path, KRONA_FILE))
+
+
+def compressed_path(path, encoding, mtime_ns=None):
+    """Path of the copy of a chart compressed with encoding, written if it's missing or stale.
+    :param mtime_ns: mtime of the chart, if it was stat-ed already
+    :return: the path, or None if the copy could not be written (e.g. read-only results)
+    """
+    extension, compress = ENCODINGS[encoding]
+    copy_path = path + extension
+    if mtime_ns is None:
+        mtime_ns = os.stat(path).st_mtime_ns
+    try:
+        if os.stat(copy_path).st_mtime_ns >= mtime_ns:
+            return copy_path
+    except OSError:
+        pass
+    # write to a temporary file so a partial copy is never served
+    tmp_path = '{}.{}.tmp'.format(copy_path, os.getpid())
+    try:
+        compress(path, tmp_path)
+        os.replace(tmp_path, copy_path)
+    except OSError:
+        logger.warning('Could not write the compressed Krona chart {}'.format(copy_path), exc_info=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    logger.info('Wrote the compressed Krona chart {}'.format(copy_path))
+    return copy_path
+
+
+def compress_charts(root):
+    """Write the compressed copies of all the Krona charts of an analysis
+    :param root: taxonomy-summary directory of the analysis
+    :return: number of charts
+    """
+    count = 0
+    for dirpath, _, filenames in os.walk(root):
+        if KRONA_FILE in filenames:
+            path = os.path.join(dirpath, KRONA_FILE)
+            for encoding in ENCODINGS:
+                compressed_path(path, encoding)
+            count += 1
+    return count
+
+
+def accepted_encodings(request):
+    """The encodings of the Accept-Encoding header of the request, without the ones with q=0"""
+    encodings = set()
+    for value in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = value.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def krona_response(request, path):
+    """Serve a Krona chart via NGINX X-Accel-Redirect, making sure its compressed copies exist,
+    or stream it compressed with the preferred encoding accepted by the client
+    if DOWNLOADS_BYPASS_NGINX is set. The ETag of the streamed chart is derived from
+    the mtime and size of the chart, and the encoding.
+    :return: the response, or None if there is no chart
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    if not settings.DOWNLOADS_BYPASS_NGINX:
+        for encoding in ENCODINGS:
+            compressed_path(path, encoding, stat.st_mtime_ns)
+        response = HttpResponse(content_type=CONTENT_TYPE)
+        response['X-Accel-Redirect'] = '/results/{0}'.format(
+            os.path.relpath(path, os.path.abspath(settings.RESULTS_DIR)))
+        return response
+
+    accepted = accepted_encodings(request)
+    encoding, file_path = None, path
+    for candidate in ENCODINGS:
+        if candidate in accepted or '*' in accepted:
+            copy_path = compressed_path(path, candidate, stat.st_mtime_ns)
+            if copy_path:
+                encoding, file_path = candidate, copy_path
+                break
+
+    etag = '"{:x}-{:x}{}"'.format(stat.st_mtime_ns, stat.st_size, '-' + encoding if encoding else '')
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(file_path, 'rb'))
+        # set after, FileResponse guesses the type of text/html responses from the file name
+        response['Content-Type'] = CONTENT_TYPE
+    if encoding and response.status_code == 200:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
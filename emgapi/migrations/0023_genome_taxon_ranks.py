@@ -0,0 +1,77 @@
+# Generated by Django 3.2.23 on 2026-10-19 16:28
+
+from django.db import migrations, models
+
+TAXON_RANKS = {
+    'd': 'taxon_domain',
+    'p': 'taxon_phylum',
+    'c': 'taxon_class',
+    'o': 'taxon_order',
+    'f': 'taxon_family',
+    'g': 'taxon_genus',
+    's': 'taxon_species',
+}
+
+
+def split_taxon_lineages(apps, schema_editor):
+    Genome = apps.get_model("emgapi", "Genome")
+    genomes = []
+    for genome in Genome.objects.only('genome_id', 'taxon_lineage').iterator(chunk_size=2000):
+        for taxon in (genome.taxon_lineage or '').split(';'):
+            prefix, _, name = taxon.strip().partition('__')
+            if prefix in TAXON_RANKS and name:
+                setattr(genome, TAXON_RANKS[prefix], name)
+        genomes.append(genome)
+        if len(genomes) == 2000:
+            Genome.objects.bulk_update(genomes, TAXON_RANKS.values())
+            genomes = []
+    Genome.objects.bulk_update(genomes, TAXON_RANKS.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emgapi', '0022_genomecatalogue_other_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_class',
+            field=models.CharField(blank=True, db_column='TAXON_CLASS', db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_domain',
+            field=models.CharField(blank=True, db_column='TAXON_DOMAIN', db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_family',
+            field=models.CharField(blank=True, db_column='TAXON_FAMILY', db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_genus',
+            field=models.CharField(blank=True, db_column='TAXON_GENUS', db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_order',
+            field=models.CharField(blank=True, db_column='TAXON_ORDER', db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_phylum',
+            field=models.CharField(blank=True, db_column='TAXON_PHYLUM', db_index=True, max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='genome',
+            name='taxon_species',
+            field=models.CharField(blank=True, db_column='TAXON_SPECIES', db_index=True, max_length=200, null=True),
+        ),
+        migrations.RunPython(
+            code=split_taxon_lineages,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
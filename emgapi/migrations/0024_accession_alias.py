@@ -0,0 +1,56 @@
+# Generated by Django 3.2.23 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+ACCESSION_ALIAS_FIELDS = {
+    'study': ('secondary_accession', 'project_id'),
+    'genome': (
+        'accession',
+        'ena_genome_accession', 'ena_sample_accession', 'ena_study_accession',
+        'ncbi_genome_accession', 'ncbi_sample_accession', 'ncbi_study_accession',
+        'img_genome_accession', 'patric_genome_accession',
+    ),
+}
+
+
+def create_aliases(apps, schema_editor):
+    AccessionAlias = apps.get_model("emgapi", "AccessionAlias")
+    for entity_type, fields in ACCESSION_ALIAS_FIELDS.items():
+        model = apps.get_model("emgapi", entity_type)
+        aliases = []
+        for pk, *values in model.objects.values_list('pk', *fields).iterator(chunk_size=2000):
+            aliases.extend(
+                AccessionAlias(alias=alias, entity_type=entity_type, entity_id=pk)
+                for alias in set(values) if alias
+            )
+            if len(aliases) >= 2000:
+                AccessionAlias.objects.bulk_create(aliases)
+                aliases = []
+        AccessionAlias.objects.bulk_create(aliases)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emgapi', '0023_genome_taxon_ranks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessionAlias',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(db_column='ALIAS', max_length=40)),
+                ('entity_type', models.CharField(db_column='ENTITY_TYPE', max_length=20)),
+                ('entity_id', models.IntegerField(db_column='ENTITY_ID')),
+            ],
+            options={
+                'db_table': 'ACCESSION_ALIAS',
+                'unique_together': {('alias', 'entity_type', 'entity_id')},
+            },
+        ),
+        migrations.RunPython(
+            code=create_aliases,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
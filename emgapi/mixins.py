@@ -4,11 +4,15 @@
 from django.conf import settings
 from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from rest_framework.decorators import action
 from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework_json_api.renderers import JSONRenderer
 
-from emgapi.renderers import CSVStreamingRenderer, EMGBrowsableAPIRenderer
+from emgapi.columnar import ColumnarExport
+from emgapi.renderers import CSVStreamingRenderer, EMGBrowsableAPIRenderer, ParquetRenderer, ArrowStreamRenderer, \
+    BaseArrowStreamingRenderer
+from emgapi.utils import queryset_iterator
 
 
 class MultipleFieldLookupMixin(object):
@@ -40,16 +44,33 @@ class ExcessiveCSVException(APIException):
 class ListModelMixin(object):
     """
     List a queryset.
+    CSV requests are not paginated, the whole queryset is streamed.
     """
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
         if isinstance(request.accepted_renderer, CSVStreamingRenderer):
-            count_limit = 50 * settings.EMG_DEFAULT_LIMIT
+            return self.stream_csv(request, queryset)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def stream_csv(self, request, queryset):
+        """
+        Serialize the queryset one row at a time, while the response is consumed,
+        so the memory used doesn't depend on the number of rows.
+        The queryset is read twice, the first time to build the header of the CSV.
+        """
+        count_limit = settings.EMG_CSV_MAX_ROWS
+        if count_limit is not None:
             queryset_size = len(queryset) if isinstance(queryset, list) else queryset.count()
             if queryset_size > count_limit:
-                # More than 50 pages of results will probably timeout
-                # (for a complicated endpoint like Studies).
+                # Very long exports will probably timeout.
                 # Return custom exception detailing use of paginated API.
                 if request.accepts('text/html'):
                     request.accepted_renderer = EMGBrowsableAPIRenderer()
@@ -57,23 +78,79 @@ class ListModelMixin(object):
                     request.accepted_renderer = JSONRenderer()
                 raise ExcessiveCSVException
 
+        try:
+            filename = queryset.model.__name__
+        except AttributeError:
             try:
-                filename = queryset.model.__name__
+                filename = queryset._name
             except AttributeError:
-                try:
-                    filename = queryset._name
-                except AttributeError:
-                    filename = queryset._document.__name__ if hasattr(queryset, '_document') else request.path.split('/')[-1]
-            serializer = self.get_serializer(queryset, many=True)
-            response = StreamingHttpResponse(request.accepted_renderer.render(serializer.data), content_type='text/csv')
-            response['Content-Disposition'] = \
-                'attachment; filename="{}.csv"'.format(filename)
-            return response
+                if hasattr(queryset, '_document'):
+                    filename = queryset._document.__name__
+                else:
+                    filename = request.path.split('/')[-1]
+        serializer = self.get_serializer(queryset, many=True)
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+        def rows():
+            return (
+                serializer.child.to_representation(instance)
+                for instance in queryset_iterator(queryset, settings.EMG_CSV_CHUNK_SIZE)
+            )
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        response = StreamingHttpResponse(request.accepted_renderer.render_rows(rows), content_type='text/csv')
+        response['Content-Disposition'] = \
+            'attachment; filename="{}.csv"'.format(filename)
+        return response
+
+
+class ColumnarErrorsMixin(object):
+    """
+    Errors can't be written as Parquet or Arrow,
+    render them as JSON instead.
+    """
+
+    def handle_exception(self, exc):
+        if isinstance(getattr(self.request, 'accepted_renderer', None), BaseArrowStreamingRenderer):
+            self.request.accepted_renderer = JSONRenderer()
+            self.request.accepted_media_type = JSONRenderer.media_type
+        return super(ColumnarErrorsMixin, self).handle_exception(exc)
+
+
+class ColumnarExportMixin(ColumnarErrorsMixin):
+    """
+    Adds an `export` list action that streams the filtered queryset
+    as Parquet (default, or ?format=parquet) or as an Arrow IPC stream (?format=arrow).
+
+    Usage:
+        `export_columns`: the emgapi.columnar.ExportColumn to export
+        `export_sample_metadata`: add the SampleAnn metadata columns (Sample viewsets only)
+    """
+    export_columns = ()
+    export_sample_metadata = False
+
+    @action(
+        detail=False,
+        methods=['get', ],
+        renderer_classes=(ParquetRenderer, ArrowStreamRenderer),
+    )
+    def export(self, request, *args, **kwargs):
+        """
+        Exports the (filtered) list in a columnar format, in batches of
+        `EMG_COLUMNAR_EXPORT_BATCH_SIZE` rows (one Parquet row group per batch).
+        The same filters as the list endpoint are supported.
+        Example:
+        ---
+        `/studies/export?format=parquet`
+
+        `/analyses/export?format=arrow&lineage=root:Environmental:Aquatic`
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        export = ColumnarExport(queryset, self.export_columns, sample_metadata=self.export_sample_metadata)
+        renderer = request.accepted_renderer
+        content = renderer.render(
+            export.batches(settings.EMG_COLUMNAR_EXPORT_BATCH_SIZE),
+            renderer_context={'schema': export.schema}
+        )
+        response = StreamingHttpResponse(content, content_type=renderer.media_type)
+        response['Content-Disposition'] = \
+            'attachment; filename="{}.{}"'.format(self.basename, renderer.format)
+        return response
@@ -19,7 +19,7 @@ import logging
 from django.apps import apps
 from django.conf import settings
 from django.core.exceptions import FieldDoesNotExist
-from django.db import models
+from django.db import models, transaction
 from django.db.models import (CharField, Count, OuterRef, Prefetch, Q,
                               Subquery, Value, QuerySet, F)
 from django.db.models.functions import Cast, Concat
@@ -1144,6 +1144,19 @@ class Study(ENASyncableModel, EBISearchIndexedModel):
 
     objects = StudyManager()
 
+    # the MGYS accession is the primary key
+    ACCESSION_ALIAS_FIELDS = ('secondary_accession', 'project_id')
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        AccessionAlias.objects.using(self._state.db).sync(Study, [self.pk])
+
+    def delete(self, *args, **kwargs):
+        pk, db = self.pk, self._state.db
+        result = super().delete(*args, **kwargs)
+        AccessionAlias.objects.using(db).sync(Study, [pk])
+        return result
+
     class Meta:
         db_table = 'STUDY'
         unique_together = (('study_id', 'secondary_accession'),)
@@ -2155,6 +2168,14 @@ class Genome(models.Model):
     eggnog_coverage = models.FloatField(db_column='EGGNOG_COVERAGE')
     ipr_coverage = models.FloatField(db_column='IPR_COVERAGE')
     taxon_lineage = models.CharField(db_column='TAXON_LINEAGE', max_length=400)
+    # taxon_lineage split by rank (without the d__, p__... prefixes), so taxonomy filters can use an index
+    taxon_domain = models.CharField(db_column='TAXON_DOMAIN', max_length=200, null=True, blank=True, db_index=True)
+    taxon_phylum = models.CharField(db_column='TAXON_PHYLUM', max_length=200, null=True, blank=True, db_index=True)
+    taxon_class = models.CharField(db_column='TAXON_CLASS', max_length=200, null=True, blank=True, db_index=True)
+    taxon_order = models.CharField(db_column='TAXON_ORDER', max_length=200, null=True, blank=True, db_index=True)
+    taxon_family = models.CharField(db_column='TAXON_FAMILY', max_length=200, null=True, blank=True, db_index=True)
+    taxon_genus = models.CharField(db_column='TAXON_GENUS', max_length=200, null=True, blank=True, db_index=True)
+    taxon_species = models.CharField(db_column='TAXON_SPECIES', max_length=200, null=True, blank=True, db_index=True)
 
     num_genomes_total = models.IntegerField(db_column='PANGENOME_TOTAL_GENOMES', null=True, blank=True)
     pangenome_size = models.IntegerField(db_column='PANGENOME_SIZE', null=True, blank=True)
@@ -2196,6 +2217,51 @@ class Genome(models.Model):
             name = None
         return name
 
+    # lineage prefix -> rank field
+    TAXON_RANKS = {
+        'd': 'taxon_domain',
+        'p': 'taxon_phylum',
+        'c': 'taxon_class',
+        'o': 'taxon_order',
+        'f': 'taxon_family',
+        'g': 'taxon_genus',
+        's': 'taxon_species',
+    }
+
+    @classmethod
+    def split_taxon_lineage(cls, taxon_lineage):
+        """Split a lineage like d__Bacteria;p__Firmicutes_A;...;s__ into the rank fields.
+        Empty ranks (e.g. s__) are None.
+        """
+        ranks = dict.fromkeys(cls.TAXON_RANKS.values())
+        for taxon in (taxon_lineage or '').split(';'):
+            prefix, _, name = taxon.strip().partition('__')
+            if prefix in cls.TAXON_RANKS and name:
+                ranks[cls.TAXON_RANKS[prefix]] = name
+        return ranks
+
+    def set_taxon_ranks(self):
+        for field, name in self.split_taxon_lineage(self.taxon_lineage).items():
+            setattr(self, field, name)
+
+    ACCESSION_ALIAS_FIELDS = (
+        'accession',
+        'ena_genome_accession', 'ena_sample_accession', 'ena_study_accession',
+        'ncbi_genome_accession', 'ncbi_sample_accession', 'ncbi_study_accession',
+        'img_genome_accession', 'patric_genome_accession',
+    )
+
+    def save(self, *args, **kwargs):
+        self.set_taxon_ranks()
+        super().save(*args, **kwargs)
+        AccessionAlias.objects.using(self._state.db).sync(Genome, [self.pk])
+
+    def delete(self, *args, **kwargs):
+        pk, db = self.pk, self._state.db
+        result = super().delete(*args, **kwargs)
+        AccessionAlias.objects.using(db).sync(Genome, [pk])
+        return result
+
     class Meta:
         db_table = 'GENOME'
 
@@ -2337,6 +2403,68 @@ class Search(models.Lookup):
         return 'MATCH (%s) AGAINST (%s IN BOOLEAN MODE)' % (lhs, rhs), params
 
 
+class AccessionAliasQuerySet(models.QuerySet):
+
+    def resolve(self, model, aliases):
+        """Look up accessions of `model` in the alias table.
+        :return: (set of primary keys, set of the aliases that were found)
+        """
+        pks, found = set(), set()
+        rows = self.filter(entity_type=model._meta.model_name, alias__in=aliases) \
+            .values_list('alias', 'entity_id')
+        for alias, entity_id in rows:
+            pks.add(entity_id)
+            found.add(alias)
+        return pks, found
+
+    def entity_ids(self, model, aliases):
+        """Subquery of the primary keys of the `model` rows with any of the aliases,
+        so the lookup is part of the query of the rows.
+        """
+        return self.filter(entity_type=model._meta.model_name, alias__in=aliases).values('entity_id')
+
+    def sync(self, model, pks):
+        """(Re)build the aliases of the `model` rows with primary keys `pks`
+        from their ACCESSION_ALIAS_FIELDS; the aliases of the deleted rows are removed.
+        """
+        entity_type = model._meta.model_name
+        rows = model._base_manager.using(self.db) \
+            .filter(pk__in=pks) \
+            .values_list('pk', *model.ACCESSION_ALIAS_FIELDS)
+        aliases = set(
+            (alias, pk) for pk, *values in rows for alias in values if alias
+        )
+        with transaction.atomic(using=self.db):
+            self.filter(entity_type=entity_type, entity_id__in=pks).delete()
+            self.bulk_create([
+                self.model(alias=alias, entity_type=entity_type, entity_id=pk)
+                for alias, pk in aliases
+            ], batch_size=1000)
+
+
+class AccessionAlias(models.Model):
+    """Every accession an entity can be looked up by (ENA, NCBI, IMG...),
+    so the lookups are a single probe of the ALIAS index
+    rather than an OR over the accession columns of the entity table.
+    Filled by migration 0024, then kept up to date by the save() and delete() of the entities,
+    by import_genomes and by remove_genomes_catalogue. Any other write of the ACCESSION_ALIAS_FIELDS
+    (queryset update(), bulk_create(), bulk_update(), delete(), or other clients of the database)
+    must call AccessionAlias.objects.sync() for the rows it changed: the lookups only use this table.
+    """
+    alias = models.CharField(db_column='ALIAS', max_length=40)
+    entity_type = models.CharField(db_column='ENTITY_TYPE', max_length=20)
+    entity_id = models.IntegerField(db_column='ENTITY_ID')
+
+    objects = AccessionAliasQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'ACCESSION_ALIAS'
+        unique_together = (('alias', 'entity_type', 'entity_id'),)
+
+    def __str__(self):
+        return f"{self.alias} -> {self.entity_type}:{self.entity_id}"
+
+
 class LegacyAssembly(models.Model):
     """Assemblies that were re-uploaded and got new ERZ accessions.
     This table has the mapping between the old accessions and the new ones.
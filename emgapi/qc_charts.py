@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+QC statistics charts of the analyses (qc-statistics/*.out files).
+
+The file of a chart is looked up once (.out, .out.full or .out.sub-set) and its path cached;
+the parsed file is cached by path and mtime, so a request only stats the file.
+Both are kept in the default cache backend for QC_CHART_CACHE_TIMEOUT seconds,
+so a file with a preferred suffix written later is found after that at most.
+"""
+
+import logging
+import math
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# chart -> (file name, column names of the files without a header)
+CHARTS = {
+    'gc-distribution': ('GC-distribution', ('gc', 'count')),
+    'nucleotide-distribution': ('nucleotide-distribution', None),
+    'seq-length': ('seq-length', ('length', 'count')),
+    'summary': ('summary', None),
+}
+# charts that can be downsampled, as (position, count) histograms
+HISTOGRAMS = ('gc-distribution', 'seq-length')
+
+FILE_SUFFIXES = ('.out', '.out.full', '.out.sub-set')
+
+
+def _number(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+def find_chart_file(result_directory, chart):
+    """Path of the file of a chart, None if there is none"""
+    name = CHARTS[chart][0]
+    for suffix in FILE_SUFFIXES:
+        path = os.path.abspath(os.path.join(
+            settings.RESULTS_DIR, result_directory, 'qc-statistics', name + suffix))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def parse_chart(text, chart):
+    """Parse a chart file.
+    The summary is a dict of statistic -> value,
+    the other charts are dicts of column -> list of values.
+    """
+    rows = [line.split('\t') for line in text.splitlines() if line.strip()]
+    if chart == 'summary':
+        return dict((row[0], _number(row[1])) for row in rows if len(row) > 1)
+    columns = CHARTS[chart][1]
+    if rows and (columns is None or not isinstance(_number(rows[0][0]), (int, float))):
+        columns, rows = rows[0], rows[1:]
+    if columns is None:
+        # empty file without a header
+        return {}
+    data = dict((column, []) for column in columns)
+    for row in rows:
+        for column, value in zip(columns, row):
+            data[column].append(_number(value))
+    return data
+
+
+def downsample(data, bins):
+    """Merge the rows of a (position, count) histogram into at most `bins` bins,
+    each bin keeping the position of its first row and the sum of the counts.
+    """
+    position, count = list(data)
+    size = len(data[position])
+    if bins >= size:
+        return data
+    step = math.ceil(size / bins)
+    return {
+        position: data[position][::step],
+        count: [sum(data[count][i:i + step]) for i in range(0, size, step)],
+    }
+
+
+def _read_chart(path, chart):
+    with open(path, 'r') as f:
+        return parse_chart(f.read(), chart)
+
+
+def get_chart_path(job, chart):
+    """Path of the file of a chart of an analysis, from the cache if it still exists.
+    :return: (path, mtime) or (None, None) if the analysis has no such chart
+    """
+    key = 'qc-chart-path:{}:{}'.format(job.pk, chart)
+    path = cache.get(key)
+    if path:
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            pass
+    path = find_chart_file(job.result_directory, chart)
+    if path is None:
+        return None, None
+    cache.set(key, path, settings.QC_CHART_CACHE_TIMEOUT)
+    return path, os.stat(path).st_mtime_ns
+
+
+def get_chart(job, chart):
+    """The parsed chart of an analysis, None if the analysis has no such chart"""
+    path, mtime = get_chart_path(job, chart)
+    if path is None:
+        return None
+    key = 'qc-chart:{}:{}:{}:{}'.format(job.pk, chart, os.path.basename(path), mtime)
+    data = cache.get(key)
+    if data is None:
+        logger.info("Path %r" % path)
+        data = _read_chart(path, chart)
+        cache.set(key, data, settings.QC_CHART_CACHE_TIMEOUT)
+    return data
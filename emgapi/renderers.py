@@ -15,6 +15,9 @@
 # limitations under the License.
 import csv
 
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 from django.utils import encoding
 from rest_framework import renderers
 from rest_framework_csv.renderers import CSVRenderer, CSVStreamingRenderer as BaseCSVStreamingRenderer
@@ -140,11 +143,22 @@ class CSVStreamingRenderer(BaseCSVStreamingRenderer):
     writer_opts = {'quoting': csv.QUOTE_NONNUMERIC}
 
     def render(self, data, *args, **kwargs):
-        if not isinstance(data, list):
+        if isinstance(data, dict):
             if self.results_field in data:
                 data = data.get(self.results_field, [])
         return super(CSVStreamingRenderer, self).render(data, *args, **kwargs)
 
+    def render_rows(self, rows):
+        """
+        Render the rows yielded by each call of `rows`, without keeping them in memory.
+        The base renderer materialises the rows to build the header (the flattened keys of all the rows),
+        instead a first pass over the rows builds the header and a second one writes them.
+        """
+        header = set()
+        for item in rows():
+            header.update(self.flatten_item(item).keys())
+        yield from self.render(rows(), renderer_context={'header': sorted(header) or None})
+
     def flatten_item(self, item):
         flat_item = super(CSVStreamingRenderer, self).flatten_item(item)
         for k, v in flat_item.items():
@@ -162,3 +176,76 @@ class TSVRenderer(CSVRenderer):
         if type(data) == str:
             return data.encode(self.charset)
         return ''
+
+
+class ArrowSink(object):
+    """
+    Write-only file object that keeps what pyarrow writes until it is drained,
+    so that a file can be streamed while it is being written.
+    """
+    def __init__(self):
+        self.closed = False
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BaseArrowStreamingRenderer(renderers.BaseRenderer):
+    """
+    Renders an iterable of pyarrow RecordBatches into a generator of bytes,
+    to be used with Django StreamingHttpResponse.
+    The schema must be passed in the renderer_context.
+    """
+    charset = None
+    render_style = 'binary'
+
+    def open_writer(self, sink, schema):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        sink = ArrowSink()
+        writer = self.open_writer(pa.PythonFile(sink, mode='w'), renderer_context['schema'])
+        for batch in data:
+            writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+
+class ParquetRenderer(BaseArrowStreamingRenderer):
+    """Every batch is written as a Parquet row group.
+    """
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    def open_writer(self, sink, schema):
+        return pq.ParquetWriter(sink, schema)
+
+
+class ArrowStreamRenderer(BaseArrowStreamingRenderer):
+    """Arrow IPC streaming format.
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    def open_writer(self, sink, schema):
+        return pa.ipc.new_stream(sink, schema)
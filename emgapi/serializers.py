@@ -1693,7 +1693,7 @@ class GenomeSerializer(ExplicitFieldsModelSerializer):
                    'kegg_modules',
                    'genome_set',
                    'pangenome_geographic_range',
-                   'geo_origin')
+                   'geo_origin') + tuple(emg_models.Genome.TAXON_RANKS.values())
 
 
 class GenomeDownloadSerializer(BaseDownloadSerializer):
@@ -21,43 +21,42 @@ from django.conf import settings
 from django.db.models import Q
 from django.http import HttpResponse, FileResponse
 
+from emgapi import models as emg_models
+
 logger = logging.getLogger(__name__)
 
 
-def study_accession_query(accession):
+def _study_accession_query(accession, prefix=''):
+    """Query for a study by MGYS, ENA or project accession, on the
+    study relation `prefix` (e.g. 'study__').
+    ENA and project accessions are looked up in the accession alias table.
+    """
     query = list()
     try:
-        query.append(Q(pk=int(accession.lstrip('MGYS'))))
+        query.append(Q(**{prefix + 'pk': int(accession.lstrip('MGYS'))}))
     except ValueError:
-        query.append(
-            Q(secondary_accession=accession) |
-            Q(project_id=accession)
-        )
+        query.append(Q(**{prefix + 'pk__in': emg_models.AccessionAlias.objects.entity_ids(
+            emg_models.Study, [accession])}))
     return query
 
 
+def study_accession_query(accession):
+    return _study_accession_query(accession)
+
+
 def sample_study_accession_query(accession):
-    query = list()
-    try:
-        query.append(Q(studies__pk=int(accession.lstrip('MGYS'))))
-    except ValueError:
-        query.append(
-            Q(studies__secondary_accession=accession) |
-            Q(studies__project_id=accession)
-        )
-    return query
+    return _study_accession_query(accession, 'studies__')
 
 
 def related_study_accession_query(accession):
-    query = list()
-    try:
-        query.append(Q(study__pk=int(accession.lstrip('MGYS'))))
-    except ValueError:
-        query.append(
-            Q(study__secondary_accession=accession) |
-            Q(study__project_id=accession)
-        )
-    return query
+    return _study_accession_query(accession, 'study__')
+
+
+def genome_accession_query(accessions):
+    """Query for the genomes with any of the accessions (MGnify, ENA, NCBI, IMG or PATRIC).
+    The accessions are looked up in the accession alias table.
+    """
+    return Q(pk__in=emg_models.AccessionAlias.objects.entity_ids(emg_models.Genome, set(accessions)))
 
 
 def analysisjob_accession_query(accession):
@@ -69,6 +68,40 @@ def analysisjob_accession_query(accession):
     return query
 
 
+def queryset_iterator(queryset, chunk_size):
+    """Iterate over a queryset without loading all of its rows at once.
+
+    Django querysets are read with .iterator(), unless they use prefetch_related
+    (which .iterator() ignores), in which case they are evaluated one slice
+    at a time so that every chunk still gets its related objects prefetched.
+    The slices keep the ordering of the queryset, with the pk as a tiebreaker
+    so that no row is skipped or repeated between two slices.
+    Mongoengine querysets are read from an uncached cursor in batches.
+
+    :param queryset: Django or mongoengine queryset, or a list
+    :param chunk_size: number of rows fetched from the database at a time
+    """
+    if isinstance(queryset, list):
+        yield from queryset
+    elif hasattr(queryset, '_document'):
+        if hasattr(queryset, 'no_cache'):
+            queryset = queryset.no_cache()
+        yield from queryset.batch_size(chunk_size)
+    elif getattr(queryset, '_prefetch_related_lookups', None):
+        ordering = list(queryset.query.order_by or queryset.query.get_meta().ordering)
+        if not {'pk', '-pk'} & set(ordering):
+            queryset = queryset.order_by(*ordering, 'pk')
+        start = 0
+        while True:
+            chunk = list(queryset[start:start + chunk_size])
+            yield from chunk
+            if len(chunk) < chunk_size:
+                break
+            start += chunk_size
+    else:
+        yield from queryset.iterator(chunk_size=chunk_size)
+
+
 def assembly_contig_name(line):
     """Parses Mgnify (ENA) assembly contigs names and returns the contig name with no metadata.
     Example:
@@ -103,27 +136,113 @@ def parse_ebi_search_entry(entry, fields):
     return row
 
 
-def prepare_results_file_download_response(path_in_results, alias):
+BYTE_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_byte_range(range_header, size):
+    """Parse a single range Range header, e.g. bytes=0-99, bytes=100- or bytes=-100
+    (https://www.rfc-editor.org/rfc/rfc9110#name-range).
+    Malformed or multiple ranges are ignored, as the RFC allows,
+    so the whole content is returned.
+
+    :param range_header: value of the Range header or None
+    :param size: size of the content in bytes
+    :return: (first, last) bytes of the range, half-open, or None to return the whole content
+    :raises ValueError: if the range is not satisfiable
+    """
+    match = BYTE_RANGE_PATTERN.match((range_header or '').strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # suffix range: the last N bytes
+        first, last = max(size - int(last), 0), size
+    else:
+        first = int(first)
+        if last != '' and int(last) < first:
+            return None
+        last = size if last == '' else min(int(last) + 1, size)
+    if first >= size:
+        raise ValueError('Range not satisfiable')
+    return first, last
+
+
+class FileRange(object):
+    """File object reading only the bytes [first, last) of a file.
+    The file is positioned at `first` and fileno() is kept, so WSGI servers that
+    use sendfile (wsgi.file_wrapper) send Content-Length bytes from there.
+    """
+
+    def __init__(self, file, first, last):
+        file.seek(first)
+        self.file = file
+        self.remaining = last - first
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def results_file_response(path, alias, request=None):
+    """Stream a file as a binary attachment, honouring the Range header of the request.
+
+    :param path: absolute path of the file
+    :param alias: filename alias for response
+    :param request: the request, for the Range header
+    :return: FileResponse (206 for a range), or 416 if the range is not satisfiable
+    """
+    size = os.path.getsize(path)
+    range_header = request.META.get('HTTP_RANGE') if request is not None else None
+    try:
+        byte_range = parse_byte_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{0}'.format(size)
+        return response
+
+    file = open(path, 'rb')
+    if byte_range:
+        first, last = byte_range
+        response = FileResponse(FileRange(file, first, last), status=206, as_attachment=True,
+                                filename=alias, content_type='application/octet-stream')
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(first, last - 1, size)
+        response['Content-Length'] = last - first
+    else:
+        response = FileResponse(file, as_attachment=True,
+                                filename=alias, content_type='application/octet-stream')
+        response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def prepare_results_file_download_response(path_in_results, alias, request=None):
     """Create a response with NGINX redirect header set,
-    or attach content if DOWNLOADS_BYPASS_NGINX is set.
+    or stream the file if DOWNLOADS_BYPASS_NGINX is set.
 
     :param path_in_results: file path relative to RESULTS_DIR
     :param alias: filename alias for response
+    :param request: the request, for the Range header when DOWNLOADS_BYPASS_NGINX is set
     :return: Http Response
     """
-    response = HttpResponse()
-    response['Content-Type'] = 'application/octet-stream'
-    response['Content-Disposition'] = \
-        'attachment; filename={0}'.format(alias)
-
     # Workaround for non-nginx hosts, like running locally in docker
     if settings.DOWNLOADS_BYPASS_NGINX:
         logger.warning('DOWNLOADS_BYPASS_NGINX is true, so serving download directly as Django response '
                        '(not via NGINX redirect)')
-        if str(path_in_results).endswith('zip'):
-            return FileResponse(open(os.path.join(settings.RESULTS_DIR, path_in_results.lstrip('/')), 'rb'))
-        with open(os.path.join(settings.RESULTS_DIR, path_in_results.lstrip('/')), 'r') as file:
-            response.content = file.read()
-    else:
-        response['X-Accel-Redirect'] = '/results/{0}'.format(path_in_results.lstrip('/'))
+        return results_file_response(
+            os.path.join(settings.RESULTS_DIR, path_in_results.lstrip('/')), alias, request)
+
+    response = HttpResponse()
+    response['Content-Type'] = 'application/octet-stream'
+    response['Content-Disposition'] = \
+        'attachment; filename={0}'.format(alias)
+    response['X-Accel-Redirect'] = '/results/{0}'.format(path_in_results.lstrip('/'))
     return response
@@ -53,6 +53,10 @@ from . import permissions as emg_perms
 from . import viewsets as emg_viewsets
 from . import utils as emg_utils
 from . import renderers as emg_renderers
+from . import bundles as emg_bundles
+from . import columnar as emg_columnar
+from . import qc_charts as emg_qc_charts
+from . import krona as emg_krona
 from . import filters as emg_filters
 from . import third_party_metadata
 from .sourmash import validate_sourmash_signature, save_signature, send_sourmash_jobs, get_sourmash_job_status, \
@@ -311,10 +315,12 @@ class BiomeViewSet(mixins.RetrieveModelMixin,
 
 
 class StudyViewSet(mixins.RetrieveModelMixin,
+                   emg_mixins.ColumnarExportMixin,
                    emg_mixins.ListModelMixin,
                    emg_viewsets.BaseStudyGenericViewSet):
     lookup_field = 'accession'
     lookup_value_regex = '[^/]+'
+    export_columns = emg_columnar.STUDY_EXPORT_COLUMNS
 
     def get_queryset(self):
         queryset = emg_models.Study.objects.available(self.request)
@@ -474,6 +480,37 @@ class StudiesDownloadsViewSet(emg_mixins.ListModelMixin,
         return super(StudiesDownloadsViewSet, self) \
             .list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'], url_path='bundle')
+    def bundle(self, request, accession, *args, **kwargs):
+        """
+        Retrieves the static summary files of the study as a single zip or tar archive,
+        with a manifest.tsv listing their checksums.
+        The files can be selected with the group (download group types) and pipeline (versions) params,
+        analyses=true adds the files of the analyses of the study.
+        The archive format is selected with archive=zip (default) or archive=tar.
+        Example:
+        ---
+        `/studies/ERP009004/downloads/bundle?group=Taxonomic analysis&pipeline=4.1`
+        `/studies/ERP009004/downloads/bundle?analyses=true&archive=tar`
+        """
+        study = get_object_or_404(
+            emg_models.Study.objects.available(request),
+            *emg_utils.study_accession_query(accession)
+        )
+        downloads = [
+            (download.pipeline.release_version if download.pipeline else '', study.result_directory, download)
+            for download in emg_bundles.filter_downloads(request, self.get_queryset())
+        ]
+        if request.GET.get('analyses', '').lower() in ('true', '1'):
+            analysis_downloads = emg_models.AnalysisJobDownload.objects.available(request) \
+                .filter(job__study=study) \
+                .order_by('job_id', 'pipeline', 'group_type', 'alias')
+            downloads += [
+                (download.job.accession, download.job.result_directory, download)
+                for download in emg_bundles.filter_downloads(request, analysis_downloads)
+            ]
+        return emg_bundles.bundle_response(request, study.accession, downloads)
+
 
 class SuperStudyViewSet(mixins.RetrieveModelMixin,
                         emg_mixins.ListModelMixin,
@@ -559,10 +596,13 @@ class SuperStudyViewSet(mixins.RetrieveModelMixin,
 
 
 class SampleViewSet(mixins.RetrieveModelMixin,
+                    emg_mixins.ColumnarExportMixin,
                     emg_mixins.ListModelMixin,
                     emg_viewsets.BaseSampleGenericViewSet):
     lookup_field = 'accession'
     lookup_value_regex = '[^/]+'
+    export_columns = emg_columnar.SAMPLE_EXPORT_COLUMNS
+    export_sample_metadata = True
     pagination_class = FasterCountPagination
 
     def get_queryset(self):
@@ -825,7 +865,7 @@ class AssemblyExtraAnnotationViewSet(
             file_path = f'{obj.subdir}/{obj.realname}'
         else:
             file_path = obj.realname
-        return emg_utils.prepare_results_file_download_response(file_path, alias)
+        return emg_utils.prepare_results_file_download_response(file_path, alias, request)
 
 class RunExtraAnnotationViewSet(
         emg_mixins.ListModelMixin,
@@ -879,14 +919,16 @@ class RunExtraAnnotationViewSet(
                 file_path = f'{obj.subdir}/{obj.realname}'
             else:
                 file_path = obj.realname
-            return emg_utils.prepare_results_file_download_response(file_path, alias)
+            return emg_utils.prepare_results_file_download_response(file_path, alias, request)
 
 
 class AnalysisJobViewSet(mixins.RetrieveModelMixin,
+                         emg_mixins.ColumnarExportMixin,
                          emg_mixins.ListModelMixin,
                          emg_viewsets.BaseAnalysisGenericViewSet):
     lookup_field = 'accession'
     lookup_value_regex = '[^/]+'
+    export_columns = emg_columnar.ANALYSIS_EXPORT_COLUMNS
 
     def get_serializer_class(self):
         f = self.request.GET.get('format', None)
@@ -933,7 +975,7 @@ class AnalysisQCChartViewSet(mixins.RetrieveModelMixin,
 
     schema = None
 
-    renderer_classes = (emg_renderers.TSVRenderer,)
+    renderer_classes = (emg_renderers.TSVRenderer, renderers.JSONRenderer)
 
     lookup_field = 'chart'
     lookup_value_regex = (
@@ -954,39 +996,38 @@ class AnalysisQCChartViewSet(mixins.RetrieveModelMixin,
             raise Http404()
         return get_object_or_404(self.get_queryset(), Q(pk=pk))
 
-    def _build_path(self, name):
-        return os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            self.get_object().result_directory,
-            'qc-statistics', name))
-
     def retrieve(self, request, chart=None, *args, **kwargs):
         """
-        Retrieves QC data given accession
+        Retrieves QC data given accession, as the TSV file of the pipeline
+        or, with format=json, parsed: the summary as an object, the other charts
+        as arrays of values by column.
+        gc-distribution and seq-length can be downsampled to at most N bins with bins=N.
         Example:
         ---
         `/analyses/MGYA00102827/gc-distribution`
+        `/analyses/MGYA00102827/seq-length?format=json&bins=100`
         """
-        mapping = {
-            "gc-distribution": "GC-distribution",
-            "nucleotide-distribution": "nucleotide-distribution",
-            "seq-length": "seq-length",
-            "summary": "summary",
-        }
-
-        filepath = self._build_path(
-            "{name}.out".format(name=mapping[chart]))
-        if not os.path.isfile(filepath):
-            filepath = self._build_path(
-                "{name}.out.full".format(name=mapping[chart]))
-            if not os.path.isfile(filepath):
-                filepath = self._build_path(
-                    "{name}.out.sub-set".format(name=mapping[chart]))
-        if os.path.isfile(filepath):
-            logger.info("Path %r" % filepath)
-            with open(filepath, "r") as f:
+        obj = self.get_object()
+        if request.accepted_renderer.format == 'tsv':
+            path, _ = emg_qc_charts.get_chart_path(obj, chart)
+            if path is None:
+                raise Http404()
+            with open(path, "r") as f:
                 return Response(f.read())
-        raise Http404()
+
+        data = emg_qc_charts.get_chart(obj, chart)
+        if data is None:
+            raise Http404()
+        bins = request.GET.get('bins')
+        if bins and chart in emg_qc_charts.HISTOGRAMS:
+            try:
+                bins = int(bins)
+            except ValueError:
+                bins = 0
+            if bins < 1:
+                return Response({'bins': 'Must be a positive integer.'}, status=status.HTTP_400_BAD_REQUEST)
+            data = emg_qc_charts.downsample(data, bins)
+        return Response(data)
 
 
 class KronaViewSet(emg_mixins.ListModelMixin,
@@ -1004,12 +1045,17 @@ class KronaViewSet(emg_mixins.ListModelMixin,
         return emg_models.AnalysisJob.objects \
             .available(self.request)
 
-    def get_object(self):
+    def get_result_directory(self):
+        """Result directory of the analysis, without loading the whole AnalysisJob"""
         try:
             pk = int(self.kwargs['accession'].lstrip('MGYA'))
         except ValueError:
             raise Http404()
-        return get_object_or_404(self.get_queryset(), Q(pk=pk))
+        result_directory = self.get_queryset().filter(pk=pk) \
+            .values_list('result_directory', flat=True).first()
+        if result_directory is None:
+            raise Http404()
+        return result_directory
 
     def get_serializer_class(self):
         return super(KronaViewSet, self).get_serializer_class()
@@ -1022,19 +1068,13 @@ class KronaViewSet(emg_mixins.ListModelMixin,
         ---
         `/analyses/MGYA00102827/krona`
         """
-        obj = self.get_object()
         # FIXME: Introduce sub directory structure in the taxonomy folder for new ITS results
         # e.g. taxonomy/{lsu|ssu|its}/
-        krona = os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            obj.result_directory,
-            'taxonomy-summary',
-            'krona.html')
-        )
-        if os.path.isfile(krona):
-            with open(krona, "r") as k:
-                return Response(k.read())
-        raise Http404('No krona chart.')
+        krona = emg_krona.krona_path(self.get_result_directory())
+        response = emg_krona.krona_response(request, krona)
+        if response is None:
+            raise Http404('No krona chart.')
+        return response
 
     @xframe_options_exempt
     def retrieve(self, request, subdir=None, **kwargs):
@@ -1044,22 +1084,11 @@ class KronaViewSet(emg_mixins.ListModelMixin,
         ---
         `/runs/GCA_900216095/pipelines/4.0/krona/lsu`
         """
-        obj = self.get_object()
-        base_path = os.path.join(settings.RESULTS_DIR, obj.result_directory, 'taxonomy-summary')
-        if subdir in ['unite', 'itsonedb']:
-            path = os.path.join(base_path, 'its', subdir)
-        else:
-            path = os.path.join(base_path, subdir.upper())
-
-        if subdir == 'ssu' and not os.path.exists(path):
-            # Older pipelines (1, 2...?) have SSU-only Krona in un-nested directory.
-            path = base_path
-
-        krona = os.path.abspath(os.path.join(path, 'krona.html'))
-        if os.path.isfile(krona):
-            with open(krona, 'r') as k:
-                return Response(k.read())
-        raise Http404('No krona chart.')
+        krona = emg_krona.krona_path(self.get_result_directory(), subdir)
+        response = emg_krona.krona_response(request, krona)
+        if response is None:
+            raise Http404('No krona chart.')
+        return response
 
 
 class AnalysisResultDownloadsViewSet(emg_mixins.ListModelMixin,
@@ -1100,6 +1129,28 @@ class AnalysisResultDownloadsViewSet(emg_mixins.ListModelMixin,
         return super(AnalysisResultDownloadsViewSet, self) \
             .list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'], url_path='bundle')
+    def bundle(self, request, accession, *args, **kwargs):
+        """
+        Retrieves the static summary files of the analysis as a single zip or tar archive,
+        with a manifest.tsv listing their checksums.
+        The files can be selected with the group param (download group types).
+        The archive format is selected with archive=zip (default) or archive=tar.
+        Example:
+        ---
+        `/analyses/MGYA00102827/downloads/bundle?group=Functional analysis&archive=tar`
+        """
+        try:
+            pk = int(accession.lstrip('MGYA'))
+        except ValueError:
+            raise Http404()
+        job = get_object_or_404(emg_models.AnalysisJob.objects.available(request), pk=pk)
+        downloads = [
+            ('', job.result_directory, download)
+            for download in emg_bundles.filter_downloads(request, self.get_queryset())
+        ]
+        return emg_bundles.bundle_response(request, job.accession, downloads)
+
 
 class AnalysisResultDownloadViewSet(emg_mixins.MultipleFieldLookupMixin,
                                     mixins.RetrieveModelMixin,
@@ -1145,7 +1196,7 @@ class AnalysisResultDownloadViewSet(emg_mixins.MultipleFieldLookupMixin,
                 '{0}/{1}'.format(
                     obj.job.result_directory, obj.realname
                 )
-        return emg_utils.prepare_results_file_download_response(file_path, alias)
+        return emg_utils.prepare_results_file_download_response(file_path, alias, request)
 
 
 class PipelineViewSet(mixins.RetrieveModelMixin,
@@ -1629,7 +1680,7 @@ class GenomeDownloadViewSet(emg_mixins.ListModelMixin,
             file_path = '{0}/{1}'.format(
                 obj.genome.result_directory, obj.realname
             )
-        return emg_utils.prepare_results_file_download_response(file_path, alias)
+        return emg_utils.prepare_results_file_download_response(file_path, alias, request)
 
 
 class GenomeSetViewSet(mixins.RetrieveModelMixin,
@@ -1722,7 +1773,7 @@ class GenomeCatalogueDownloadViewSet(emg_mixins.ListModelMixin,
             file_path = '{0}/{1}'.format(
                 obj.genome_catalogue.result_directory, obj.realname
             )
-        return emg_utils.prepare_results_file_download_response(file_path, alias)
+        return emg_utils.prepare_results_file_download_response(file_path, alias, request)
 
 
 class CogCatViewSet(mixins.RetrieveModelMixin,
@@ -14,8 +14,10 @@
 # limitations under the License.
 
 import logging
+import os
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from django.db.models import Prefetch, Count, Q
 from django.shortcuts import get_object_or_404
 
@@ -23,6 +25,8 @@ from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import viewsets, mixins
 from rest_framework import filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 
 from . import models as emg_models
 from . import serializers as emg_serializers
@@ -30,6 +34,8 @@ from . import filters as emg_filters
 from . import viewsets as emg_viewsets
 from . import mixins as emg_mixins
 from . import utils as emg_utils
+from . import columnar as emg_columnar
+from . import renderers as emg_renderers
 
 logger = logging.getLogger(__name__)
 
@@ -260,7 +266,8 @@ class StudyPublicationRelationshipViewSet(emg_mixins.ListModelMixin,
             .list(request, *args, **kwargs)
 
 
-class StudiesDownloadViewSet(emg_mixins.MultipleFieldLookupMixin,
+class StudiesDownloadViewSet(emg_mixins.ColumnarErrorsMixin,
+                             emg_mixins.MultipleFieldLookupMixin,
                              mixins.RetrieveModelMixin,
                              viewsets.GenericViewSet):
     lookup_field = 'alias'
@@ -295,20 +302,67 @@ class StudiesDownloadViewSet(emg_mixins.MultipleFieldLookupMixin,
         ERP001736_taxonomy_abundances_v2.0.tsv`
         """
         obj = self.get_object()
-        response = HttpResponse()
-        response['Content-Type'] = 'application/octet-stream'
-        response["Content-Disposition"] = \
-            "attachment; filename={0}".format(alias)
         if obj.subdir is not None:
-            response['X-Accel-Redirect'] = \
-                "/results{0}/{1}/{2}".format(
-                    obj.study.result_directory, obj.subdir, obj.realname
-                )
+            file_path = "{0}/{1}/{2}".format(
+                obj.study.result_directory, obj.subdir, obj.realname
+            )
         else:
-            response['X-Accel-Redirect'] = \
-                "/results{0}/{1}".format(
-                    obj.study.result_directory, obj.realname
-                )
+            file_path = "{0}/{1}".format(
+                obj.study.result_directory, obj.realname
+            )
+        return emg_utils.prepare_results_file_download_response(file_path, alias, request)
+
+    @action(
+        detail=True,
+        methods=['get', ],
+        renderer_classes=(emg_renderers.ParquetRenderer, emg_renderers.ArrowStreamRenderer,
+                          emg_renderers.CSVStreamingRenderer),
+    )
+    def matrix(self, request, accession, release_version, alias, *args, **kwargs):
+        """
+        Retrieves a slice of a study summary matrix (abundances of terms per analysis),
+        without downloading the whole file.
+        Only available for the IPR, GO and taxonomy abundance files.
+        Example:
+        ---
+        `/studies/MGYS00000410/pipelines/5.0/file/
+        ERP001736_IPR_abundances_v5.0.tsv/matrix?format=arrow`
+
+        `/studies/MGYS00000410/pipelines/5.0/file/
+        ERP001736_IPR_abundances_v5.0.tsv/matrix?analyses=ERR1,ERR2&terms=IPR000001,IPR000002`
+        """
+        obj = self.get_object()
+        path = os.path.join(
+            settings.RESULTS_DIR, obj.study.result_directory.lstrip('/'),
+            str(obj.subdir) if obj.subdir is not None else '', obj.realname
+        )
+        path = emg_columnar.matrix_path(path)
+        if not os.path.isfile(path):
+            raise Http404('No matrix for {}.'.format(alias))
+
+        terms = request.query_params.get('terms')
+        analyses = request.query_params.get('analyses')
+        try:
+            table = emg_columnar.StudyMatrix(path).slice(
+                terms=terms.split(',') if terms else None,
+                analyses=analyses.split(',') if analyses else None,
+            )
+        except KeyError as e:
+            raise ValidationError({'analyses': 'Not in the matrix: {}'.format(e.args[0])})
+
+        renderer = request.accepted_renderer
+        batches = table.to_batches(max_chunksize=settings.EMG_COLUMNAR_EXPORT_BATCH_SIZE)
+        if renderer.format == 'csv':
+            data = (row for batch in batches for row in batch.to_pylist())
+        else:
+            data = batches
+        content = renderer.render(
+            data, renderer_context={'schema': table.schema, 'header': table.column_names}
+        )
+        response = StreamingHttpResponse(content, content_type=renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(
+            os.path.splitext(alias)[0], renderer.format
+        )
         return response
 
 
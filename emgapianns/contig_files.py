@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Open pysam handles of the contig files (bgzip FASTA and tabix GFF) of the assemblies.
+
+Opening a handle loads its index from the results NFS, so the handles are kept open
+in a per process LRU cache, keyed by the file paths and their mtimes
+(a file replaced on disk gets a new handle).
+Evicted handles are not closed, responses still streaming from them keep them alive
+until they are garbage collected.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pysam
+
+from django.conf import settings
+
+from emgapi import utils as emg_utils
+
+logger = logging.getLogger(__name__)
+
+# Bases read from the FASTA file at a time
+FASTA_CHUNK_SIZE = 64 * 1024
+
+
+class PysamHandleCache(object):
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.handles = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _mtimes(paths):
+        return tuple(os.stat(path).st_mtime_ns for path in paths if path)
+
+    def get(self, opener, *paths):
+        """The cached handle opened with opener(*paths), opening it if
+        it's not cached or any of the files changed since it was opened.
+        :return: (handle, lock to hold while reading from the handle)
+        """
+        key = (opener, paths)
+        mtimes = self._mtimes(paths)
+        with self.lock:
+            cached = self.handles.get(key)
+            if cached and cached[0] == mtimes:
+                self.handles.move_to_end(key)
+                return cached[1], cached[2]
+        handle = opener(*paths)
+        with self.lock:
+            self.handles[key] = (mtimes, handle, threading.Lock())
+            self.handles.move_to_end(key)
+            while len(self.handles) > self.maxsize:
+                self.handles.popitem(last=False)
+            return handle, self.handles[key][2]
+
+    def clear(self):
+        with self.lock:
+            self.handles.clear()
+
+
+handle_cache = PysamHandleCache(settings.CONTIG_FILE_CACHE_SIZE)
+
+
+def _open_fasta(fasta_path, fasta_idx_path, fasta_idx_gzi_path):
+    return pysam.FastaFile(filename=fasta_path,
+                           filepath_index=fasta_idx_path,
+                           filepath_index_compressed=fasta_idx_gzi_path)
+
+
+def _open_tabix(gff_path, gff_idx_path):
+    return pysam.TabixFile(filename=gff_path, index=gff_idx_path)
+
+
+def fasta_file(fasta_path, fasta_idx_path, fasta_idx_gzi_path):
+    return handle_cache.get(_open_fasta, fasta_path, fasta_idx_path, fasta_idx_gzi_path)
+
+
+def tabix_file(gff_path, gff_idx_path):
+    return handle_cache.get(_open_tabix, gff_path, gff_idx_path)
+
+
+class ContigFasta(object):
+    """The FASTA record of a contig, or of the region [start, end) of it
+    (0-based, half-open like pysam), read from the file in chunks
+    of FASTA_CHUNK_SIZE bases as it is iterated.
+    The header of a region is >contig:start-end, with samtools 1-based coordinates.
+    :raises KeyError: if the contig is not in the FASTA file
+    """
+
+    def __init__(self, fasta, lock, contig, start=None, end=None):
+        self.fasta = fasta
+        self.lock = lock
+        self.contig = contig
+        with lock:
+            length = fasta.get_reference_length(contig)
+        self.start = min(start or 0, length)
+        self.end = length if end is None else max(min(end, length), self.start)
+        name = emg_utils.assembly_contig_name(contig)
+        if start is not None or end is not None:
+            name += ':{}-{}'.format(self.start + 1, self.end)
+        self.header = '>' + name + '\n'
+
+    def __len__(self):
+        """Size of the record in bytes"""
+        return len(self.header.encode()) + self.end - self.start
+
+    def __iter__(self):
+        return self.read(0, len(self))
+
+    def read(self, first, last):
+        """The bytes [first, last) of the record, as text (headers and sequences are ASCII)"""
+        header = self.header[first:last]
+        if header:
+            yield header
+        seq_start = self.start + max(first - len(self.header), 0)
+        seq_end = min(self.start + max(last - len(self.header), 0), self.end)
+        for chunk_start in range(seq_start, seq_end, FASTA_CHUNK_SIZE):
+            with self.lock:
+                chunk = self.fasta.fetch(self.contig, chunk_start, min(chunk_start + FASTA_CHUNK_SIZE, seq_end))
+            yield chunk
+
+
+def contig_gff(gff, lock, contig, start=None, end=None):
+    """The GFF rows of a contig, or the ones overlapping the region [start, end) of it.
+    The rows are read with their own iterator (multiple_iterators=True), so the
+    cached handle can be used by several responses at the same time.
+    :raises ValueError: if the contig is not in the GFF index
+    """
+    with lock:
+        rows = gff.fetch(contig, start, end, multiple_iterators=True)
+    return (emg_utils.assembly_contig_name(row) + '\n' for row in rows)
+
+
+def fasta_records(fasta, lock, contigs):
+    """The FASTA records of the contigs that are in the FASTA file,
+    in the order of the file so it's read with as few seeks as possible.
+    """
+    contigs = set(contigs)
+    with lock:
+        references = [reference for reference in fasta.references if reference in contigs]
+    return [ContigFasta(fasta, lock, reference) for reference in references]
+
+
+def multi_fasta(records):
+    """The records of a multi-FASTA file, one line per sequence"""
+    for record in records:
+        yield from record
+        yield '\n'
+
+
+def gff_rows(gff, lock, contigs):
+    """The GFF rows of the contigs that are in the GFF index, in the order of the file.
+    The rows of each contig are read with the shared iterator of the handle
+    and the next contig is only read once they are consumed.
+    """
+    contigs = set(contigs)
+    with lock:
+        references = [reference for reference in gff.contigs if reference in contigs]
+    for reference in references:
+        with lock:
+            rows = list(gff.fetch(reference))
+        for row in rows:
+            yield emg_utils.assembly_contig_name(row) + '\n'
@@ -52,6 +52,14 @@ class Command(BaseCommand):
                             help='Target emg_db_name alias',
                             choices=['default', 'dev', 'prod'],
                             default='default')
+        parser.add_argument('--workers',
+                            help='Number of processes used to parse the result files of the analyses',
+                            type=int,
+                            default=1)
+        parser.add_argument('--no-cache',
+                            help='Parse the result files of every analysis, '
+                                 'rather than reusing the cached counts of unchanged analyses',
+                            action='store_true')
         parser.set_defaults(no_study_summary=False)
 
     def handle(self, *args, **options):
@@ -71,5 +79,6 @@ class Command(BaseCommand):
             raise ValueError(f"rootpath {rootpath} is not a directory")
         
         gen = StudySummaryGenerator(accession=study_accession, pipeline=pipeline, rootpath=rootpath,
-                                    database=database)
+                                    database=database, workers=options['workers'],
+                                    use_cache=not options['no_cache'])
         gen.run()
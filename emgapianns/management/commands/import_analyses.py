@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import mongoengine
+from django.core.management import BaseCommand, CommandError, call_command
+from django.conf import settings
+from django.db import connections
+
+from emgapianns.management.commands import import_analysis
+from emgapianns.management.lib.batch_import import read_accessions, ImportReport, IMPORTED
+from emgapianns.management.lib.import_analysis_model import Run
+
+logger = logging.getLogger(__name__)
+
+"""
+    Cl call:
+        emgcli import_analyses --accessions-file backlog.tsv --pipeline 5.0 --workers 8 --report report.tsv
+        emgcli import_analyses ERR1234 ERR1235 --biome 'root:Environmental:Aquatic:Marine' --library_strategy WGS
+"""
+
+
+def connect_mongodb():
+    """Connect the worker process to MongoDB: pymongo clients can't be shared with forked processes.
+    """
+    mongoengine.connect(**settings.MONGO_CONF)
+
+
+def populate_mongodb(accession, rootpath, version, experiment_type):
+    """Load the annotations of one analysis into MongoDB. Runs on the worker processes.
+    """
+    importer = import_analysis.Command()
+    importer.accession = accession
+    importer.rootpath = rootpath
+    importer.version = version
+    importer.populate_mongodb(experiment_type)
+
+
+class Command(BaseCommand):
+    help = 'Imports a batch of run and assembly analyses, like import_analysis does for a single one. ' \
+           'The ENA metadata is fetched concurrently, studies, samples and runs shared by several analyses ' \
+           'are only imported once and MongoDB is populated on a pool of worker processes. ' \
+           'A tab separated status report with one row per accession is written at the end.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('accessions', nargs='*', help="Run or assembly accessions.")
+        parser.add_argument('--accessions-file', dest='accessions_file',
+                            help='File with one accession per line, optionally followed by '
+                                 'the biome and library strategy (tab separated)')
+        parser.add_argument('--biome', help='Lineage of GOLD biome, for the accessions without one')
+        parser.add_argument('--library_strategy',
+                            help='Library strategy, for the accessions without one',
+                            choices=['AMPLICON', 'WGS', 'ASSEMBLY', 'RNA-Seq', 'WGA'])
+        parser.add_argument('--rootpath',
+                            help="NFS production root path of the results archive.",
+                            default=settings.RESULTS_PRODUCTION_DIR)
+        parser.add_argument('--pipeline', help='Pipeline version',
+                            choices=['4.1', '5.0'], default='5.0')
+        parser.add_argument('--database',
+                            help='Target emg_db_name alias',
+                            choices=['default', 'dev', 'prod'],
+                            default='default')
+        parser.add_argument('--result_status', help='Override result status rather than connecting to backlog',
+                            default=None)
+        parser.add_argument('--force-study-summary', dest='force_study_summary', action='store_true', default=False)
+        parser.add_argument('--ena-workers', dest='ena_workers', type=int, default=8,
+                            help='Number of concurrent ENA metadata requests')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Number of processes used to populate MongoDB')
+        parser.add_argument('--report', help='Write the status report to this file rather than stdout')
+
+    def handle(self, *args, **options):
+        import_analysis.setup_logging(options)
+        logger.info("CLI %r" % options)
+
+        if not options['rootpath']:
+            raise ValueError("rootpath (RESULTS_PRODUCTION_DIR setting) cannot by empty)")
+
+        lines = list(options['accessions'])
+        if options['accessions_file']:
+            with open(options['accessions_file']) as f:
+                lines += f.readlines()
+        try:
+            entries = read_accessions(lines, biome=options['biome'], library_strategy=options['library_strategy'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not entries:
+            raise CommandError('No accessions to import')
+
+        self.options = options
+        self.report = ImportReport([entry.accession for entry in entries])
+        self.importers = dict((entry.accession, self.get_importer(entry)) for entry in entries)
+
+        metadata = self.prefetch_metadata()
+        self.prepare(metadata)
+        self.import_dependencies(metadata)
+        self.import_analyses(metadata)
+        self.populate_mongodb(metadata)
+        if options['force_study_summary']:
+            self.generate_study_summaries(metadata)
+
+        self.write_report()
+        failed = self.report.failed()
+        logger.info('Imported {} of {} analyses.'.format(len(entries) - len(failed), len(entries)))
+        if failed:
+            raise CommandError('The import of {} accessions failed: {}'.format(len(failed), ', '.join(failed)))
+
+    def get_importer(self, entry):
+        importer = import_analysis.Command()
+        importer.configure(
+            accession=entry.accession,
+            biome=entry.biome,
+            library_strategy=entry.library_strategy,
+            version=self.options['pipeline'],
+            rootpath=self.options['rootpath'],
+            emg_db=self.options['database'],
+            result_status=self.options['result_status'],
+        )
+        return importer
+
+    def run_stage(self, stage, accessions, func):
+        """Run func for each pending accession, recording the failures under `stage`.
+        import_analysis exits on some errors, so SystemExit is caught as well.
+        """
+        for accession in accessions:
+            if not self.report.is_pending(accession):
+                continue
+            try:
+                func(accession)
+            except (Exception, SystemExit) as e:
+                self.report.fail(accession, stage, e)
+
+    def prefetch_metadata(self):
+        """Fetch the ENA metadata of all accessions concurrently.
+        :return: dict of accession to Run or Assembly
+        """
+        logger.info('Retrieving metadata of {} accessions...'.format(len(self.importers)))
+        metadata = {}
+        with ThreadPoolExecutor(max_workers=self.options['ena_workers']) as executor:
+            futures = dict(
+                (executor.submit(import_analysis.fetch_metadata, accession, importer.library_strategy), accession)
+                for accession, importer in self.importers.items()
+            )
+            for future in as_completed(futures):
+                accession = futures[future]
+                try:
+                    metadata[accession] = future.result()
+                except Exception as e:
+                    self.report.fail(accession, 'metadata', e)
+                    continue
+                self.report.set_study(accession, metadata[accession].secondary_study_accession)
+        return metadata
+
+    def prepare(self, metadata):
+        logger.info('Finding result directories and running the sanity checks...')
+        self.run_stage('sanity_check', list(metadata),
+                       lambda accession: self.importers[accession].prepare(metadata[accession]))
+
+    def import_dependencies(self, metadata):
+        """Import every study, sample and run/assembly once, no matter how many analyses share it.
+        When it fails, all the analyses sharing it fail.
+        """
+        for stage, key, method in (
+                ('study', lambda m: m.secondary_study_accession, 'import_study'),
+                ('sample', lambda m: m.sample_accession, 'import_sample'),
+                ('run', lambda m: m.run_accession if isinstance(m, Run) else m.analysis_accession,
+                 'import_run_or_assembly'),
+        ):
+            groups = {}
+            for accession in self.report.pending():
+                groups.setdefault(key(metadata[accession]), []).append(accession)
+            logger.info('Importing {} {} objects...'.format(len(groups), stage))
+            for dependency, accessions in groups.items():
+                first = accessions[0]
+                try:
+                    getattr(self.importers[first], method)(metadata[first])
+                except (Exception, SystemExit) as e:
+                    for accession in accessions:
+                        self.report.fail(accession, stage, e)
+
+    def import_analyses(self, metadata):
+        logger.info('Creating analysis jobs...')
+        self.run_stage('analysis', self.report.pending(),
+                       lambda accession: self.importers[accession].import_analysis(metadata[accession]))
+
+    def populate_mongodb(self, metadata):
+        accessions = self.report.pending()
+        logger.info('Populating MongoDB for {} analyses on {} workers...'.format(
+            len(accessions), self.options['workers']))
+        if self.options['workers'] <= 1:
+            self.run_stage('mongodb', accessions, lambda accession: self.importers[accession].populate_mongodb(
+                metadata[accession].experiment_type))
+        else:
+            # the forked workers must not share (and then close) the parent's DB connections,
+            # nor its MongoClient, which isn't fork-safe: each worker connects on its own
+            connections.close_all()
+            mongoengine.disconnect()
+            with ProcessPoolExecutor(max_workers=self.options['workers'], initializer=connect_mongodb) as executor:
+                futures = dict(
+                    (executor.submit(populate_mongodb, accession, self.importers[accession].rootpath,
+                                     self.options['pipeline'], metadata[accession].experiment_type), accession)
+                    for accession in accessions
+                )
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except (Exception, SystemExit) as e:
+                        self.report.fail(futures[future], 'mongodb', e)
+            connect_mongodb()
+        for accession in self.report.pending():
+            self.report.succeed(accession)
+
+    def generate_study_summaries(self, metadata):
+        studies = {}
+        for accession, row in self.report.rows.items():
+            if row['status'] == IMPORTED:
+                studies.setdefault(row['study'], []).append(accession)
+        for study, accessions in studies.items():
+            logger.info('Generating study summary {}'.format(study))
+            try:
+                call_command('create_study_summary', study, self.options['pipeline'],
+                             '--database', self.options['database'],
+                             '--rootpath', self.importers[accessions[0]].rootpath)
+            except (Exception, SystemExit) as e:
+                # the analyses themselves were imported, the summary can be regenerated on its own
+                logger.error('Could not generate the study summary of {}: {!r}'.format(study, e))
+
+    def write_report(self):
+        if self.options['report']:
+            with open(self.options['report'], 'w') as f:
+                self.report.write(f)
+            logger.info('Status report written to {}'.format(self.options['report']))
+        else:
+            self.report.write(sys.stdout)
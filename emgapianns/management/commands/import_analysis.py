@@ -28,6 +28,7 @@ from ena_portal_api import ena_handler
 from emgapi import models as emg_models
 from emgapianns.management.lib import utils
 from emgapianns.management.lib.import_analysis_model import Assembly, Run, ExperimentType
+from emgapianns.management.lib.result_dir_index import ResultDirIndex
 from emgapianns.management.lib.sanity_check import SanityCheck
 from emgapianns.management.lib.uploader_exceptions import QCNotPassedException, CoverageCheckException, \
     FindResultFolderException
@@ -55,6 +56,61 @@ def setup_logging(options):
                         level=log_level)
 
 
+def fetch_metadata(accession, library_strategy):
+    """
+    Please note: Overwrite library strategy. Use library strategy given as a program argument.
+    :return:
+    """
+    logger.info("Retrieving metadata...")
+    is_assembly = utils.is_assembly(accession)
+    logger.info("Identified assembly accession: {0}".format(is_assembly))
+
+    if is_assembly:
+        assembly_fields = ",".join([
+            "secondary_study_accession",
+            "secondary_sample_accession",
+            "analysis_alias",
+            "analysis_accession",
+            # the following fields are not
+            # currently in use but I left them there
+            # because they could be useful in the future
+            "sequencing_method",
+            "assembly_software",
+            "assembly_quality",
+            "description"
+        ])
+        assembly = ena.get_assembly(assembly_name=accession, fields=assembly_fields)
+        if 'sample_accession' in assembly:
+            del assembly['sample_accession']
+        # Try to parse out the run accession from the analysis alias
+        # This generally works for most MGnify produced assemblies
+        # Please note: external assemblies might not have this!
+        if 'analysis_alias' in assembly:
+            pattern = re.compile(r'([EDS]RR\d{6,})')
+            search_string = assembly['analysis_alias']
+            match = re.search(pattern, search_string)
+            if match:
+                if len(match.groups()) > 0:
+                    run_accession = match.group(1)
+                else:
+                    run_accession = assembly['analysis_alias']
+                assembly['run_accession'] = run_accession
+            else:
+                assembly['run_accession'] = None
+            del assembly['analysis_alias']
+        analysis = Assembly(**assembly)
+    else:  # Run accession detected
+        run = ena.get_run(run_accession=accession,
+                          fields='secondary_study_accession,secondary_sample_accession,'
+                                 'run_accession,library_strategy,library_source')
+        # Overwrite library strategy.
+        run['library_strategy'] = library_strategy
+        if 'sample_accession' in run:
+            del run['sample_accession']
+        analysis = Run(**run)
+    return analysis
+
+
 class Command(BaseCommand):
     help = 'Imports new run and assembly annotation objects into EMG. The tool will import all associated objects like' \
            'studies, samples and assemblies as well. It will also populate MongoDB.'
@@ -96,26 +152,58 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         setup_logging(options)
-        self.emg_db = options['database']
 
         if not options['rootpath']:
             raise ValueError("rootpath (RESULTS_PRODUCTION_DIR setting) cannot by empty)")
 
-        self.rootpath = os.path.abspath(options['rootpath'])
-        self.accession = options['accession']
-        self.biome = options['biome']
-        self.library_strategy = options['library_strategy']
-        self.version = options['pipeline']
-        self.force_study_summary = options['force_study_summary']
-        self.result_status = options['result_status']
+        self.configure(
+            accession=options['accession'],
+            biome=options['biome'],
+            library_strategy=options['library_strategy'],
+            version=options['pipeline'],
+            rootpath=options['rootpath'],
+            emg_db=options['database'],
+            result_status=options['result_status'],
+            force_study_summary=options['force_study_summary'],
+        )
         logger.info("CLI %r" % options)
 
         metadata = self.retrieve_metadata()
         secondary_study_accession = metadata.secondary_study_accession
 
-        self.result_dir = self.__find_existing_result_dir(secondary_study_accession, self.accession, self.version)
+        self.prepare(metadata)
 
-        input_file_name = os.path.basename(self.result_dir)
+        self.import_study(metadata)
+        self.import_sample(metadata)
+        self.import_run_or_assembly(metadata)
+
+        self.import_analysis(metadata)
+
+        self.populate_mongodb(metadata.experiment_type)
+
+        if self.force_study_summary:
+            self.__call_generate_study_summary(secondary_study_accession)
+
+        logger.info("The upload of the run/assembly {} finished successfully.".format(self.accession))
+
+    def configure(self, accession, biome, library_strategy, version, rootpath, emg_db='default',
+                  result_status=None, force_study_summary=False):
+        """Set the options of one import, so the stages below can be run without handle (e.g. by import_analyses).
+        """
+        self.accession = accession
+        self.biome = biome
+        self.library_strategy = library_strategy
+        self.version = version
+        self.rootpath = os.path.abspath(rootpath)
+        self.emg_db = emg_db
+        self.result_status = result_status
+        self.force_study_summary = force_study_summary
+
+    def prepare(self, metadata):
+        """Find the result directory and run the sanity checks on it.
+        """
+        self.result_dir = self.__find_existing_result_dir(metadata.secondary_study_accession, self.accession,
+                                                          self.version)
 
         sanity_checker = SanityCheck(
             self.accession,
@@ -123,7 +211,8 @@ class Command(BaseCommand):
             self.library_strategy,
             self.version,
             result_status=self.result_status,
-            emg_db=self.emg_db
+            emg_db=self.emg_db,
+            use_manifest=True
         )
 
         sanity_checker.check_file_existence()
@@ -132,49 +221,59 @@ class Command(BaseCommand):
 
         sanity_checker.run_coverage_check()
 
+    def import_study(self, metadata):
         study_dir = utils.get_result_dir(utils.get_study_dir(self.result_dir))
 
         call_command('import_study',
-                     secondary_study_accession,
+                     metadata.secondary_study_accession,
                      self.biome,
                      '--study_dir', study_dir)
 
+    def import_sample(self, metadata):
         call_command('import_sample',
                      metadata.sample_accession,
                      '--biome', self.biome)
 
+    def import_run_or_assembly(self, metadata):
         if isinstance(metadata, Run):
             call_command('import_run', metadata.run_accession, '--biome', self.biome, '--library_strategy', self.library_strategy)
         else:
             call_command('import_assembly', metadata.analysis_accession, '--biome', self.biome)
 
+    def import_analysis(self, metadata):
+        """Create the analysis job, its downloadable files and its statistics.
+        """
+        input_file_name = os.path.basename(self.result_dir)
+
         analysis = self.create_or_update_analysis(metadata, input_file_name)
         self.upload_analysis_files(self.library_strategy, analysis, input_file_name)
 
         self.upload_statistics()
 
+    def populate_mongodb(self, experiment_type):
+        """Load the annotations into MongoDB.
+        Only needs accession, rootpath and version to be set.
+        """
         self.populate_mongodb_taxonomy()
 
-        if metadata.experiment_type != ExperimentType.AMPLICON:
+        if experiment_type != ExperimentType.AMPLICON:
             self.populate_mongodb_function_and_pathways()
         else:
             logging.info("Skipping the import of functional and pathway annotations!")
 
-        if self.version in ['5.0'] and metadata.experiment_type == ExperimentType.ASSEMBLY:
+        if self.version in ['5.0'] and experiment_type == ExperimentType.ASSEMBLY:
             logger.info('Importing contigs...')
             call_command('import_contigs', self.accession, self.rootpath, '--pipeline', self.version)
         else:
             logging.info("Skipping the import procedure for the contig viewer!")
 
-        if self.force_study_summary:
-            self.__call_generate_study_summary(secondary_study_accession)
-
-        logger.info("The upload of the run/assembly {} finished successfully.".format(self.accession))
-
     def __find_existing_result_dir(self, secondary_study_accession, run_accession, version):
         """Find the results folder 
         """
         logging.info("Finding result directory...")
+        indexed_folder = self.__find_indexed_result_dir(secondary_study_accession, run_accession, version)
+        if indexed_folder:
+            return indexed_folder
         # FIXME: remove hardcoded value.
         directory = os.path.join(self.rootpath, '2022')
         study_folder = self.__find_folder(directory, search_pattern=secondary_study_accession, recursive=True)
@@ -197,6 +296,22 @@ class Command(BaseCommand):
             logging.info("Found the following result folder:\n{}".format(latest_folder))
             return latest_folder
 
+    @staticmethod
+    def __find_indexed_result_dir(secondary_study_accession, run_accession, version):
+        """Look the results folder up in the result directory index (see index_result_dirs), if there is one.
+        :return: the latest created folder, or None if the index doesn't have it
+        """
+        if not settings.RESULTS_DIR_INDEX or not os.path.exists(settings.RESULTS_DIR_INDEX):
+            return None
+        with ResultDirIndex(settings.RESULTS_DIR_INDEX) as index:
+            result_folder = index.find_result_dirs(secondary_study_accession, run_accession, version)
+        if not result_folder:
+            logging.info('{} is not in the result directory index, searching the archive...'.format(run_accession))
+            return None
+        latest_folder = max(result_folder, key=os.path.getctime)
+        logging.info("Found the following result folder in the index:\n{}".format(latest_folder))
+        return latest_folder
+
     def __call_generate_study_summary(self, secondary_study_accession):
         """
             Example call:
@@ -210,58 +325,7 @@ class Command(BaseCommand):
                      '--rootpath', self.rootpath)
 
     def retrieve_metadata(self):
-        """
-        Please note: Overwrite library strategy. Use library strategy given as a program argument.
-        :return:
-        """
-        logger.info("Retrieving metadata...")
-        is_assembly = utils.is_assembly(self.accession)
-        logger.info("Identified assembly accession: {0}".format(is_assembly))
-
-        if is_assembly:
-            assembly_fields = ",".join([
-                "secondary_study_accession",
-                "secondary_sample_accession",
-                "analysis_alias",
-                "analysis_accession",
-                # the following fields are not
-                # currently in use but I left them there
-                # because they could be useful in the future
-                "sequencing_method",
-                "assembly_software",
-                "assembly_quality",
-                "description"
-            ])
-            assembly = ena.get_assembly(assembly_name=self.accession, fields=assembly_fields)
-            if 'sample_accession' in assembly:
-                del assembly['sample_accession']
-            # Try to parse out the run accession from the analysis alias
-            # This generally works for most MGnify produced assemblies
-            # Please note: external assemblies might not have this!
-            if 'analysis_alias' in assembly:
-                pattern = re.compile(r'([EDS]RR\d{6,})')
-                search_string = assembly['analysis_alias']
-                match = re.search(pattern, search_string)
-                if match:
-                    if len(match.groups()) > 0:
-                        run_accession = match.group(1)
-                    else:
-                        run_accession = assembly['analysis_alias']
-                    assembly['run_accession'] = run_accession
-                else:
-                    assembly['run_accession'] = None
-                del assembly['analysis_alias']
-            analysis = Assembly(**assembly)
-        else:  # Run accession detected
-            run = ena.get_run(run_accession=self.accession,
-                              fields='secondary_study_accession,secondary_sample_accession,'
-                                     'run_accession,library_strategy,library_source')
-            # Overwrite library strategy.
-            run['library_strategy'] = self.library_strategy
-            if 'sample_accession' in run:
-                del run['sample_accession']
-            analysis = Run(**run)
-        return analysis
+        return fetch_metadata(self.accession, self.library_strategy)
 
     def get_emg_study(self, secondary_study_accession):
         return emg_models.Study.objects.using(self.emg_db).get(secondary_accession=secondary_study_accession)
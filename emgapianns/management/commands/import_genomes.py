@@ -1,26 +1,36 @@
 import logging
 import os
+from contextlib import contextmanager
 from pathlib import Path
 
 from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
 from django.utils.text import slugify
 
 from emgapi import models as emg_models
 
+from ..lib import utils
 from ..lib.genome_util import (
     sanity_check_genome_output_euks,
     sanity_check_genome_output_proks,
     sanity_check_catalogue_dir,
     find_genome_results,
     get_genome_result_path,
-    read_tsv_w_headers, read_json,
-    apparent_accession_of_genome_dir
+    read_json,
+    read_genome_results,
 )
 
 logger = logging.getLogger(__name__)
 
-cog_cache = {}
-ipr_cache = {}
+# parsed genome results key, count model, lookup field of the count model, lookup model, lookup key
+COUNT_TABLES = (
+    ('cog_counts', emg_models.GenomeCogCounts, 'cog', emg_models.CogCat, 'name'),
+    ('kegg_class_counts', emg_models.GenomeKeggClassCounts, 'kegg_class', emg_models.KeggClass, 'class_id'),
+    ('kegg_module_counts', emg_models.GenomeKeggModuleCounts, 'kegg_module', emg_models.KeggModule, 'name'),
+    ('antismash_counts', emg_models.GenomeAntiSmashGCCounts, 'antismash_genecluster', emg_models.AntiSmashGC,
+     'name'),
+)
 
 
 class Command(BaseCommand):
@@ -31,6 +41,9 @@ class Command(BaseCommand):
     catalogue_dir = None
 
     database = None
+    workers = 1
+    batch_size = 500
+    executor = None
 
     def add_arguments(self, parser):
         parser.add_argument('results_directory', action='store', type=str, )
@@ -56,8 +69,15 @@ class Command(BaseCommand):
         parser.add_argument('--catalogue_biome_label', type=str, default='',
                             help='A catalogue biome label (e.g. Mouse Gut) which can be used to group together related '
                                  'catalogues of different types. If none, the catalogue name is used.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of processes used to check and parse the genome directories')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=500,
+                            help='Number of genomes written to the database per transaction')
 
     def handle(self, *args, **options):
+        self.workers = options.get('workers', 1)
+        self.batch_size = options.get('batch_size', 500)
+        self.lookups = {}
         ver = options['pipeline_version'].strip()
         if ver.startswith('v1'):
             return self.handle_v1(*args, **options)
@@ -99,12 +119,12 @@ class Command(BaseCommand):
         logger.info(
             'Found {} genome dirs to upload'.format(len(genome_dirs)))
 
-        [sanity_check_genome_output_proks(d) for d in genome_dirs]
+        with self.process_pool():
+            self.map_genome_dirs(sanity_check_genome_output_proks, genome_dirs)
 
-        sanity_check_catalogue_dir(self.catalogue_dir)
+            sanity_check_catalogue_dir(self.catalogue_dir)
 
-        for d in genome_dirs:
-            self.upload_dir(d)
+            self.upload_dirs(genome_dirs)
 
         self.upload_catalogue_files()
         self.catalogue_obj.calculate_genome_count()
@@ -148,15 +168,15 @@ class Command(BaseCommand):
         logger.info(
             'Found {} genome dirs to upload'.format(len(genome_dirs)))
 
-        if catalogue_type == 'eukaryotes':
-            [sanity_check_genome_output_euks(d) for d in genome_dirs]
-        elif catalogue_type == 'prokaryotes':
-            [sanity_check_genome_output_proks(d) for d in genome_dirs]
+        with self.process_pool():
+            if catalogue_type == 'eukaryotes':
+                self.map_genome_dirs(sanity_check_genome_output_euks, genome_dirs)
+            elif catalogue_type == 'prokaryotes':
+                self.map_genome_dirs(sanity_check_genome_output_proks, genome_dirs)
 
-        sanity_check_catalogue_dir(self.catalogue_dir)
+            sanity_check_catalogue_dir(self.catalogue_dir)
 
-        for d in genome_dirs:
-            self.upload_dir(d, update_metadata_only=options['update_metadata_only'])
+            self.upload_dirs(genome_dirs, update_metadata_only=options['update_metadata_only'])
 
         self.upload_catalogue_files()
         self.catalogue_obj.calculate_genome_count()
@@ -206,28 +226,105 @@ class Command(BaseCommand):
                 })
         return catalogue
 
+    @contextmanager
+    def process_pool(self):
+        """Check and parse the genome directories on a pool of `workers` processes.
+        """
+        with utils.process_pool(self.workers) as executor:
+            self.executor = executor
+            try:
+                yield
+            finally:
+                self.executor = None
+
+    def map_genome_dirs(self, func, genome_dirs, *iterables):
+        if self.executor is not None:
+            return list(self.executor.map(func, genome_dirs, *iterables, chunksize=64))
+        return list(map(func, genome_dirs, *iterables))
+
+    def read_genome_dirs(self, genome_dirs, update_metadata_only=False):
+        """
+        Yield the parsed genome directories in batches of `batch_size`.
+        With a process pool, the next batch is parsed while the current one is written to the database.
+        """
+        batches = [genome_dirs[i:i + self.batch_size] for i in range(0, len(genome_dirs), self.batch_size)]
+        if self.executor is None:
+            for batch in batches:
+                yield [read_genome_results(d, update_metadata_only) for d in batch]
+            return
+        pending = None
+        for batch in batches:
+            futures = [self.executor.submit(read_genome_results, d, update_metadata_only) for d in batch]
+            if pending is not None:
+                yield [f.result() for f in pending]
+            pending = futures
+        if pending is not None:
+            yield [f.result() for f in pending]
+
+    def upload_dirs(self, genome_dirs, update_metadata_only=False):
+        self.preload_lookups()
+        uploaded = 0
+        for batch in self.read_genome_dirs(genome_dirs, update_metadata_only):
+            with transaction.atomic(using=self.database):
+                genome_ids = self.create_genomes(batch)
+                if not update_metadata_only:
+                    for results_key, model, field, lookup_model, lookup_key in COUNT_TABLES:
+                        self.upload_counts(batch, genome_ids, results_key, model, field, lookup_model, lookup_key)
+                    self.upload_genome_files(batch, genome_ids)
+            uploaded += len(batch)
+            logger.info('Uploaded {} of {} genome dirs'.format(uploaded, len(genome_dirs)))
+
     def upload_dir(self, directory, update_metadata_only=False):
         logger.info('Uploading dir: {}'.format(directory))
-        genome, has_pangenome = self.create_genome(directory)
-        if update_metadata_only:
-            return
-        self.upload_cog_results(genome, directory)
-        self.upload_kegg_class_results(genome, directory)
-        self.upload_kegg_module_results(genome, directory)
-        self.upload_antismash_geneclusters(genome, directory)
-        self.upload_genome_files(genome, directory, has_pangenome)
+        self.upload_dirs([directory], update_metadata_only=update_metadata_only)
+
+    def preload_lookups(self):
+        """Load the (small) COG, KEGG, antiSMASH and geographic location tables once,
+        rather than looking them up for every count.
+        """
+        for _, _, _, lookup_model, lookup_key in COUNT_TABLES:
+            self.get_lookups(lookup_model, lookup_key, [])
+            for obj in lookup_model.objects.using(self.database).all():
+                self.lookups[lookup_model].setdefault(getattr(obj, lookup_key), obj)
+        self.get_lookups(emg_models.GeographicLocation, 'name', [])
+        for obj in emg_models.GeographicLocation.objects.using(self.database).all():
+            self.lookups[emg_models.GeographicLocation].setdefault(obj.name, obj)
+
+    def get_lookups(self, model, key, names):
+        """
+        Map names to objects of a lookup table (e.g. COG category names to CogCat),
+        creating the ones that don't exist yet in bulk.
+        """
+        lookups = self.lookups.setdefault(model, {})
+        missing = set(names).difference(lookups)
+        if missing:
+            objects = model.objects.using(self.database)
+            for obj in objects.filter(**{key + '__in': missing}):
+                lookups.setdefault(getattr(obj, key), obj)
+            new = missing.difference(lookups)
+            if new:
+                objects.bulk_create([model(**{key: name}) for name in new])
+                for obj in objects.filter(**{key + '__in': new}):
+                    lookups.setdefault(getattr(obj, key), obj)
+        return lookups
 
     def get_gold_biome(self, lineage):
-        biome = emg_models.Biome.objects.using(self.database).filter(lineage__iexact=lineage).first()
-        if not biome:
-            raise emg_models.Biome.DoesNotExist()
-        return biome
+        biomes = self.lookups.setdefault(emg_models.Biome, {})
+        if lineage not in biomes:
+            biome = emg_models.Biome.objects.using(self.database).filter(lineage__iexact=lineage).first()
+            if not biome:
+                raise emg_models.Biome.DoesNotExist()
+            biomes[lineage] = biome
+        return biomes[lineage]
 
     def get_or_create_genome_set(self, setname):
-        return emg_models.GenomeSet.objects.using(self.database).get_or_create(name=setname)[0]
+        genome_sets = self.lookups.setdefault(emg_models.GenomeSet, {})
+        if setname not in genome_sets:
+            genome_sets[setname] = emg_models.GenomeSet.objects.using(self.database).get_or_create(name=setname)[0]
+        return genome_sets[setname]
 
-    def prepare_genome_data(self, genome_dir):
-        d = read_json(os.path.join(genome_dir, f'{apparent_accession_of_genome_dir(genome_dir)}.json'))
+    def prepare_genome_data(self, d):
+        d = dict(d)
 
         has_pangenome = 'pangenome' in d
         d['biome'] = self.get_gold_biome(d['gold_biome'])
@@ -253,218 +350,127 @@ class Command(BaseCommand):
         return d, has_pangenome
 
     def get_geo_location(self, location):
-        return emg_models.GeographicLocation \
-            .objects.using(self.database).get_or_create(name=location)[0]
-
-    def attach_geo_location(self, genome, location):
-        genome.pangenome_geographic_range.add(self.get_geo_location(location))
-
-    def create_genome(self, genome_dir):
-        data, has_pangenome = self.prepare_genome_data(genome_dir)
+        return self.get_lookups(emg_models.GeographicLocation, 'name', [location])[location]
 
-        geo_locations = data.get('geographic_range')
-        data.pop('geographic_range', None)
-        data.pop('genome_accession', None)
-
-        data['result_directory'] = get_genome_result_path(genome_dir)
-        data['catalogue'] = self.catalogue_obj
-        g, created = emg_models.Genome.objects.using(self.database).update_or_create(
-            accession=data['accession'],
-            defaults=data)
-        g.save(using=self.database)
+    def create_genomes(self, batch):
+        """
+        Create or update the genomes of a batch of parsed genome directories, and their geographic range.
+        :return: dict of genome accession to genome_id
+        """
+        genomes = []
+        for results in batch:
+            data, _ = self.prepare_genome_data(results['data'])
+            geo_locations = data.pop('geographic_range', None) or []
+            data.pop('genome_accession', None)
+            data['result_directory'] = get_genome_result_path(results['directory'])
+            data['catalogue'] = self.catalogue_obj
+            genomes.append((data, geo_locations))
+
+        objects = emg_models.Genome.objects.using(self.database)
+        existing = dict(
+            objects.prefetch_related(None)
+            .filter(accession__in=[data['accession'] for data, _ in genomes])
+            .values_list('accession', 'pk')
+        )
+        new_genomes = []
+        # only the fields in a genome JSON are updated (like update_or_create), so group the updates by fields
+        updates = {}
+        now = timezone.now()
+        for data, _ in genomes:
+            if data['accession'] in existing:
+                genome = emg_models.Genome(pk=existing[data['accession']], last_update=now, **data)
+                fields = tuple(sorted(data)) + ('last_update',)
+                if 'taxon_lineage' in data:
+                    genome.set_taxon_ranks()
+                    fields += tuple(emg_models.Genome.TAXON_RANKS.values())
+                updates.setdefault(fields, []).append(genome)
+            else:
+                genome = emg_models.Genome(**data)
+                genome.set_taxon_ranks()
+                new_genomes.append(genome)
+        for fields, group in updates.items():
+            objects.bulk_update(group, fields, batch_size=self.batch_size)
+        objects.bulk_create(new_genomes, batch_size=self.batch_size)
+
+        genome_ids = dict(
+            objects.prefetch_related(None)
+            .filter(accession__in=[data['accession'] for data, _ in genomes])
+            .values_list('accession', 'pk')
+        )
+        # bulk_create/bulk_update skip Genome.save, which keeps the accession aliases up to date
+        emg_models.AccessionAlias.objects.using(self.database).sync(emg_models.Genome, genome_ids.values())
 
         # in case we are updating and the geo range metadata has changed:
-        if g.pangenome_geographic_range.exists():
-            g.pangenome_geographic_range.clear()
-
-        if geo_locations:
-            [self.attach_geo_location(g, l) for l in geo_locations]
-
-        return g, has_pangenome
-
-    def upload_cog_results(self, genome, d):
-        genome_cogs = os.path.join(d, 'genome', f'{genome.accession}_cog_summary.tsv')
-        self.upload_cog_result(genome, genome_cogs)
-        logger.info('Loaded Genome COG for {}'.format(genome.accession))
-
-    def upload_cog_result(self, genome, f):
-        counts = read_tsv_w_headers(f)
-        for cc in counts:
-            self.upload_cog_count(genome, cc)
-        logger.info('Loaded Genome COG for {}'.format(genome.accession))
-
-    def upload_cog_count(self, genome, cog_count):
-        c_name = cog_count['COG_category']
-        cog = self.get_cog_cat(c_name)
-
-        count_val = int(cog_count['Counts'])
-
-        defaults = {'genome_count': 0}
-
-        count, created = emg_models.GenomeCogCounts.objects \
-            .using(self.database) \
-            .get_or_create(genome=genome,
-                           cog=cog,
-                           defaults=defaults)
-
-        count.genome_count = count_val
-        count.save(using=self.database)
-
-    def get_cog_cat(self, c_name):
-        return emg_models.CogCat.objects.using(self.database) \
-            .get_or_create(name=c_name)[0]
-
-    def upload_kegg_class_results(self, genome, d):
-        genome_kegg_classes = os.path.join(d, 'genome', f'{genome.accession}_kegg_classes.tsv')
-        self.upload_kegg_class_result(genome, genome_kegg_classes)
-        logger.info(
-            'Loaded Genome KEGG classes for {}'.format(genome.accession))
-
-    def upload_kegg_class_result(self, genome, f):
-        kegg_matches = read_tsv_w_headers(f)
-        for kegg_match in kegg_matches:
-            self.upload_kegg_class_count(genome, kegg_match)
-
-    def get_kegg_class(self, kegg_cls_id):
-        return emg_models.KeggClass.objects.using(self.database) \
-            .get_or_create(class_id=kegg_cls_id)[0]
-
-    def upload_kegg_class_count(self, genome, kegg_match):
-        kegg_id = kegg_match['KEGG_class']
-        kegg_class = self.get_kegg_class(kegg_id)
-
-        count_val = int(kegg_match['Counts'])
-
-        defaults = {'genome_count': 0}
-
-        count, created = emg_models.GenomeKeggClassCounts.objects \
-            .using(self.database) \
-            .get_or_create(genome=genome,
-                           kegg_class=kegg_class,
-                           defaults=defaults)
-
-        count.genome_count = count_val
-        count.save(using=self.database)
-
-    def upload_kegg_module_results(self, genome, d):
-        genome_kegg_modules = os.path.join(d, 'genome', f'{genome.accession}_kegg_modules.tsv')
-        self.upload_kegg_module_result(genome, genome_kegg_modules)
-        logger.info(
-            'Loaded Genome KEGG modules for {}'.format(genome.accession))
-
-    def upload_kegg_module_result(self, genome, f):
-        kegg_matches = read_tsv_w_headers(f)
-        for kegg_match in kegg_matches:
-            self.upload_kegg_module_count(genome, kegg_match)
-
-    def get_kegg_module(self, name):
-        return emg_models.KeggModule.objects.using(self.database) \
-            .get_or_create(name=name)[0]
-
-    def upload_kegg_module_count(self, genome, kegg_match):
-        kegg_module_id = kegg_match['KEGG_module']
-        kegg_module = self.get_kegg_module(kegg_module_id)
-
-        count_val = int(kegg_match['Counts'])
-
-        defaults = {'genome_count': 0}
-
-        count, created = emg_models.GenomeKeggModuleCounts.objects \
-            .using(self.database) \
-            .get_or_create(genome=genome,
-                           kegg_module=kegg_module,
-                           defaults=defaults)
-
-        count.genome_count = count_val
-        count.save(using=self.database)
-
-    def upload_antismash_geneclusters(self, genome, directory):
-        """Upload AS results in the DB
+        geo_range = emg_models.Genome.pangenome_geographic_range.through
+        geo_range.objects.using(self.database).filter(genome_id__in=genome_ids.values()).delete()
+        locations = self.get_lookups(
+            emg_models.GeographicLocation, 'name', [l for _, geo_locations in genomes for l in geo_locations])
+        geo_range.objects.using(self.database).bulk_create([
+            geo_range(genome_id=genome_ids[data['accession']], geographiclocation_id=locations[l].pk)
+            for data, geo_locations in genomes for l in dict.fromkeys(geo_locations)
+        ], batch_size=self.batch_size)
+        return genome_ids
+
+    def upload_counts(self, batch, genome_ids, results_key, model, field, lookup_model, lookup_key):
         """
-        file = os.path.join(directory, 'genome', 'geneclusters.txt')
-
-        if not os.path.exists(file):
-            logger.warning('Genome {} does not have antiSMASH geneclusters'.format(genome.accession))
+        Replace the counts (e.g. GenomeCogCounts) of the genomes of a batch.
+        Genomes without results for the count (e.g. no antiSMASH geneclusters) are left as they are.
+        """
+        batch = [results for results in batch if results[results_key] is not None]
+        if not batch:
             return
-
-        with open(file, 'rt') as tsv:
-            for row in tsv:
-                *_, cluster, features, _ = row.split('\t')
-
-                as_cluster, _ = emg_models.AntiSmashGC.objects \
-                    .using(self.database) \
-                    .get_or_create(name=cluster)
-
-                count_val = len(features.split(';')) if len(features) else 0
-                model, _ = emg_models.GenomeAntiSmashGCCounts.objects \
-                    .using(self.database) \
-                    .get_or_create(genome=genome, antismash_genecluster=as_cluster,
-                                   genome_count=count_val)
-                model.save(using=self.database)
-
-            logger.info(
-                'Loaded Genome AntiSMASH geneclusters for {}'.format(genome.accession))
-
-    def upload_genome_files(self, genome, directory, has_pangenome):
+        lookups = self.get_lookups(
+            lookup_model, lookup_key, [name for results in batch for name, _ in results[results_key]])
+        ids = [genome_ids[results['data']['accession']] for results in batch]
+        model.objects.using(self.database).filter(genome_id__in=ids).delete()
+        model.objects.using(self.database).bulk_create([
+            model(**{'genome_id': genome_id, field: lookups[name], 'genome_count': count})
+            for genome_id, results in zip(ids, batch)
+            for name, count in results[results_key]
+        ], batch_size=self.batch_size)
+        logger.debug('Loaded {} for {} genomes'.format(model._meta.verbose_name_plural, len(batch)))
+
+    def upload_genome_files(self, batch, genome_ids):
+        """Create or update the GenomeDownloads of the genomes of a batch.
+        """
         logger.info('Uploading genome files...')
-        self.upload_genome_file(genome, directory, 'Predicted CDS (aa)', 'fasta',
-                                genome.accession + '.faa', 'Genome analysis', 'genome', True)
-        self.upload_genome_file(genome, directory, 'Nucleic Acid Sequence', 'fasta',
-                                genome.accession + '.fna', 'Genome analysis', 'genome', True)
-        self.upload_genome_file(genome, directory, 'Nucleic Acid Sequence index', 'fai',
-                                genome.accession + '.fna.fai', 'Genome analysis', 'genome', True, )
-        self.upload_genome_file(genome, directory, 'Genome Annotation', 'gff',
-                                genome.accession + '.gff', 'Genome analysis', 'genome', True)
-        self.upload_genome_file(genome, directory, 'Genome antiSMASH Annotation', 'gff',
-                                genome.accession + '_antismash.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome VIRify Annotation', 'gff',
-                                genome.accession + '_virify.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome VIRify Regions', 'tsv',
-                                genome.accession + '_virify_metadata.tsv', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome SanntiS Annotation', 'gff',
-                                genome.accession + '_sanntis.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'EggNog annotation', 'tsv',
-                                genome.accession + '_eggNOG.tsv', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'InterProScan annotation', 'tsv',
-                                genome.accession + '_InterProScan.tsv', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome rRNA Sequence', 'fasta',
-                                genome.accession + '_rRNAs.fasta', 'Genome analysis', 'genome', False)
-        # pipeline v2 files (if present):
-        self.upload_genome_file(genome, directory, 'Genome AMRFinderPlus Annotation', 'tsv',
-                                genome.accession + '_amrfinderplus.tsv', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome CRISPRCasFinder Annotation', 'gff',
-                                genome.accession + '_crisprcasfinder.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome CRISPRCasFinder Additional Records', 'tsv',
-                                genome.accession + '_crisprcasfinder.tsv', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome Mobilome Annotation', 'gff',
-                                genome.accession + '_mobilome.gff', 'Genome analysis', 'genome', False)
-        # pipeline v2.4.0 files (if not empty):
-        self.upload_genome_file(genome, directory, 'Genome dbCAN Annotation', 'gff',
-                                genome.accession + '_dbcan.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome Defense Finder Annotation', 'gff',
-                                genome.accession + '_defense_finder.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'Genome GECCO Annotation', 'gff',
-                                genome.accession + '_gecco.gff', 'Genome analysis', 'genome', False)
-        self.upload_genome_file(genome, directory, 'KEGG Pathway Completeness', 'tsv',
-                                genome.accession + '_kegg_pathways.tsv', 'Genome analysis', 'genome', False)
-
-        if has_pangenome:
-            self.upload_genome_file(genome, directory, 'Pangenome core genes list', 'tab',
-                                    'core_genes.txt', 'Pan-Genome analysis', 'pan-genome', False)
-            self.upload_genome_file(genome, directory, 'Pangenome DNA sequence', 'fasta',
-                                    'pan-genome.fna', 'Pan-Genome analysis', 'pan-genome', False)
-            self.upload_genome_file(genome, directory,
-                                    'Gene Presence / Absence matrix',
-                                    'tsv', 'gene_presence_absence.Rtab', 'Pan-Genome analysis', 'pan-genome', False)
-            self.upload_genome_file(genome, directory,
-                                    'Gene Presence / Absence list',
-                                    'csv', 'gene_presence_absence.csv', 'Pan-Genome analysis', 'pan-genome', False)
-            self.upload_genome_file(genome, directory,
-                                    'Pairwise Mash distances of conspecific genomes',
-                                    'nwk', 'mashtree.nwk', 'Pan-Genome analysis', 'pan-genome', False)
+        ids = [genome_ids[results['data']['accession']] for results in batch]
+        objects = emg_models.GenomeDownload.objects.using(self.database)
+        existing = dict(
+            ((genome_id, alias), pk) for genome_id, alias, pk in
+            objects.filter(genome_id__in=ids).values_list('genome_id', 'alias', 'pk')
+        )
+        new_downloads = []
+        # grouped by the fields to update: like update_or_create, the group and subdir
+        # of the existing downloads are left as they are for the files that don't set them
+        updated_downloads = {}
+        for genome_id, results in zip(ids, batch):
+            for desc_label, file_format, filename, group_type, subdir in results['files']:
+                defaults = self.prepare_file_upload(desc_label, file_format, filename, group_type, subdir)
+                download = emg_models.GenomeDownload(genome_id=genome_id, **defaults)
+                if (genome_id, defaults['alias']) in existing:
+                    download.pk = existing[(genome_id, defaults['alias'])]
+                    updated_downloads.setdefault(tuple(sorted(defaults)), []).append(download)
+                else:
+                    new_downloads.append(download)
+        for fields, downloads in updated_downloads.items():
+            objects.bulk_update(downloads, fields, batch_size=self.batch_size)
+        objects.bulk_create(new_downloads, batch_size=self.batch_size)
 
     def prepare_file_upload(self, desc_label, file_format, filename, group_name=None, subdir_name=None):
+        # the description, format, group and subdir are the same for every genome
+        file_uploads = self.lookups.setdefault(emg_models.DownloadDescriptionLabel, {})
+        key = (desc_label, file_format, group_name, subdir_name)
+        if key not in file_uploads:
+            file_uploads[key] = self.get_file_upload_lookups(desc_label, file_format, group_name, subdir_name)
+        obj = dict(file_uploads[key])
+
+        name = os.path.basename(filename)
+        obj['realname'] = name
+        obj['alias'] = name
+        return obj
 
+    def get_file_upload_lookups(self, desc_label, file_format, group_name=None, subdir_name=None):
         obj = {}
         desc = emg_models.DownloadDescriptionLabel \
             .objects.using(self.database) \
@@ -481,10 +487,6 @@ class Command(BaseCommand):
             .first()
         obj['file_format'] = fmt
 
-        name = os.path.basename(filename)
-        obj['realname'] = name
-        obj['alias'] = name
-
         if group_name:
             group = emg_models.DownloadGroupType \
                 .objects.using(self.database) \
@@ -501,20 +503,6 @@ class Command(BaseCommand):
 
         return obj
 
-    def upload_genome_file(self, genome, directory, desc_label, file_format, filename, group_type, subdir,
-                           require_existent_and_non_empty):
-        defaults = self.prepare_file_upload(desc_label, file_format, filename, group_type, subdir)
-        path = os.path.join(directory, subdir, filename)
-        if not (os.path.isfile(path) and os.path.getsize(path) > 0):
-            if require_existent_and_non_empty:
-                raise FileNotFoundError(f"Required file at {path} either missing or empty")
-            else:
-                logger.warning(f"File not found or empty at {path}. This is allowable, but will not be uploaded.")
-                return
-        emg_models.GenomeDownload.objects.using(self.database).update_or_create(genome=genome,
-                                                                                alias=defaults['alias'],
-                                                                                defaults=defaults)
-
     def upload_catalogue_files(self):
         self.upload_catalogue_file(self.catalogue_obj,
                                  'Phylogenetic tree of catalogue genomes',
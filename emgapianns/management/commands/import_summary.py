@@ -19,6 +19,7 @@ import csv
 import logging
 
 from emgapianns import models as m_models
+from emgapianns import postings as m_postings
 
 from ..lib import EMGBaseCommand
 
@@ -106,6 +107,7 @@ class Command(EMGBaseCommand):
                 .get(pk=str(obj.job_id))
         except m_models.AnalysisJobGoTerm.DoesNotExist:
             run = m_models.AnalysisJobGoTerm()
+        previous = m_postings.annotation_counts(run)
         run.analysis_id = str(obj.job_id)
         run.accession = obj.accession
         run.pipeline_version = obj.pipeline.release_version
@@ -159,6 +161,7 @@ class Command(EMGBaseCommand):
             if len(run.go_terms) > 0:
                 logger.info("Go terms %d" % len(run.go_terms))
             run.save()
+            m_postings.index_analysis(run, previous)
             logger.info("Saved Run %r" % run)
 
     def load_ipr_from_summary_file(self, reader, obj):  # noqa
@@ -167,6 +170,7 @@ class Command(EMGBaseCommand):
                 pk=str(obj.job_id))
         except m_models.AnalysisJobInterproIdentifier.DoesNotExist:
             run = m_models.AnalysisJobInterproIdentifier()
+        previous = m_postings.annotation_counts(run)
         run.analysis_id = str(obj.job_id)
         run.accession = obj.accession
         version = obj.pipeline.release_version
@@ -211,6 +215,7 @@ class Command(EMGBaseCommand):
                 logger.info(
                     "Interpro identifiers %d" % len(run.interpro_identifiers))
             run.save()
+            m_postings.index_analysis(run, previous)
             logger.info("Saved Run %r" % run)
 
     @staticmethod
@@ -226,6 +231,7 @@ class Command(EMGBaseCommand):
                 .get(pk=str(obj.job_id))
         except m_models.AnalysisJobKeggModule.DoesNotExist:
             analysis_keggs = m_models.AnalysisJobKeggModule()
+        previous = m_postings.annotation_counts(analysis_keggs)
 
         analysis_keggs.analysis_id = str(obj.job_id)
         analysis_keggs.accession = obj.accession
@@ -281,6 +287,7 @@ class Command(EMGBaseCommand):
                     'Created {} new KEGG Module Annotations'.format(len(annotations)))
 
         analysis_keggs.save()
+        m_postings.index_analysis(analysis_keggs, previous)
         logger.info('Saved Run {analysis_keggs}')
 
     def load_summary_file(self, reader, obj, analysis_model, analysis_field,
@@ -295,6 +302,7 @@ class Command(EMGBaseCommand):
                 .get(pk=str(obj.job_id))
         except analysis_model.DoesNotExist:
             analysis = analysis_model()
+        previous = m_postings.annotation_counts(analysis)
         analysis.analysis_id = str(obj.job_id)
         analysis.accession = obj.accession
         analysis.pipeline_version = obj.pipeline.release_version
@@ -334,6 +342,7 @@ class Command(EMGBaseCommand):
                 'Created {} new annotations'.format(len(annotations)))
 
         analysis.save()
+        m_postings.index_analysis(analysis, previous)
         logger.info('Saved {}'.format(analysis_field))
 
     def load_genome_properties(self, reader,  obj):
@@ -347,6 +356,7 @@ class Command(EMGBaseCommand):
                                                                  .get(pk=str(obj.job_id))
         except m_models.AnalysisJobGenomeProperty.DoesNotExist:
             analysis_genprop = m_models.AnalysisJobGenomeProperty()
+        previous = m_postings.annotation_counts(analysis_genprop)
 
         analysis_genprop.analysis_id = str(obj.job_id)
         analysis_genprop.accession = obj.accession
@@ -398,6 +408,7 @@ class Command(EMGBaseCommand):
                 "Created {} new annotations".format(len(annotations)))
 
         analysis_genprop.save()
+        m_postings.index_analysis(analysis_genprop, previous)
         logger.info("Saved Analysis annnotations Genome Properties")
 
     def _parse_and_load_summary_file(self, source_file, obj):
@@ -6,7 +6,9 @@ import logging
 import os
 import re
 
+from emgapi import krona as emg_krona
 from emgapianns import models as m_models
+from emgapianns import postings as m_postings
 
 from ..lib import EMGBaseCommand
 
@@ -86,6 +88,9 @@ class Command(EMGBaseCommand):
                     self.load_its(res, obj, 'unite')
             else:
                 logger.error("Pipeline not supported SKIPPING!")
+                return
+            charts = emg_krona.compress_charts(res)
+            logger.info("Compressed %d Krona charts" % charts)
         else:
             logger.error("Path %r doesn't exist. SKIPPING!" % res)
 
@@ -125,6 +130,7 @@ class Command(EMGBaseCommand):
                 .get(pk=str(obj.job_id))
         except m_models.AnalysisJobTaxonomy.DoesNotExist:
             run = m_models.AnalysisJobTaxonomy()
+        previous = m_postings.annotation_counts(run)
         run.analysis_id = str(obj.job_id)
         run.accession = obj.accession
         version = obj.pipeline.release_version
@@ -210,4 +216,5 @@ class Command(EMGBaseCommand):
                 logger.info(
                     'Created {} new Organisms'.format(len(new_orgs)))
             run.save()
+            m_postings.index_analysis(run, previous)
             logger.info('Saved Run {}'.format(run))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from django.core.management import BaseCommand
+
+from emgapianns import postings as m_postings
+
+logger = logging.getLogger(__name__)
+
+"""
+    Cl call:
+        emgcli index_annotation_postings go-terms pfam-entries
+        emgcli index_annotation_postings --public-only
+"""
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the postings lists (annotation or organism -> analyses) from the analyses in Mongo. ' \
+           'import_summary and import_taxonomy keep them up to date afterwards. ' \
+           'With --public-only, rebuilds the postings of the public analyses only, ' \
+           'to run once analyses have been made public, private or suppressed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', choices=sorted(m_postings.SOURCES),
+                            help='Kinds of annotations to index (default: all)')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=1000,
+                            help='Analysis documents read from Mongo per batch')
+        parser.add_argument('--public-only', dest='public_only', action='store_true',
+                            help='Rebuild the public postings from the postings, with the current '
+                                 'visibility of the analyses')
+
+    def handle(self, *args, **options):
+        logger.info("CLI %r" % options)
+        for kind in options['kinds'] or sorted(m_postings.SOURCES):
+            if options['public_only']:
+                count = m_postings.refresh_public_postings(kind)
+                logger.info('Refreshed {} blocks of public {}'.format(count, kind))
+                continue
+            count = m_postings.rebuild_postings(kind, batch_size=options['batch_size'])
+            logger.info('Indexed the {} of {} analyses'.format(kind, count))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+
+from django.core.management import BaseCommand, CommandError
+from django.conf import settings
+
+from emgapianns.management.lib.result_dir_index import ResultDirIndex, DEFAULT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+"""
+    Cl call:
+        emgcli index_result_dirs --rootpath /nfs/production/results --index /nfs/production/results-index.sqlite
+"""
+
+
+class Command(BaseCommand):
+    help = 'Builds or updates the index of the result directories used by import_analysis. ' \
+           'Only the study directories that changed since the last run are scanned again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rootpath',
+                            help="NFS production root path of the results archive.",
+                            default=settings.RESULTS_PRODUCTION_DIR)
+        parser.add_argument('--index',
+                            help='Path of the index file (RESULTS_DIR_INDEX setting)',
+                            default=settings.RESULTS_DIR_INDEX)
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                            help='Number of threads listing the directories')
+        parser.add_argument('--full', action='store_true', default=False,
+                            help='Scan every study directory, even the unchanged ones')
+
+    def handle(self, *args, **options):
+        logger.info("CLI %r" % options)
+        if not options['rootpath']:
+            raise CommandError("rootpath (RESULTS_PRODUCTION_DIR setting) cannot by empty")
+        if not options['index']:
+            raise CommandError("index (RESULTS_DIR_INDEX setting) cannot by empty")
+        rootpath = os.path.abspath(options['rootpath'])
+        if not os.path.isdir(rootpath):
+            raise CommandError(f"rootpath {rootpath} is not a directory")
+
+        with ResultDirIndex(options['index']) as index:
+            scanned = index.update(rootpath, workers=options['workers'], full=options['full'])
+        logger.info('Indexed {} study directories of {}'.format(scanned, rootpath))
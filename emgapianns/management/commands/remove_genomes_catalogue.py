@@ -1,15 +1,29 @@
 import logging
 
 from django.core.management import BaseCommand
+from django.db import transaction
 
 from emgapi import models as emg_models
 
 logger = logging.getLogger(__name__)
 
 
+def genome_dependents():
+    """
+    The tables holding rows of a genome, as (model, genome field) pairs:
+    the count tables, downloads and the many-to-many tables of Genome.
+    """
+    dependents = []
+    for field in emg_models.Genome._meta.get_fields(include_hidden=True):
+        if field.auto_created and (field.one_to_many or field.one_to_one):
+            dependents.append((field.related_model, field.field.name))
+    return dependents
+
+
 class Command(BaseCommand):
     catalogue_id = None
     database = None
+    chunk_size = 1000
 
     def add_arguments(self, parser):
         parser.add_argument('catalogue_id', action='store', type=str, help='Example: human-gut-v1-0')
@@ -19,10 +33,13 @@ class Command(BaseCommand):
         )
         parser.add_argument('--database', type=str,
                             default='default')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=1000,
+                            help='Number of genomes deleted per transaction')
 
     def handle(self, *args, **options):
         self.database = options['database']
         self.catalogue_id = options['catalogue_id'].strip()
+        self.chunk_size = options.get('chunk_size', 1000)
 
         logger.info("CLI %r" % options)
 
@@ -35,4 +52,33 @@ class Command(BaseCommand):
             confirm = 'y' if options['confirm'] else input(f'Are you sure you want to delete {self.catalogue_id}? [y/N]')
             if confirm in ['y', 'Y', 'yes']:
                 logger.info(f'Deleting catalogue {self.catalogue_id}')
+                self.delete_genomes(catalogue)
                 catalogue.delete(using=self.database)
+
+    def delete_genomes(self, catalogue):
+        """
+        Delete the genomes of the catalogue in chunks of `chunk_size`, in genome_id order.
+        The rows of each chunk are deleted table by table with set-based deletes, one transaction per chunk,
+        so neither the memory used nor the time the tables are locked grow with the size of the catalogue.
+        """
+        genomes = emg_models.Genome.objects.using(self.database).prefetch_related(None) \
+            .filter(catalogue=catalogue).order_by('genome_id')
+        total = genomes.count()
+        dependents = genome_dependents()
+        deleted = 0
+        while True:
+            genome_ids = list(genomes.values_list('genome_id', flat=True)[:self.chunk_size])
+            if not genome_ids:
+                break
+            with transaction.atomic(using=self.database):
+                for model, field in dependents:
+                    model._base_manager.using(self.database) \
+                        .filter(**{field + '__in': genome_ids}) \
+                        .delete()
+                emg_models.Genome._base_manager.using(self.database).filter(genome_id__in=genome_ids).delete()
+                emg_models.AccessionAlias.objects.using(self.database) \
+                    .filter(entity_type=emg_models.Genome._meta.model_name, entity_id__in=genome_ids) \
+                    .delete()
+            deleted += len(genome_ids)
+            logger.info('Deleted {} of {} genomes ({:.0%}) of {}'.format(
+                deleted, total, deleted / total, self.catalogue_id))
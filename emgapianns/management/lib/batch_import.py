@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bookkeeping for the batch import of analyses (import_analyses):
+the accession list, and the per-accession status report.
+"""
+
+import csv
+import logging
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+BatchEntry = namedtuple('BatchEntry', ['accession', 'biome', 'library_strategy'])
+
+IMPORTED = 'imported'
+FAILED = 'failed'
+PENDING = 'pending'
+
+REPORT_COLUMNS = ['accession', 'study', 'status', 'stage', 'message']
+
+
+def read_accessions(lines, biome=None, library_strategy=None):
+    """
+    Parse an accession list.
+    Each line is an accession, optionally followed by the biome and library strategy (tab separated),
+    which default to `biome` and `library_strategy`. Blank lines and # comments are skipped,
+    and only the first occurrence of an accession is kept.
+    :return: list of BatchEntry
+    :raises ValueError: if the biome or library strategy of an accession is unknown
+    """
+    entries = OrderedDict()
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = [f.strip() for f in line.split('\t')]
+        fields += [None] * (3 - len(fields))
+        accession, entry_biome, entry_library_strategy = fields[:3]
+        entry = BatchEntry(accession, entry_biome or biome, entry_library_strategy or library_strategy)
+        if not entry.biome or not entry.library_strategy:
+            raise ValueError('Line {}: missing biome or library strategy for {}'.format(line_number, accession))
+        if accession in entries:
+            logger.warning('Skipping duplicate accession {} on line {}'.format(accession, line_number))
+            continue
+        entries[accession] = entry
+    return list(entries.values())
+
+
+class ImportReport(object):
+    """
+    Status of each accession of a batch import.
+    An accession is pending until it either failed (at the first stage that failed) or was imported.
+    """
+
+    def __init__(self, accessions):
+        self.rows = OrderedDict(
+            (accession, {'accession': accession, 'study': None, 'status': PENDING, 'stage': None, 'message': None})
+            for accession in accessions
+        )
+
+    def set_study(self, accession, study):
+        self.rows[accession]['study'] = study
+
+    def fail(self, accession, stage, error):
+        logger.error('Import of {} failed at {}: {!r}'.format(accession, stage, error))
+        self.rows[accession].update(status=FAILED, stage=stage, message=str(error) or repr(error))
+
+    def succeed(self, accession):
+        self.rows[accession].update(status=IMPORTED, stage=None, message=None)
+
+    def is_pending(self, accession):
+        return self.rows[accession]['status'] == PENDING
+
+    def pending(self):
+        return [a for a, row in self.rows.items() if row['status'] == PENDING]
+
+    def failed(self):
+        return [a for a, row in self.rows.items() if row['status'] == FAILED]
+
+    def write(self, stream):
+        writer = csv.DictWriter(stream, fieldnames=REPORT_COLUMNS, delimiter='\t', lineterminator='\n')
+        writer.writeheader()
+        for row in self.rows.values():
+            writer.writerow(row)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_KEY = b'emg.sources'
+
+
+class CountVectorCache(object):
+    """
+    On-disk cache of the per-analysis count vectors (the key and count columns
+    parsed from the result files of one analysis) the study summary matrices are built from.
+
+    Each vector is a Feather file, with the path, size and mtime of the
+    result files it was parsed from in its schema metadata.
+    A vector is only reused while all of its result files are unchanged.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def signature(sources):
+        """
+        The state of the result files, or None if one of them is missing.
+        """
+        signature = []
+        for source in sources:
+            try:
+                stat = os.stat(source)
+            except FileNotFoundError:
+                return None
+            signature.append([os.path.abspath(source), stat.st_size, stat.st_mtime_ns])
+        return signature
+
+    def _path(self, accession, sources):
+        sources_hash = hashlib.sha1('\n'.join(os.path.abspath(s) for s in sources).encode()).hexdigest()
+        return os.path.join(self.cache_dir, '{}_{}.arrow'.format(accession, sources_hash[:16]))
+
+    def get(self, accession, sources, signature):
+        """
+        The cached count vector of the analysis, or None if there is none
+        or the result files changed since it was cached.
+        """
+        if signature is None:
+            return None
+        try:
+            table = feather.read_table(self._path(accession, sources), memory_map=True)
+        except (FileNotFoundError, pa.ArrowException):
+            return None
+        metadata = table.schema.metadata or {}
+        if json.loads(metadata.get(SIGNATURE_KEY, b'null')) != signature:
+            return None
+        return table.to_pandas()
+
+    def put(self, accession, sources, signature, df):
+        """
+        Cache the count vector of the analysis.
+        :param signature: the state of the result files before they were parsed
+        """
+        if signature is None:
+            return
+        path = self._path(accession, sources)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except pa.ArrowException as e:
+            logger.warning('Could not cache the counts of {}: {}'.format(accession, e))
+            return
+        metadata = dict(table.schema.metadata or {})
+        metadata[SIGNATURE_KEY] = json.dumps(signature)
+        tmp_path = path + '.tmp'
+        feather.write_feather(table.replace_schema_metadata(metadata), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
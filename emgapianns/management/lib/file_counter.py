@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process line and sequence counters for (gzipped) result files,
+replacing the `zcat | wc -l` and `zcat | grep -c '>'` subprocesses.
+
+The files are decompressed in chunks and the newlines / FASTA headers
+are counted on the raw bytes. Counts are cached by path, size and mtime,
+so a file is only read again if it changed.
+"""
+
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    # Intel ISA-L backend, a lot faster than zlib when available
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# The counting is mostly I/O (and zlib releases the GIL), so threads are enough
+DEFAULT_WORKERS = 8
+
+
+def _open(filepath, compressed):
+    if compressed:
+        return gzip.open(filepath, 'rb')
+    return open(filepath, 'rb')
+
+
+def _chunks(filepath, compressed):
+    with _open(filepath, compressed) as f:
+        for chunk in iter(functools.partial(f.read, CHUNK_SIZE), b''):
+            yield chunk
+
+
+def _file_key(filepath):
+    stat = os.stat(filepath)
+    return os.path.realpath(filepath), stat.st_size, stat.st_mtime_ns
+
+
+@functools.lru_cache(maxsize=4096)
+def _count_lines(filepath, size, mtime, compressed):
+    return sum(chunk.count(b'\n') for chunk in _chunks(filepath, compressed))
+
+
+@functools.lru_cache(maxsize=4096)
+def _count_seqs(filepath, size, mtime):
+    count = 0
+    previous = b'\n'
+    for chunk in _chunks(filepath, compressed=True):
+        # headers split between two chunks are counted with the first byte of the chunk
+        count += chunk.count(b'\n>') + (previous == b'\n' and chunk[:1] == b'>')
+        previous = chunk[-1:]
+    return count
+
+
+def count_lines(filepath, compressed=False):
+    """Number of lines (newlines) in a file, like `wc -l`.
+    """
+    return _count_lines(*_file_key(filepath), compressed)
+
+
+def count_seqs(filepath):
+    """Number of sequences in a gzipped FASTA file,
+    or 0 if the file can't be read.
+    """
+    try:
+        return _count_seqs(*_file_key(filepath))
+    except (OSError, EOFError) as e:
+        logger.warning('Could not count the sequences of {}: {}'.format(filepath, e))
+        return 0
+
+
+def count_files(filepaths, counter, workers=DEFAULT_WORKERS, **kwargs):
+    """Count a list of files concurrently.
+    :param counter: count_lines or count_seqs
+    :return: dict of file path to count
+    """
+    filepaths = list(filepaths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = executor.map(lambda f: counter(f, **kwargs), filepaths)
+        return dict(zip(filepaths, counts))
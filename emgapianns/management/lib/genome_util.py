@@ -239,3 +239,106 @@ def find_catalogue_files(catalogue_dir):
 
 def get_genome_result_path(result_dir):
     return os.path.join('genomes', result_dir.split('genomes/')[-1])
+
+
+# (description label, file format, file name, download group, subdir, required)
+# file names are formatted with the genome accession
+GENOME_FILES = (
+    ('Predicted CDS (aa)', 'fasta', '{}.faa', 'Genome analysis', 'genome', True),
+    ('Nucleic Acid Sequence', 'fasta', '{}.fna', 'Genome analysis', 'genome', True),
+    ('Nucleic Acid Sequence index', 'fai', '{}.fna.fai', 'Genome analysis', 'genome', True),
+    ('Genome Annotation', 'gff', '{}.gff', 'Genome analysis', 'genome', True),
+    ('Genome antiSMASH Annotation', 'gff', '{}_antismash.gff', 'Genome analysis', 'genome', False),
+    ('Genome VIRify Annotation', 'gff', '{}_virify.gff', 'Genome analysis', 'genome', False),
+    ('Genome VIRify Regions', 'tsv', '{}_virify_metadata.tsv', 'Genome analysis', 'genome', False),
+    ('Genome SanntiS Annotation', 'gff', '{}_sanntis.gff', 'Genome analysis', 'genome', False),
+    ('EggNog annotation', 'tsv', '{}_eggNOG.tsv', 'Genome analysis', 'genome', False),
+    ('InterProScan annotation', 'tsv', '{}_InterProScan.tsv', 'Genome analysis', 'genome', False),
+    ('Genome rRNA Sequence', 'fasta', '{}_rRNAs.fasta', 'Genome analysis', 'genome', False),
+    # pipeline v2 files (if present):
+    ('Genome AMRFinderPlus Annotation', 'tsv', '{}_amrfinderplus.tsv', 'Genome analysis', 'genome', False),
+    ('Genome CRISPRCasFinder Annotation', 'gff', '{}_crisprcasfinder.gff', 'Genome analysis', 'genome', False),
+    ('Genome CRISPRCasFinder Additional Records', 'tsv', '{}_crisprcasfinder.tsv', 'Genome analysis', 'genome',
+     False),
+    ('Genome Mobilome Annotation', 'gff', '{}_mobilome.gff', 'Genome analysis', 'genome', False),
+    # pipeline v2.4.0 files (if not empty):
+    ('Genome dbCAN Annotation', 'gff', '{}_dbcan.gff', 'Genome analysis', 'genome', False),
+    ('Genome Defense Finder Annotation', 'gff', '{}_defense_finder.gff', 'Genome analysis', 'genome', False),
+    ('Genome GECCO Annotation', 'gff', '{}_gecco.gff', 'Genome analysis', 'genome', False),
+    ('KEGG Pathway Completeness', 'tsv', '{}_kegg_pathways.tsv', 'Genome analysis', 'genome', False),
+)
+
+PANGENOME_FILES = (
+    ('Pangenome core genes list', 'tab', 'core_genes.txt', 'Pan-Genome analysis', 'pan-genome', False),
+    ('Pangenome DNA sequence', 'fasta', 'pan-genome.fna', 'Pan-Genome analysis', 'pan-genome', False),
+    ('Gene Presence / Absence matrix', 'tsv', 'gene_presence_absence.Rtab', 'Pan-Genome analysis', 'pan-genome',
+     False),
+    ('Gene Presence / Absence list', 'csv', 'gene_presence_absence.csv', 'Pan-Genome analysis', 'pan-genome', False),
+    ('Pairwise Mash distances of conspecific genomes', 'nwk', 'mashtree.nwk', 'Pan-Genome analysis', 'pan-genome',
+     False),
+)
+
+
+def read_counts(fs, key):
+    """(key, count) pairs of a genome summary TSV, e.g. the COG_category and Counts columns of the COG summary.
+    """
+    return [(row[key], int(row['Counts'])) for row in read_tsv_w_headers(fs)]
+
+
+def read_antismash_geneclusters(fs):
+    """(cluster, number of features) pairs of an antiSMASH geneclusters.txt, or None if the genome has none.
+    """
+    if not os.path.exists(fs):
+        return None
+    counts = {}
+    with open(fs, 'rt') as tsv:
+        for row in tsv:
+            *_, cluster, features, _ = row.split('\t')
+            counts[cluster] = len(features.split(';')) if len(features) else 0
+    return list(counts.items())
+
+
+def find_genome_files(genome_dir, accession, has_pangenome):
+    """
+    The downloadable files of a genome that exist and are not empty.
+    :return: list of (description label, file format, file name, download group, subdir)
+    :raises FileNotFoundError: if a required file is missing or empty
+    """
+    files = []
+    specs = [(label, fmt, name.format(accession), group, subdir, required)
+             for label, fmt, name, group, subdir, required in GENOME_FILES]
+    if has_pangenome:
+        specs += PANGENOME_FILES
+    for label, fmt, name, group, subdir, required in specs:
+        path = os.path.join(genome_dir, subdir, name)
+        if not (os.path.isfile(path) and os.path.getsize(path) > 0):
+            if required:
+                raise FileNotFoundError(f"Required file at {path} either missing or empty")
+            logger.warning(f"File not found or empty at {path}. This is allowable, but will not be uploaded.")
+            continue
+        files.append((label, fmt, name, group, subdir))
+    return files
+
+
+def read_genome_results(genome_dir, metadata_only=False):
+    """
+    Read everything import_genomes loads from a genome directory. Only touches the file system,
+    so it can run on a process pool.
+    :return: dict with the genome JSON `data` and, unless metadata_only, the COG / KEGG class /
+        KEGG module / antiSMASH counts and the downloadable `files`
+    """
+    data = read_json(os.path.join(genome_dir, f'{apparent_accession_of_genome_dir(genome_dir)}.json'))
+    results = {'directory': genome_dir, 'data': data}
+    if metadata_only:
+        return results
+
+    accession = data['accession']
+    summary_dir = os.path.join(genome_dir, 'genome')
+    results['cog_counts'] = read_counts(os.path.join(summary_dir, f'{accession}_cog_summary.tsv'), 'COG_category')
+    results['kegg_class_counts'] = read_counts(
+        os.path.join(summary_dir, f'{accession}_kegg_classes.tsv'), 'KEGG_class')
+    results['kegg_module_counts'] = read_counts(
+        os.path.join(summary_dir, f'{accession}_kegg_modules.tsv'), 'KEGG_module')
+    results['antismash_counts'] = read_antismash_geneclusters(os.path.join(summary_dir, 'geneclusters.txt'))
+    results['files'] = find_genome_files(genome_dir, accession, 'pangenome' in data)
+    return results
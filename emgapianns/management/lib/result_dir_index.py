@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent index of the result directories of the results archive,
+so import_analysis can resolve study -> version -> run directories
+with a lookup rather than walking the archive with `find`.
+
+The archive layout is <rootpath>/<year>/<month>/<study>/version_<version>/.../<run>,
+with the run directories at most 3 levels below the version directory.
+The index is a SQLite file. Each study directory is stored with the mtimes
+of the directories that were listed to index it, and only rescanned when one of them changed
+(creating or removing an entry changes the mtime of its parent directory).
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Same depths as the `find` calls of import_analysis
+STUDY_DIR_MAXDEPTH = 3
+RUN_DIR_MAXDEPTH = 3
+STUDY_DIR_PATTERN = re.compile(r'^([EDS]RP\d+)')
+RUN_DIR_PATTERN = re.compile(r'^[EDS]R[RZ]\d+')
+VERSION_DIR_PREFIX = 'version_'
+# Result folders of the assembly pipeline, never analysis result directories
+EXCLUDED_DIR = 'assemblies'
+
+DEFAULT_WORKERS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS study_dirs (
+    path TEXT PRIMARY KEY,
+    accession TEXT NOT NULL,
+    mtimes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS study_dirs_accession ON study_dirs (accession);
+CREATE TABLE IF NOT EXISTS result_dirs (
+    study_path TEXT NOT NULL REFERENCES study_dirs (path) ON DELETE CASCADE,
+    version TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_dirs_lookup ON result_dirs (study_path, version, name);
+"""
+
+
+def _subdirs(directory):
+    try:
+        with os.scandir(directory) as entries:
+            return [e for e in entries if e.is_dir(follow_symlinks=False)]
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return []
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def find_study_dirs(rootpath, maxdepth=STUDY_DIR_MAXDEPTH):
+    """Study directories at most `maxdepth` levels below rootpath.
+    """
+    study_dirs = []
+    level = [rootpath]
+    for _ in range(maxdepth):
+        next_level = []
+        for directory in level:
+            for entry in _subdirs(directory):
+                if EXCLUDED_DIR in entry.name:
+                    continue
+                if STUDY_DIR_PATTERN.match(entry.name):
+                    study_dirs.append(entry.path)
+                else:
+                    next_level.append(entry.path)
+        level = next_level
+    return study_dirs
+
+
+def scan_study_dir(study_dir, maxdepth=RUN_DIR_MAXDEPTH):
+    """List the result directories of a study directory.
+    :return: (list of (version, name, path), dict of the mtimes of the listed directories)
+    """
+    result_dirs = []
+    mtimes = {study_dir: _mtime(study_dir)}
+    for version_dir in _subdirs(study_dir):
+        if not version_dir.name.startswith(VERSION_DIR_PREFIX):
+            continue
+        version = version_dir.name[len(VERSION_DIR_PREFIX):]
+        level = [version_dir.path]
+        for _ in range(maxdepth):
+            next_level = []
+            for directory in level:
+                mtimes[directory] = _mtime(directory)
+                for entry in _subdirs(directory):
+                    if EXCLUDED_DIR in entry.name:
+                        continue
+                    if RUN_DIR_PATTERN.match(entry.name):
+                        result_dirs.append((version, entry.name, entry.path))
+                    next_level.append(entry.path)
+            level = next_level
+    return result_dirs, mtimes
+
+
+class ResultDirIndex(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _stored_mtimes(self):
+        return dict(
+            (path, json.loads(mtimes))
+            for path, mtimes in self.connection.execute('SELECT path, mtimes FROM study_dirs')
+        )
+
+    @staticmethod
+    def _is_stale(mtimes):
+        return mtimes is None or any(_mtime(path) != mtime for path, mtime in mtimes.items())
+
+    def update(self, rootpath, workers=DEFAULT_WORKERS, full=False):
+        """
+        Index the study directories of rootpath that are new or changed since the last update
+        (all of them if `full`) and drop the ones that no longer exist.
+        The directories are listed on a pool of `workers` threads, as listing is I/O bound.
+        :return: the number of (re)scanned study directories
+        """
+        rootpath = os.path.abspath(rootpath)
+        stored = self._stored_mtimes()
+        study_dirs = find_study_dirs(rootpath)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stale = [
+                study_dir for study_dir, is_stale in zip(
+                    study_dirs,
+                    executor.map(lambda d: full or self._is_stale(stored.get(d)), study_dirs)
+                ) if is_stale
+            ]
+            logger.info('Scanning {} of {} study directories...'.format(len(stale), len(study_dirs)))
+            scans = executor.map(scan_study_dir, stale)
+
+            with self.connection:
+                removed = set(stored) - set(study_dirs)
+                self.connection.executemany('DELETE FROM study_dirs WHERE path = ?', [(p,) for p in removed])
+                for study_dir, (result_dirs, mtimes) in zip(stale, scans):
+                    self.connection.execute('DELETE FROM study_dirs WHERE path = ?', (study_dir,))
+                    self.connection.execute(
+                        'INSERT INTO study_dirs (path, accession, mtimes) VALUES (?, ?, ?)',
+                        (study_dir, STUDY_DIR_PATTERN.match(os.path.basename(study_dir)).group(1), json.dumps(mtimes))
+                    )
+                    self.connection.executemany(
+                        'INSERT INTO result_dirs (study_path, version, name, path) VALUES (?, ?, ?, ?)',
+                        [(study_dir, version, name, path) for version, name, path in result_dirs]
+                    )
+        return len(stale)
+
+    def find_study_dirs(self, secondary_study_accession):
+        return [
+            path for path, in self.connection.execute(
+                'SELECT path FROM study_dirs WHERE accession = ? ORDER BY path', (secondary_study_accession,)
+            )
+        ]
+
+    def find_result_dirs(self, secondary_study_accession, run_accession, version):
+        """
+        The result directories of a run/assembly, matched like `find -name '<run_accession>*'`.
+        Directories that no longer exist are left out.
+        """
+        rows = self.connection.execute(
+            'SELECT r.path FROM result_dirs r JOIN study_dirs s ON r.study_path = s.path '
+            'WHERE s.accession = ? AND r.version = ? AND substr(r.name, 1, ?) = ? ORDER BY r.path',
+            (secondary_study_accession, version, len(run_accession), run_accession)
+        )
+        return [path for path, in rows if os.path.isdir(path)]
@@ -15,15 +15,17 @@
 # limitations under the License.
 
 import glob
+import json
 import os
-from subprocess import check_output, CalledProcessError
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
 
 import logging
 
 from emgapianns.management.lib.uploader_exceptions import NoAnnotationsFoundException, \
     UnexpectedLibraryStrategyException, QCNotPassedException, CoverageCheckException
-from emgapianns.management.lib import utils
+from emgapianns.management.lib import file_counter, utils
 from emgapianns.management.webuploader_configs import get_downloadset_config
 
 BACKLOG_CONFIG = os.environ.get('BACKLOG_CONFIG')
@@ -61,6 +63,63 @@ def get_result_status(db_name, accession):
         return result_status[0][0]
 
 
+class SanityCheckManifest:
+    """
+    Persisted results of the content checks (line and sequence counts) of a result directory,
+    so that re-running the sanity check only decompresses the files that changed.
+    The counts are keyed by file path and reused while the file size and mtime are the same.
+    """
+    FILENAME = '.sanity_check.json'
+
+    def __init__(self, result_dir):
+        self.path = os.path.join(result_dir, self.FILENAME)
+        self.lock = threading.Lock()
+        self.changed = False
+        try:
+            with open(self.path) as f:
+                self.counts = json.load(f).get('counts', {})
+        except (OSError, ValueError):
+            self.counts = {}
+
+    @staticmethod
+    def _key(kind, filepath):
+        return '{}:{}'.format(kind, os.path.abspath(filepath))
+
+    @staticmethod
+    def _state(filepath):
+        stat = os.stat(filepath)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def count(self, kind, filepath, counter):
+        """
+            The count of the file from the manifest, or from counter(filepath) if the file changed.
+        :return:
+        """
+        key = self._key(kind, filepath)
+        state = self._state(filepath)
+        cached = self.counts.get(key)
+        if cached and cached[:2] == state:
+            logging.info("Reusing the {} of unchanged file {}".format(kind, filepath))
+            return cached[2]
+        count = counter(filepath)
+        with self.lock:
+            self.counts[key] = state + [count]
+            self.changed = True
+        return count
+
+    def save(self):
+        if not self.changed:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'counts': self.counts}, f)
+            os.replace(tmp_path, self.path)
+            self.changed = False
+        except OSError as e:
+            logging.warning("Could not save the sanity check manifest {}: {}".format(self.path, e))
+
+
 class SanityCheck:
     QC_NOT_PASSED_V4 = 'no-seqs-passed-qc-flag'
     QC_NOT_PASSED_V5 = 'QC-FAILED'
@@ -69,13 +128,16 @@ class SanityCheck:
     MIN_NUM_LINES = 3
     failed_statuses = ['no_cds', 'no_tax', 'no_qc', 'no_cds_tax']
 
-    def __init__(self, accession, d, library_strategy, version, result_status=None, emg_db='default'):
+    def __init__(self, accession, d, library_strategy, version, result_status=None, emg_db='default',
+                 workers=file_counter.DEFAULT_WORKERS, use_manifest=False):
         self.dir = d
         self.prefix = os.path.basename(d)
         self.accession = accession
         self.library_strategy = library_strategy.lower()
         self.version = version
         self.emg_db = emg_db
+        self.workers = workers
+        self.manifest = SanityCheckManifest(d) if use_manifest else None
         if self.library_strategy not in self.EXPECTED_LIBRARY_STRATEGIES:
             raise UnexpectedLibraryStrategyException(
                 'Unexpected library_strategy specified: {}'.format(self.library_strategy))
@@ -93,17 +155,13 @@ class SanityCheck:
             logging.info("Found no-antismash flag! Skipping check of antiSMASH result files.")
             skip_antismash_check = True
 
-        for f in self.config:
-            if 'antismash' in f and skip_antismash_check:
+        file_configs = [f for f in self.config if not ('antismash' in f and skip_antismash_check)]
+        # the files are looked up concurrently, the first missing required file is reported
+        for f, error in zip(file_configs, self.__run_concurrently(self.__check_config_file, file_configs)):
+            if error is None:
                 continue
-            try:
-                if f['_chunked']:
-                    self.__check_chunked_file(f)
-                else:
-                    self.__check_file(f)
-            except FileNotFoundError as e:
-                if f['_required']:
-                    raise e
+            if not isinstance(error, FileNotFoundError) or f['_required']:
+                raise error
 
     def run_quality_control_check(self):
         if self.version == '5.0':
@@ -135,40 +193,68 @@ class SanityCheck:
             logging.info('{} found. Skipping coverage check'.format(self.result_status))
             return
 
-        # For amplicons the requirement is that only of the files need to exist
-        elif self.library_strategy == "assembly":  # assembly
-            return self.run_coverage_check_assembly()
-        else: # wgs or rna-seq
-            return self.run_coverage_check_wgs()
+        try:
+            # For amplicons the requirement is that only of the files need to exist
+            if self.library_strategy == "assembly":  # assembly
+                return self.run_coverage_check_assembly()
+            else: # wgs or rna-seq
+                return self.run_coverage_check_wgs()
+        finally:
+            # keep the counts of the files that were checked, even if the check failed
+            self.save_manifest()
 
-    @staticmethod
-    def __count_number_of_lines(filepath, compressed_file=False):
+    def save_manifest(self):
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def __run_concurrently(self, func, items):
+        """
+            Runs func on every item on a thread pool.
+        :return: the exception raised for each item, or None
+        """
+        def run(item):
+            try:
+                func(item)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(run, items))
+
+    def __check_config_file(self, file_config, coverage_check=False):
+        if file_config['_chunked']:
+            self.__check_chunked_file(file_config, coverage_check=coverage_check)
+        else:
+            self.__check_file(file_config, coverage_check=coverage_check)
+
+    def __count(self, kind, filepath, counter):
+        if self.manifest is not None:
+            return self.manifest.count(kind, filepath, counter)
+        return counter(filepath)
+
+    def __count_number_of_lines(self, filepath, compressed_file=False):
         """
             Counts number of lines in text file.
         :return:
         """
         if compressed_file:
             logging.info("Counting number of lines for compressed file {}".format(filepath))
-            count = check_output("zcat {} | wc -l".format(filepath), shell=True).rstrip()
+            count = self.__count('lines', filepath, lambda f: file_counter.count_lines(f, compressed=True))
         else:
             logging.info("Counting number of lines for uncompressed file {}".format(filepath))
-            count = check_output("wc -l < {}".format(filepath), shell=True).rstrip()
+            count = self.__count('uncompressed_lines', filepath, file_counter.count_lines)
         logging.info("Result: File contains {} lines.".format(count))
-        return int(count)
+        return count
 
-    @staticmethod
-    def __count_number_of_seqs(filepath):
+    def __count_number_of_seqs(self, filepath):
         """
             Counts number of sequences in compressed fasta file.
         :return:
         """
-        try:
-            logging.info("Counting number of sequences for compressed file {}".format(filepath))
-            count = check_output("zcat {} | grep -c '>'".format(filepath), shell=True).rstrip()
-            logging.info("Result: File contains {} sequences.".format(count))
-            return int(count)
-        except CalledProcessError:
-            return 0
+        logging.info("Counting number of sequences for compressed file {}".format(filepath))
+        count = self.__count('seqs', filepath, file_counter.count_seqs)
+        logging.info("Result: File contains {} sequences.".format(count))
+        return count
 
     def __check_chunked_file(self, file_config, coverage_check=False):
         chunk_file = file_config['chunk_file']
@@ -176,11 +262,13 @@ class SanityCheck:
             chunk_file = chunk_file.format(self.prefix)
         chunk_filepath = self.get_filepath(file_config, chunk_file)
         chunks = utils.read_chunkfile(chunk_filepath)
-        for f in chunks:
-            filepath = self.get_filepath(file_config, f)
+        filepaths = [self.get_filepath(file_config, f) for f in chunks]
+        for filepath in filepaths:
             self.__check_exists(filepath)
-            if coverage_check:
-                self.__check_file_content(filepath)
+        if coverage_check:
+            # the chunks are decompressed and counted concurrently
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                list(executor.map(self.__check_file_content, filepaths))
 
     def get_filepath(self, file_config, filename):
         if file_config['subdir']:
@@ -258,23 +346,18 @@ class SanityCheck:
         if not os.path.exists(taxa_folder) and self.result_status not in ['no_tax', 'no_cds_tax']:
             raise CoverageCheckException("Could not find the taxonomy output folder: {}!".format(taxa_folder))
 
-        for f in self.config:
-            if 'coverage_check' in f:
-                try:
-                    if f['_chunked']:
-                        logging.info("Processing chunked file {}".format(f['description_label']))
-                        self.__check_chunked_file(f, coverage_check=True)
-                    else:
-                        logging.info("Processing unchunked file {}".format(f['description_label']))
-                        self.__check_file(f, coverage_check=True)
-                except FileNotFoundError:
-                    # Label as coverage check NOT passed
-                    raise CoverageCheckException("Could not find file for: "
-                                                 "{}".format(f['description_label']))
-                except NoAnnotationsFoundException:
-                    # Label as coverage check NOT passed
-                    raise CoverageCheckException("Could not find any annotations in the output file for: "
-                                    "{}".format(f['description_label']))
+        file_configs = [f for f in self.config if 'coverage_check' in f]
+        for f, error in zip(file_configs, self.__run_concurrently(self.__check_coverage, file_configs)):
+            if isinstance(error, FileNotFoundError):
+                # Label as coverage check NOT passed
+                raise CoverageCheckException("Could not find file for: "
+                                             "{}".format(f['description_label']))
+            elif isinstance(error, NoAnnotationsFoundException):
+                # Label as coverage check NOT passed
+                raise CoverageCheckException("Could not find any annotations in the output file for: "
+                                             "{}".format(f['description_label']))
+            elif error is not None:
+                raise error
 
     def run_coverage_check_wgs(self):
         """
@@ -290,17 +373,17 @@ class SanityCheck:
         if not os.path.exists(taxa_folder) and self.result_status not in ['no_tax', 'no_cds_tax']:
             raise CoverageCheckException("Could not find the taxonomy output folder: {}!".format(taxa_folder))
             
-        for f in self.config:
-            if 'coverage_check' in f:
-                try:
-                    if f['_chunked']:
-                        self.__check_chunked_file(f, coverage_check=True)
-                    else:
-                        self.__check_file(f, coverage_check=True)
-                except FileNotFoundError:
-                    # Label as coverage check NOT passed
-                    raise CoverageCheckException("{} did not pass coverage check step!".format(self.accession))
+        file_configs = [f for f in self.config if 'coverage_check' in f]
+        for error in self.__run_concurrently(self.__check_coverage, file_configs):
+            if isinstance(error, (FileNotFoundError, NoAnnotationsFoundException)):
+                # Label as coverage check NOT passed
+                raise CoverageCheckException("{} did not pass coverage check step!".format(self.accession))
+            elif error is not None:
+                raise error
 
-                except NoAnnotationsFoundException:
-                    # Label as coverage check NOT passed
-                    raise CoverageCheckException("{} did not pass coverage check step!".format(self.accession))
+    def __check_coverage(self, file_config):
+        if file_config['_chunked']:
+            logging.info("Processing chunked file {}".format(file_config['description_label']))
+        else:
+            logging.info("Processing unchunked file {}".format(file_config['description_label']))
+        self.__check_config_file(file_config, coverage_check=True)
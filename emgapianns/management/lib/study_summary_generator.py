@@ -1,10 +1,10 @@
 import collections
 import logging
 import os
-import subprocess
 import sys
+from contextlib import contextmanager
+from itertools import repeat
 from pathlib import Path
-from subprocess import check_output, CalledProcessError
 
 import numpy as np
 import pandas as pd
@@ -12,20 +12,27 @@ from django.db.models import Q
 from django.db import close_old_connections
 
 from emgapi import models as emg_models
-from emgapianns.management.lib import utils
+from emgapi.columnar import matrix_path, write_matrix
+from emgapianns.management.lib import file_counter, utils
+from emgapianns.management.lib.count_vector_cache import CountVectorCache
 from emgapianns.management.lib.utils import DownloadFileDatabaseHandler
 
 
 class StudySummaryGenerator(object):
-    def __init__(self, accession, pipeline, rootpath, database):
+    MAPSEQ_COLUMN_MAPPER = {'SSU': 'SILVA', 'LSU': 'SILVA', 'unite': 'UNITE', 'itsonedb': 'ITSone'}
+
+    def __init__(self, accession, pipeline, rootpath, database, workers=1, use_cache=True):
         self.study_accession = accession
         self.pipeline = pipeline
         self.rootpath = rootpath
         self.emg_db_name = database
+        self.workers = workers
+        self.executor = None
+        self.use_cache = use_cache
+        self.cache = None
         self.study = emg_models.Study.objects.using(self.emg_db_name).get(secondary_accession=self.study_accession)
         self.study_result_dir = os.path.join(self.rootpath, self.study.result_directory)
         self.summary_dir = None
-        self.MAPSEQ_COLUMN_MAPPER = {'SSU': 'SILVA', 'LSU': 'SILVA', 'unite': 'UNITE', 'itsonedb': 'ITSone'}
 
     def run(self):
         if not os.path.exists(self.study_result_dir):
@@ -49,23 +56,47 @@ class StudySummaryGenerator(object):
 
         self.summary_dir = os.path.join(self.study_result_dir, 'version_{}/project-summary'.format(self.pipeline))
         self.create_summary_dir()
-
-        for rna_types in self.MAPSEQ_COLUMN_MAPPER.keys():
-            self.generate_taxonomy_phylum_summary(analysis_jobs, self.pipeline, '{}'.format(rna_types),
-                                                  'phylum_taxonomy_abundances_{}_v{}.tsv'.format(rna_types,
-                                                                                                 self.pipeline))
-            self.generate_taxonomy_summary(analysis_jobs, '{}'.format(rna_types),
-                                           'taxonomy_abundances_{}_v{}.tsv'.format(rna_types, self.pipeline))
-
-        if len(experiment_types) == 1 and 'amplicon' in experiment_types:
-            logging.info("AMPLICON datasets only! Skipping the generation of the functional matrix files!")
-        else:
-            self.generate_ipr_summary(analysis_jobs, 'IPR_abundances_v{}.tsv'.format(self.pipeline), self.pipeline)
-            self.generate_go_summary(analysis_jobs, 'slim', self.pipeline)
-            self.generate_go_summary(analysis_jobs, 'full', self.pipeline)
+        if self.use_cache:
+            self.cache = CountVectorCache(
+                os.path.join(self.study_result_dir, 'version_{}/project-summary-cache'.format(self.pipeline)))
+
+        with self.process_pool():
+            for rna_types in self.MAPSEQ_COLUMN_MAPPER.keys():
+                self.generate_taxonomy_phylum_summary(analysis_jobs, self.pipeline, '{}'.format(rna_types),
+                                                      'phylum_taxonomy_abundances_{}_v{}.tsv'.format(rna_types,
+                                                                                                     self.pipeline))
+                self.generate_taxonomy_summary(analysis_jobs, '{}'.format(rna_types),
+                                               'taxonomy_abundances_{}_v{}.tsv'.format(rna_types, self.pipeline))
+
+            if len(experiment_types) == 1 and 'amplicon' in experiment_types:
+                logging.info("AMPLICON datasets only! Skipping the generation of the functional matrix files!")
+            else:
+                self.generate_ipr_summary(analysis_jobs, 'IPR_abundances_v{}.tsv'.format(self.pipeline),
+                                          self.pipeline)
+                self.generate_go_summary(analysis_jobs, 'slim', self.pipeline)
+                self.generate_go_summary(analysis_jobs, 'full', self.pipeline)
 
         logging.info("Program finished successfully.")
 
+    @contextmanager
+    def process_pool(self):
+        """Parse the per-analysis result files on a pool of `workers` processes.
+        """
+        with utils.process_pool(self.workers) as executor:
+            self.executor = executor
+            try:
+                yield
+            finally:
+                self.executor = None
+
+    def map_analyses(self, func, *iterables):
+        """Apply func to the result files of each analysis, on the process pool if there is one.
+        func and its arguments must be picklable.
+        """
+        if self.executor is not None:
+            return list(self.executor.map(func, *iterables))
+        return list(map(func, *iterables))
+
     @staticmethod
     def _get_group_type(rna_type):
         group = None
@@ -131,26 +162,31 @@ class StudySummaryGenerator(object):
         return study_df
 
     def generate_taxonomy_phylum_summary_v5(self, analysis_jobs, rna_type):
-        job_data_frames = dict()
-        # Iterate over each run
+        # Find the sequence and mapseq result files of every run
+        analysis_files = list()
         for acc, result_directory in analysis_jobs.items():
-            # Define results files and for each result file perform necessary operations
             if rna_type in ['unite', 'itsonedb']:
                 sequence_file = self.__get_rna_fasta_file(result_directory, 'ITS_masked.fasta.gz')
             else:  # for SILVA: LSU and SSU
                 sequence_file = self.__get_rna_fasta_file(result_directory, '{}.fasta.gz'.format(rna_type))
             if not sequence_file:
                 continue
-            num_rna_seqs = self.__count_number_of_seqs(sequence_file)
-            #
             mapseq_result_file = self.__get_mapseq_result_file(acc, result_directory, rna_type, '.fasta.mseq.gz')
             if not mapseq_result_file:
                 continue
-            phylum_count_data = self.__parse_phylum_counts_v5(mapseq_result_file, num_rna_seqs, rna_type)
-
-            job_df = self.__build_dataframe(phylum_count_data)
-            job_data_frames[acc] = job_df
-
+            analysis_files.append((acc, [mapseq_result_file, sequence_file]))
+
+        def parse(analyses):
+            # count the sequences concurrently, then parse the mapseq results of each run
+            seqs_counts = file_counter.count_files([files[1] for _, files in analyses], file_counter.count_seqs)
+            return self.map_analyses(
+                self.phylum_count_vector_v5,
+                [files[0] for _, files in analyses],
+                [seqs_counts[files[1]] for _, files in analyses],
+                repeat(rna_type)
+            )
+
+        job_data_frames = dict(self.count_vectors(analysis_files, parse))
         study_df = self.merge_dfs_v5(job_data_frames, key=['superkingdom', 'kingdom', 'phylum'])
 
         return study_df
@@ -169,7 +205,7 @@ class StudySummaryGenerator(object):
         study_df = study_df.rename(columns={'lineage': '#SampleID'})
 
         if len(study_df.index) > 0:
-            self.write_results_file(study_df, filename)
+            self.write_results_file(study_df, filename, columnar=True)
 
             alias = '{}_taxonomy_abundances_{}_v{}.tsv'.format(self.study_accession, rna_type, self.pipeline)
             description = self._get_abundance_file_description(rna_type)
@@ -181,56 +217,108 @@ class StudySummaryGenerator(object):
         return [str(p.resolve()) for p in paths]
 
     def merge_dfs_v5(self, dataframes, key):
-        study_df = pd.DataFrame(columns=key)
-
-        for accession, df in dataframes.items():
-            df = df.filter(key + ['count'])
-            df = df.rename(columns={'count': accession})
-            study_df = study_df.merge(df, on=key, how='outer')
-        study_df = study_df.sort_values(by=key)
-        study_df = self.clean_summary_df(study_df)
-        return study_df
+        return self.pivot_count_dfs(dataframes.items(), key)
 
     def merge_dfs(self, filelist, delimiter, key, raw_cols, skip_rows=0):
-        study_df = pd.DataFrame(columns=key)
-
-        for f in sorted(filelist):
-            accession = utils.get_accession_from_result_dir_path(f)
-            df = self.read_count_tsv(f, delimiter, raw_cols, skip_rows)
-            df = df.filter(key + ['count'])
-            df = df.rename(columns={'count': accession})
-            study_df = study_df.merge(df, on=key, how='outer')
+        analysis_files = [(utils.get_accession_from_result_dir_path(f), [f]) for f in sorted(filelist)]
+
+        def parse(analyses):
+            return self.map_analyses(
+                self.read_count_vector, [files[0] for _, files in analyses],
+                repeat(delimiter), repeat(raw_cols), repeat(key), repeat(skip_rows)
+            )
+
+        return self.pivot_count_dfs(self.count_vectors(analysis_files, parse), key)
+
+    def count_vectors(self, analysis_files, parse):
+        """Count vectors (key and count columns) of each analysis.
+        With a cache, only the analyses whose result files are new or changed are parsed.
+        :param analysis_files: list of (accession, result files of the analysis)
+        :param parse: function parsing a list of (accession, result files) into their count vectors
+        :return: list of (accession, count vector), in the order of analysis_files
+        """
+        vectors = [None] * len(analysis_files)
+        signatures = [None] * len(analysis_files)
+        if self.cache is not None:
+            for i, (accession, files) in enumerate(analysis_files):
+                signatures[i] = self.cache.signature(files)
+                vectors[i] = self.cache.get(accession, files, signatures[i])
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if self.cache is not None:
+            logging.info("Reusing the cached counts of {} analyses, parsing {} analyses.".format(
+                len(analysis_files) - len(missing), len(missing)))
+        if missing:
+            parsed = parse([analysis_files[i] for i in missing])
+            for i, vector in zip(missing, parsed):
+                vectors[i] = vector
+                if self.cache is not None:
+                    accession, files = analysis_files[i]
+                    self.cache.put(accession, files, signatures[i], vector)
+        return [(accession, vector) for (accession, _), vector in zip(analysis_files, vectors)]
+
+    def pivot_count_dfs(self, dataframes, key):
+        """Build the study matrix (one row per key, one column per analysis)
+        from (accession, counts DataFrame) pairs.
+        The counts are stacked into a single long (key, analysis, count) table
+        which is pivoted once, rather than outer-merging one analysis at a time.
+        """
+        analysis_col = '__analysis__'
+        accessions = []
+        long_dfs = []
+        for accession, df in dataframes:
+            accessions.append(accession)
+            long_dfs.append(df.filter(key + ['count']).assign(**{analysis_col: accession}))
+
+        if not long_dfs:
+            study_df = pd.DataFrame(columns=key)
+        else:
+            long_df = pd.concat(long_dfs, ignore_index=True)
+            study_df = long_df.groupby(key + [analysis_col], dropna=False, sort=False)['count'].sum() \
+                .unstack(analysis_col) \
+                .reindex(columns=accessions) \
+                .reset_index()
+            study_df.columns.name = None
         study_df = study_df.sort_values(by=key)
         study_df = self.clean_summary_df(study_df)
         return study_df
 
-    def __parse_phylum_counts_v5(self, mapseq_file, num_rna_seqs, rna_type, delimiter='\t', compression='gzip',
-                                 header=1):
+    @classmethod
+    def parse_phylum_counts_v5(cls, mapseq_file, num_rna_seqs, rna_type, delimiter='\t', compression='gzip',
+                               header=1, chunk_size=100000):
         """
             Get phylum counts for v5 results.
 
             Implementation of the following linux command using pandas dataframe and collections:
             zcat SRR6028649_MERGED_FASTQ_SSU.fasta.mseq.gz | grep -v "^#" | cut -f 14- | cut -d ";" -f 1-3 | sed 's/\t$//' | sed 's/;p__$//' | sed 's/;k__$//' | sort | uniq -c
+
+            Only the taxonomy column is read, in chunks of chunk_size rows.
+            The lineages are truncated per chunk with vectorised string operations,
+            and normalised once per distinct lineage.
         :return:
         """
         unassigned = 'Unassigned'
         # column header keywords: UNITE, ITSone, SILVA
-        column_name = self.MAPSEQ_COLUMN_MAPPER.get(rna_type)
-        # Fixme: Replace pandas dataframe read csv function by pure python and introduce buffered reading
-        df = pd.read_csv(mapseq_file, compression=compression, header=header, sep=delimiter)
-        filtered_df = df.dropna(subset=[column_name])
-        taxonomies = list()
-        for i, row in filtered_df.iterrows():
-            value = filtered_df.at[i, column_name]
-            index = value.find(";c__")
-            if index > 0:
-                value = value[0:index]
-            value = self.normalize_taxa_hierarchy(value)
-            taxonomies.append(value)
+        column_name = cls.MAPSEQ_COLUMN_MAPPER.get(rna_type)
+        reader = pd.read_csv(mapseq_file, compression=compression, header=header, sep=delimiter,
+                             usecols=[column_name], dtype=str, chunksize=chunk_size)
+        lineage_counts = collections.Counter()
+        num_assigned_seqs = 0
+        for chunk in reader:
+            lineages = chunk[column_name].dropna()
+            num_assigned_seqs += len(lineages)
+            # drop everything from the class level (";c__") onwards
+            truncated = lineages.str.split(';c__', n=1).str[0]
+            lineages = truncated.where(lineages.str.find(';c__') > 0, lineages)
+            lineage_counts.update(lineages.value_counts(sort=False).to_dict())
+
+        phylum_counts = collections.Counter()
+        for lineage, count in lineage_counts.items():
+            phylum_counts[cls.normalize_taxa_hierarchy(lineage)] += count
 
         counter = 1
         data = dict()
-        for phylum, count in collections.Counter(taxonomies).items():
+        for phylum, count in phylum_counts.items():
             new_columns = phylum.split(';')
             while len(new_columns) < 3:
                 new_columns.append(unassigned)
@@ -238,13 +326,11 @@ class StudySummaryGenerator(object):
             data[counter] = new_columns
             counter += 1
 
-        num_assigned_seqs = filtered_df[column_name].count()
         num_unassigned_seqs = num_rna_seqs - num_assigned_seqs
         if num_unassigned_seqs > 0:
             data[counter] = [unassigned, unassigned, unassigned, num_unassigned_seqs]
         return data
 
-
     def generate_go_summary_v4(self, analysis_result_dirs, mode):
         res_files = self.get_go_v4_result_files(analysis_result_dirs, mode)
         study_df = self.merge_dfs(res_files, delimiter=',',
@@ -288,7 +374,7 @@ class StudySummaryGenerator(object):
             logging.warning("Pipeline version {} not supported yet!".format(version))
 
         if not study_df.empty:
-            self.write_results_file(study_df, filename)
+            self.write_results_file(study_df, filename, columnar=True)
 
             alias = '{}_IPR_abundances_v{}.tsv'.format(self.study_accession, self.pipeline)
             description = 'InterPro matches'
@@ -312,7 +398,7 @@ class StudySummaryGenerator(object):
 
         if not study_df.empty:
             realname = sum_file + '_abundances_v{}.tsv'.format(version)
-            self.write_results_file(study_df, realname)
+            self.write_results_file(study_df, realname, columnar=True)
 
             self.generate_filtered_go_summary(study_df,
                                               'category == "cellular component"',
@@ -340,9 +426,28 @@ class StudySummaryGenerator(object):
         df = df.astype({'count': 'int'})
         return df
 
-    def write_results_file(self, df, filename):
+    @classmethod
+    def phylum_count_vector_v5(cls, mapseq_file, num_rna_seqs, rna_type):
+        """The phylum counts of an analysis, as a DataFrame.
+        """
+        return cls.__build_dataframe(cls.parse_phylum_counts_v5(mapseq_file, num_rna_seqs, rna_type))
+
+    @staticmethod
+    def read_count_vector(filename, delimiter, cols, key, skip_rows=0):
+        """The key and count columns of an analysis result file.
+        """
+        df = StudySummaryGenerator.read_count_tsv(filename, delimiter, cols, skip_rows)
+        return df.filter(key + ['count'])
+
+    def write_results_file(self, df, filename, columnar=False):
+        """Write the summary TSV.
+        With columnar the matrix is also written as a memory-mappable Arrow file
+        (same name, .arrow extension), which the API slices by analyses and terms.
+        """
         filepath = os.path.join(self.summary_dir, filename)
         df.to_csv(filepath, sep='\t', header=True, index=False)
+        if columnar:
+            write_matrix(df, matrix_path(filepath))
 
     @staticmethod
     def clean_summary_df(df):
@@ -475,18 +580,6 @@ class StudySummaryGenerator(object):
                 logging.warning("Result file does not exist:\n{}".format(res_file_re))
         return result
 
-    @staticmethod
-    def __count_number_of_seqs(filepath):
-        """
-            Counts number of sequences in compressed fasta file.
-        :return:
-        """
-        try:
-            count = check_output("zcat {} | grep -c '>'".format(filepath), shell=True).rstrip()
-            return int(count)
-        except CalledProcessError:
-            return 0
-
     @staticmethod
     def __build_dataframe(data):
         df = pd.DataFrame.from_dict(data, orient='index', columns=['superkingdom', 'kingdom', 'phylum', 'count'])
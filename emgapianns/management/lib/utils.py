@@ -19,7 +19,10 @@ import os
 import re
 import sys
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
+from django.db import connections
 from YamJam import yamjam
 
 from emgapi import models as emg_models
@@ -35,6 +38,22 @@ run_accession_re = r'([ESD]RR\d{6,})'
 assembly_accession_re = r'(ERZ\d{6,})'
 
 
+@contextmanager
+def process_pool(workers):
+    """Pool of `workers` processes to parse result files on, None if workers <= 1.
+    The DB connections are closed before the workers are forked, so they don't share their sockets,
+    and are opened again by the next query of the parent. The workers must not use the database.
+    """
+    if workers <= 1:
+        yield None
+        return
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # fork the workers now, before the parent opens new connections
+        executor.submit(int).result()
+        yield executor
+
+
 def is_study_accession(accession):
     return re.match(study_accssion_re, accession)
 
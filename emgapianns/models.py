@@ -343,6 +343,29 @@ class AnalysisJobAntiSmashGeneCluser(BaseAnalysisJob):
     }
 
 
+class AnnotationPostings(mongoengine.Document):
+    """Analyses with an annotation (postings list), split in blocks of job ids
+    so the documents stay small and can be updated one job at a time.
+    `postings` holds the (job_id, count) pairs of the block sorted by job_id,
+    delta and varint encoded (see emgapianns.postings).
+    """
+    id = mongoengine.StringField(primary_key=True)
+    kind = mongoengine.StringField(required=True)
+    annotation = mongoengine.StringField(required=True)
+    block = mongoengine.IntField(required=True)
+    size = mongoengine.IntField(required=True)
+    version = mongoengine.IntField(default=0)
+    postings = mongoengine.BinaryField(required=True)
+
+    meta = {
+        'collection': 'annotation_postings',
+        'indexes': [
+            ('kind', 'annotation', 'block'),
+            ('kind', 'block'),
+        ]
+    }
+
+
 class Organism(mongoengine.Document):
     """Taxonomic model
     """
@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Postings lists of the annotations: the analyses (job ids, with the annotation counts)
+that have an annotation, kept in the AnnotationPostings collection.
+
+The postings of an annotation are split in blocks of BLOCK_SIZE job ids,
+one document per block. import_summary and import_taxonomy update the blocks of the analysis they load,
+rebuild_postings (index_annotation_postings command) rebuilds them from the analysis collections.
+
+Each kind of postings has a public twin (public_kind) with only the public analyses,
+the ones available to anonymous users, so their lists are paginated without checking the analyses in MySQL.
+import_summary and import_taxonomy update it with the analysis, from its visibility in MySQL;
+refresh_public_postings (index_annotation_postings --public-only) updates it
+once analyses have been made public, private or suppressed.
+
+The postings of the organisms are keyed by lineage, which is the materialised path of the organism
+in the taxonomy tree. The `organisms` postings are the analyses with the organism,
+the `organism-subtrees` postings the analyses with the organism or any of its descendants:
+an analysis is in the postings of the lineages of its organisms and of all their ancestors.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+
+from bson import Binary
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from emgapi import models as emg_models
+
+from . import models as m_models
+
+logger = logging.getLogger(__name__)
+
+# Job ids per postings document
+BLOCK_SIZE = 2 ** 16
+
+# Attempts of an update, when other imports change the same documents
+UPDATE_RETRIES = 5
+
+# analysis_model: the analysis collection
+# fields: (list field, annotation reference field) pairs, the analyses
+#         with the annotation in any of the lists are in the postings
+# counts: function returning the annotation counts of an analysis, if they aren't the counts of the fields
+PostingsSource = namedtuple('PostingsSource', ['analysis_model', 'fields', 'counts'], defaults=(None,))
+
+
+def _lineage_counts(analysis, ancestors):
+    counts = {}
+    for field, reference in SOURCES['organisms'].fields:
+        field_counts = defaultdict(int)
+        for annotation in getattr(analysis, field, None) or []:
+            # organisms ids are lineage|pipeline version
+            lineage = getattr(annotation, reference).pk.rsplit('|', 1)[0].split(':')
+            for depth in range(1 if ancestors else len(lineage), len(lineage) + 1):
+                field_counts[':'.join(lineage[:depth])] += int(annotation.count)
+        for lineage, count in field_counts.items():
+            counts[lineage] = max(counts.get(lineage, 0), count)
+    return counts
+
+
+def organism_counts(analysis):
+    """The organism counts of an analysis by lineage. The counts of the SSU, LSU and
+    pre-v4 taxonomy are added up separately, each lineage gets the highest of them.
+    """
+    return _lineage_counts(analysis, ancestors=False)
+
+
+def lineage_counts(analysis):
+    """The organism counts of an analysis by lineage, including the ancestors of the organisms
+    (with the counts of their descendants), as in organism_counts.
+    """
+    return _lineage_counts(analysis, ancestors=True)
+
+
+SOURCES = {
+    'go-terms': PostingsSource(m_models.AnalysisJobGoTerm, (('go_terms', 'go_term'), ('go_slim', 'go_term'))),
+    'interpro-identifiers': PostingsSource(m_models.AnalysisJobInterproIdentifier,
+                                           (('interpro_identifiers', 'interpro_identifier'),)),
+    'kegg-modules': PostingsSource(m_models.AnalysisJobKeggModule, (('kegg_modules', 'module'),)),
+    'pfam-entries': PostingsSource(m_models.AnalysisJobPfam, (('pfam_entries', 'pfam_entry'),)),
+    'kegg-orthologs': PostingsSource(m_models.AnalysisJobKeggOrtholog, (('ko_entries', 'ko'),)),
+    'genome-properties': PostingsSource(m_models.AnalysisJobGenomeProperty,
+                                        (('genome_properties', 'genome_property'),)),
+    'antismash-gene-clusters': PostingsSource(m_models.AnalysisJobAntiSmashGeneCluser,
+                                              (('antismash_gene_clusters', 'gene_cluster'),)),
+    'organisms': PostingsSource(m_models.AnalysisJobTaxonomy,
+                                (('taxonomy', 'organism'), ('taxonomy_lsu', 'organism'), ('taxonomy_ssu', 'organism')),
+                                organism_counts),
+    'organism-subtrees': PostingsSource(m_models.AnalysisJobTaxonomy,
+                                        (('taxonomy', 'organism'), ('taxonomy_lsu', 'organism'),
+                                         ('taxonomy_ssu', 'organism')),
+                                        lineage_counts),
+}
+
+# the kinds of postings of each analysis collection
+KINDS = dict(
+    (model, [kind for kind, source in SOURCES.items() if source.analysis_model is model])
+    for model in set(source.analysis_model for source in SOURCES.values())
+)
+
+
+def public_kind(kind):
+    """The kind of the postings of the public analyses of a kind of postings"""
+    return '{}-public'.format(kind)
+
+
+def public_job_ids(**filters):
+    """The job ids of the public analyses (available to anonymous users) matching the filters"""
+    return set(emg_models.AnalysisJob.objects.available(None)
+               .filter(**filters)
+               .values_list('job_id', flat=True))
+
+
+def _write_varint(data, value):
+    while value > 0x7f:
+        data.append((value & 0x7f) | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def encode(postings):
+    """Encode (job_id, count) pairs sorted by job_id:
+    the difference with the previous job id and the count, as varints.
+    """
+    data = bytearray()
+    previous = 0
+    for job_id, count in postings:
+        _write_varint(data, job_id - previous)
+        _write_varint(data, count)
+        previous = job_id
+    return bytes(data)
+
+
+def decode(data):
+    """The (job_id, count) pairs of encoded postings"""
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    postings = []
+    job_id = 0
+    for i in range(0, len(values), 2):
+        job_id += values[i]
+        postings.append((job_id, values[i + 1]))
+    return postings
+
+
+def _document_id(kind, annotation, block):
+    return '{}:{}:{}'.format(kind, annotation, block)
+
+
+def _document(kind, annotation, block, postings):
+    return {
+        '_id': _document_id(kind, annotation, block),
+        'kind': kind,
+        'annotation': annotation,
+        'block': block,
+        'size': len(postings),
+        'version': 0,
+        'postings': Binary(encode(sorted(postings.items()))),
+    }
+
+
+def _annotation_counts(source, analysis):
+    if source.counts is not None:
+        return source.counts(analysis)
+    counts = {}
+    for field, reference in source.fields:
+        for annotation in getattr(analysis, field, None) or []:
+            # LazyReference once loaded, the annotation document while importing
+            accession = getattr(annotation, reference).pk
+            counts.setdefault(accession, int(getattr(annotation, 'count', None) or 1))
+    return counts
+
+
+def annotation_counts(analysis):
+    """The annotations of an analysis document in each kind of its postings, as kind -> accession -> count.
+    The annotations without a count (KEGG modules, genome properties) count 1.
+    """
+    return dict((kind, _annotation_counts(SOURCES[kind], analysis)) for kind in KINDS[type(analysis)])
+
+
+def update_postings(kind, job_id, counts, previous=None):
+    """Set the job in the postings of the annotations in `counts`, and remove it
+    from the ones in `previous` that aren't in `counts` anymore.
+    The documents are updated if their version didn't change since they were read,
+    the ones changed in the meantime by another import are read and updated again.
+    :param counts: accession -> count of the annotations of the job
+    :param previous: accessions of the annotations the job had before
+    """
+    block = job_id // BLOCK_SIZE
+    accessions = list(set(counts) | set(previous or ()))
+    collection = m_models.AnnotationPostings._get_collection()
+    for _ in range(UPDATE_RETRIES):
+        documents = dict(
+            (document['annotation'], document) for document in collection.find(
+                {'kind': kind, 'block': block, 'annotation': {'$in': accessions}}))
+        operations = []
+        for accession in accessions:
+            document = documents.get(accession)
+            postings = dict(decode(document['postings'])) if document else {}
+            if accession in counts:
+                if postings.get(job_id) == counts[accession]:
+                    continue
+                postings[job_id] = counts[accession]
+            elif job_id in postings:
+                del postings[job_id]
+            else:
+                continue
+            if document is None:
+                operations.append(InsertOne(_document(kind, accession, block, postings)))
+            elif postings:
+                operations.append(UpdateOne({'_id': document['_id'], 'version': document['version']}, {
+                    '$set': {'postings': Binary(encode(sorted(postings.items()))), 'size': len(postings)},
+                    '$inc': {'version': 1},
+                }))
+            else:
+                operations.append(DeleteOne({'_id': document['_id'], 'version': document['version']}))
+        if not operations:
+            return
+        try:
+            result = collection.bulk_write(operations, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            result = e.details
+        if result['nInserted'] + result['nModified'] + result['nRemoved'] == len(operations):
+            return
+        logger.info('Postings of {} changed while updating job {}, retrying'.format(kind, job_id))
+    raise RuntimeError('Could not update the {} postings of job {}'.format(kind, job_id))
+
+
+def index_analysis(analysis, previous=None):
+    """Update the postings of an analysis document, once it is saved,
+    and its public postings from the visibility of the analysis.
+    :param previous: annotation_counts of the document before it was changed
+    """
+    public = bool(public_job_ids(job_id=analysis.job_id))
+    for kind, counts in annotation_counts(analysis).items():
+        accessions = set((previous or {}).get(kind, ()))
+        update_postings(kind, analysis.job_id, counts, accessions)
+        update_postings(public_kind(kind), analysis.job_id, counts if public else {}, accessions | set(counts))
+
+
+def _block_job_ids(block):
+    return {'job_id__gte': block * BLOCK_SIZE, 'job_id__lt': (block + 1) * BLOCK_SIZE}
+
+
+def _write_block(kind, block, postings):
+    collection = m_models.AnnotationPostings._get_collection()
+    operations = [
+        ReplaceOne({'_id': _document_id(kind, annotation, block)},
+                   _document(kind, annotation, block, annotation_postings),
+                   upsert=True)
+        for annotation, annotation_postings in postings.items()
+    ]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+    collection.delete_many({'kind': kind, 'block': block, 'annotation': {'$nin': list(postings)}})
+
+
+def _write_public_block(kind, block, postings):
+    public = public_job_ids(**_block_job_ids(block))
+    public_postings = {}
+    for annotation, annotation_postings in postings.items():
+        annotation_postings = dict(
+            (job_id, count) for job_id, count in annotation_postings.items() if job_id in public)
+        if annotation_postings:
+            public_postings[annotation] = annotation_postings
+    _write_block(public_kind(kind), block, public_postings)
+
+
+def rebuild_postings(kind, batch_size=1000):
+    """Rebuild the postings of a kind of annotation and their public postings
+    from its analysis collection, one block at a time.
+    Imports of the same annotations shouldn't run in the meantime.
+    :return: number of analyses
+    """
+    source = SOURCES[kind]
+    fields = [field for field, _ in source.fields]
+    analyses = source.analysis_model.objects \
+        .only('job_id', *fields) \
+        .order_by('job_id') \
+        .allow_disk_use(True) \
+        .batch_size(batch_size)
+    blocks = []
+    block, postings = None, defaultdict(dict)
+    count = 0
+    for analysis in analyses:
+        if analysis.job_id // BLOCK_SIZE != block:
+            if block is not None:
+                _write_block(kind, block, postings)
+                _write_public_block(kind, block, postings)
+            block, postings = analysis.job_id // BLOCK_SIZE, defaultdict(dict)
+            blocks.append(block)
+        for accession, annotation_count in _annotation_counts(source, analysis).items():
+            postings[accession][analysis.job_id] = annotation_count
+        count += 1
+    if block is not None:
+        _write_block(kind, block, postings)
+        _write_public_block(kind, block, postings)
+    m_models.AnnotationPostings.objects(kind__in=[kind, public_kind(kind)], block__nin=blocks).delete()
+    return count
+
+
+def refresh_public_postings(kind):
+    """Rebuild the public postings of a kind of annotation from its postings, one block at a time,
+    for the analyses made public, private or suppressed since they were indexed.
+    Imports of the same annotations shouldn't run in the meantime.
+    :return: number of blocks
+    """
+    blocks = sorted(m_models.AnnotationPostings.objects(kind=kind).distinct('block'))
+    for block in blocks:
+        postings = dict(
+            (annotation, dict(decode(data))) for annotation, data in
+            m_models.AnnotationPostings.objects(kind=kind, block=block).scalar('annotation', 'postings'))
+        _write_public_block(kind, block, postings)
+    m_models.AnnotationPostings.objects(kind=public_kind(kind), block__nin=blocks).delete()
+    return len(blocks)
+
+
+class PostingsList(object):
+    """The job ids of the analyses with an annotation, sorted by job id
+    (descending if reverse). Only the sizes of the blocks are read up front,
+    slicing it reads and decodes the blocks of the slice.
+    """
+
+    def __init__(self, kind, annotation, reverse=False):
+        self.kind = kind
+        self.annotation = annotation
+        self.reverse = reverse
+        self.blocks = list(self._documents().order_by('block').scalar('block', 'size'))
+        if reverse:
+            self.blocks.reverse()
+
+    def _documents(self):
+        return m_models.AnnotationPostings.objects(kind=self.kind, annotation=self.annotation)
+
+    def __len__(self):
+        return sum(size for _, size in self.blocks)
+
+    def _block_job_ids(self, blocks):
+        """The job ids of the blocks, sorted by job id, as block -> job ids"""
+        if not blocks:
+            return {}
+        documents = self._documents().filter(block__in=list(blocks)).scalar('block', 'postings')
+        return dict((block, [job_id for job_id, _ in decode(data)]) for block, data in documents)
+
+    def intersection(self, job_ids):
+        """The job ids in the list, reading the blocks of the job ids only"""
+        blocks = self._block_job_ids(set(job_id // BLOCK_SIZE for job_id in job_ids))
+        blocks = dict((block, set(block_job_ids)) for block, block_job_ids in blocks.items())
+        return [job_id for job_id in job_ids if job_id in blocks.get(job_id // BLOCK_SIZE, ())]
+
+    def ranks(self, job_ids):
+        """The number of job ids before each of the job ids in the list (where they are or would be),
+        reading the blocks of the job ids only
+        """
+        blocks = self._block_job_ids(set(job_id // BLOCK_SIZE for job_id in job_ids))
+        ranks = []
+        for job_id in job_ids:
+            block = job_id // BLOCK_SIZE
+            block_job_ids = blocks.get(block, [])
+            if self.reverse:
+                rank = sum(size for b, size in self.blocks if b > block)
+                rank += len(block_job_ids) - bisect_right(block_job_ids, job_id)
+            else:
+                rank = sum(size for b, size in self.blocks if b < block)
+                rank += bisect_left(block_job_ids, job_id)
+            ranks.append(rank)
+        return ranks
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('PostingsList only supports slicing')
+        start, stop, _ = key.indices(len(self))
+        offsets = {}
+        offset = 0
+        for block, size in self.blocks:
+            if offset < stop and offset + size > start:
+                offsets[block] = offset
+            offset += size
+        if not offsets:
+            return []
+        blocks = self._block_job_ids(offsets)
+        job_ids = []
+        for block, offset in sorted(offsets.items(), key=lambda item: item[1]):
+            block_job_ids = list(blocks.get(block, []))
+            if self.reverse:
+                block_job_ids.reverse()
+            job_ids.extend(block_job_ids[max(start - offset, 0):stop - offset])
+        return job_ids
+
+    def __iter__(self):
+        return iter(self[:])
@@ -15,42 +15,38 @@
 # limitations under the License.
 
 import os
-import io
 
 import logging
 import urllib
 
-import pysam
-
 from django.conf import settings
 from django.db.models import Q
 from mongoengine.queryset.visitor import Q as M_Q
 
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import filters
 from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 
 from mongoengine.base.datastructures import EmbeddedDocumentList
 from rest_framework_mongoengine.viewsets import ReadOnlyModelViewSet as MongoReadOnlyModelViewSet
 
-from emgapi import serializers as emg_serializers
 from emgapi import models as emg_models
-from emgapi import filters as emg_filters
 from emgapi import utils as emg_utils
-from emgapi.mixins import ExcessiveCSVException
+from emgapi import mixins as emg_mixins
 
 from . import serializers as m_serializers
 from . import models as m_models
 from . import pagination as m_pagination
 from . import viewsets as m_viewsets
 from . import mixins as m_mixins
+from . import contig_files
+from . import postings as m_postings
 from .filters import MongoOrderingFilter
 
 logger = logging.getLogger(__name__)
@@ -298,7 +294,6 @@ class AntiSmashGeneClusterViewSet(m_mixins.AnnotationRetrivalMixin, m_viewsets.R
         return super().retrieve(request, *args, **kwargs)
 
 
-# FIXME: None of the RelationshipViewSet are working, on Master either...
 class GoTermAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
     """
     Retrieves list of analysis results for the given GO term
@@ -308,14 +303,7 @@ class GoTermAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
     """
     annotation_model = m_models.GoTerm
 
-    def get_job_ids(self, annotation):
-        job_ids = m_models.AnalysisJobGoTerm.objects \
-            .filter(
-                M_Q(go_slim__go_term=annotation) |
-                M_Q(go_terms__go_term=annotation)
-            ) \
-            .distinct('job_id')
-        return job_ids
+    postings_kind = 'go-terms'
 
 
 class InterproIdentifierAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
@@ -327,10 +315,7 @@ class InterproIdentifierAnalysisRelationshipViewSet(m_viewsets.AnalysisRelations
     """
     annotation_model = m_models.InterproIdentifier
 
-    def get_job_ids(self, annotation):
-        return m_models.AnalysisJobInterproIdentifier.objects \
-            .filter(M_Q(interpro_identifiers__interpro_identifier=annotation)) \
-            .distinct('job_id')
+    postings_kind = 'interpro-identifiers'
 
 
 class KeggModuleAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
@@ -342,10 +327,7 @@ class KeggModuleAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewS
     """
     annotation_model = m_models.KeggModule
 
-    def get_job_ids(self, annotation):
-        return m_models.AnalysisJobKeggModule.objects \
-            .filter(M_Q(kegg_modules__module=annotation)) \
-            .distinct('job_id')
+    postings_kind = 'kegg-modules'
 
 
 class PfamAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
@@ -356,12 +338,9 @@ class PfamAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
     `/annotations/pfram-entries/P00001/analyses`
     """
 
-    annotation_model = m_models.AnalysisJobPfamAnnotation
+    annotation_model = m_models.PfamEntry
 
-    def get_job_ids(self, annotation):
-        return m_models.AnalysisJobPfam.objects \
-            .filter(M_Q(pfam_entries__pfam=annotation)) \
-            .distinct('job_id')
+    postings_kind = 'pfam-entries'
 
 
 class GenomePropertyAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
@@ -373,10 +352,7 @@ class GenomePropertyAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipV
     """
     annotation_model = m_models.GenomeProperty
 
-    def get_job_ids(self, annotation):
-        return m_models.AnalysisJobGenomeProperty.objects \
-            .filter(M_Q(genome_properties__genome_property=annotation)) \
-            .distinct('job_id')
+    postings_kind = 'genome-properties'
 
 
 class AntiSmashGeneClusterAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
@@ -388,10 +364,7 @@ class AntiSmashGeneClusterAnalysisRelationshipViewSet(m_viewsets.AnalysisRelatio
 
     annotation_model = m_models.AntiSmashGeneCluster
 
-    def get_job_ids(self, annotation):
-        return m_models.AnalysisJobAntiSmashGeneCluser.objects \
-            .filter(M_Q(antismash_gene_clusters__gene_cluster=annotation)) \
-            .distinct('job_id')
+    postings_kind = 'antismash-gene-clusters'
 
 
 class KeggOrthologRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
@@ -404,10 +377,7 @@ class KeggOrthologRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
 
     annotation_model = m_models.KeggOrtholog
 
-    def get_job_ids(self, annotation):
-        return m_models.AnalysisJobKeggOrtholog.objects \
-            .filter(M_Q(ko_entries__ko=annotation)) \
-            .distinct('job_id')
+    postings_kind = 'kegg-orthologs'
 
 
 class AnalysisGoTermRelationshipViewSet(m_mixins.AnalysisJobAnnotationMixin,
@@ -638,13 +608,12 @@ class OrganismTreeViewSet(m_viewsets.ListReadOnlyModelViewSet):
     def get_queryset(self):
         lineage = urllib.parse.unquote(
             self.kwargs.get('lineage', None).strip())
-        organism = m_models.Organism.objects \
-            .filter(lineage=lineage) \
-            .only('name').distinct('name')
-        if len(organism) == 0:
+        if not m_models.Organism.objects.filter(lineage=lineage).count():
             raise Http404(("Attribute error '%s'." % self.lookup_field))
+        # the lineages are the paths of the organisms in the tree,
+        # the subtree is the lineages starting with this one (indexed prefix query)
         queryset = m_models.Organism.objects \
-            .filter(M_Q(ancestors__in=organism) | M_Q(name__in=organism))
+            .filter(M_Q(lineage=lineage) | M_Q(lineage__startswith=lineage + ':'))
         return queryset
 
     def get_serializer_class(self):
@@ -861,23 +830,7 @@ class AnalysisTaxonomyOverview(APIView):
         })
 
 
-class OrganismAnalysisRelationshipViewSet(m_viewsets.ListReadOnlyModelViewSet):
-
-    serializer_class = emg_serializers.AnalysisSerializer
-
-    filterset_class = emg_filters.AnalysisJobFilter
-
-    filter_backends = (
-        DjangoFilterBackend,
-        filters.SearchFilter,
-        filters.OrderingFilter,
-    )
-
-    ordering_fields = (
-        'job_id',
-    )
-
-    ordering = ('-job_id',)
+class OrganismAnalysisRelationshipViewSet(m_viewsets.AnalysisRelationshipViewSet):
 
     search_fields = (
         '@sample__metadata__var_val_ucv',
@@ -885,32 +838,31 @@ class OrganismAnalysisRelationshipViewSet(m_viewsets.ListReadOnlyModelViewSet):
 
     lookup_field = 'lineage'
 
-    def get_queryset(self):
-        lineage = urllib.parse.unquote(
-            self.kwargs.get(self.lookup_field, None).strip())
-        organism = m_models.Organism.objects.filter(lineage=lineage) \
-            .only('id')
+    annotation_model = m_models.Organism
 
-        if len(organism) == 0:
-            raise NotFound("Lineage not found. Lineage: " + lineage)
+    postings_kind = 'organisms'
 
-        job_ids = m_models.AnalysisJobTaxonomy.objects \
-            .filter(
-                M_Q(taxonomy__organism__in=organism) |
-                M_Q(taxonomy_lsu__organism__in=organism) |
-                M_Q(taxonomy_ssu__organism__in=organism)
-            ).distinct('job_id')
+    postings_params = m_viewsets.AnalysisRelationshipViewSet.postings_params + ('descendants',)
 
-        return emg_models.AnalysisJob.objects \
-            .filter(job_id__in=job_ids) \
-            .available(self.request)
+    def get_postings_kind(self):
+        if self.request.query_params.get('descendants', '').lower() in ('true', '1'):
+            return 'organism-subtrees'
+        return self.postings_kind
 
-    def get_serializer_class(self):
-        return emg_serializers.AnalysisSerializer
+    def get_postings(self, reverse=True, public=False):
+        lineage = urllib.parse.unquote(
+            self.kwargs.get(self.lookup_field, None).strip())
+        kind = self.get_postings_kind()
+        postings = m_postings.PostingsList(m_postings.public_kind(kind) if public else kind, lineage,
+                                           reverse=reverse)
+        if not len(postings) and not m_models.Organism.objects.filter(lineage=lineage).count():
+            raise NotFound("Lineage not found. Lineage: " + lineage)
+        return postings
 
     def list(self, request, *args, **kwargs):
         """
-        Retrieves list of analysis results for the given Organism
+        Retrieves list of analysis results for the given Organism,
+        or any of its descendants with `?descendants=true`
         Example:
         ---
         `/annotations/organisms/Bacteria:Chlorobi:OPB56/analysis`
@@ -920,7 +872,14 @@ class OrganismAnalysisRelationshipViewSet(m_viewsets.ListReadOnlyModelViewSet):
             .list(request, *args, **kwargs)
 
 
-class AnalysisContigViewSet(MongoReadOnlyModelViewSet):
+class ExcessiveContigsException(APIException):
+    status_code = 413
+    default_detail = 'Too many contigs requested at once. ' \
+                     'Please narrow down the contigs with the filters or split the list of contig ids.'
+
+
+class AnalysisContigViewSet(emg_mixins.ListModelMixin,
+                             MongoReadOnlyModelViewSet):
 
     lookup_field = 'contig_id'
     lookup_value_regex = '[^/]+'
@@ -947,13 +906,6 @@ class AnalysisContigViewSet(MongoReadOnlyModelViewSet):
         queryset = m_models.AnalysisJobContig.objects
         request = self.request
 
-        # Do not paginate CSV
-        if request.accepted_renderer.format == 'csv':
-            if queryset.count() > 50 * settings.EMG_DEFAULT_LIMIT:
-                raise ExcessiveCSVException
-            else:
-                self.pagination_class = None
-
         query_filter = M_Q()
 
         # TODO: simplify!
@@ -1015,50 +967,122 @@ class AnalysisContigViewSet(MongoReadOnlyModelViewSet):
 
         return queryset.filter(identifier & query_filter)
 
-    def retrieve(self, *args, **kwargs):
+    def _fasta_paths(self, obj):
+        """The bgzip FASTA file of the analysis, its .fai and .gzi indexes"""
+        fasta_path = os.path.abspath(os.path.join(
+            settings.RESULTS_DIR,
+            obj.result_directory,
+            obj.input_file_name + '.fasta.bgz')
+        )
+        return fasta_path, fasta_path + '.fai', fasta_path + '.gzi'
+
+    def _gff_paths(self, obj):
+        """The bgzip GFF file of the analysis and its tabix index.
+        The are 2 flavors for the GFF files:
+        - COG,KEGG, Pfam, InterPro and EggNOG annotations
+        - antiSMASH, if the querystring param 'antismash=True'
+        """
+        file_prefix = 'annotations'
+        folder = 'functional-annotation'
+
+        if self.request.GET.get('antismash', False):
+            file_prefix = 'antismash'
+            folder = 'pathways-systems'
+
+        gff_path = os.path.abspath(os.path.join(
+            settings.RESULTS_DIR,
+            obj.result_directory,
+            folder,
+            '{}.{}.gff.bgz'.format(obj.input_file_name, file_prefix))
+        )
+        return gff_path, gff_path + '.tbi'
+
+    def _batch_contig_ids(self):
+        """The contigs of a batch request: the contig_id param (?contig_id=a,b or ?contig_id=a&contig_id=b)
+        or, if not set, the contigs matching the same filters as the list of contigs.
+        """
+        contig_ids = [
+            contig_id
+            for value in self.request.GET.getlist('contig_id')
+            for contig_id in value.split(',') if contig_id
+        ]
+        if not contig_ids:
+            queryset = self.get_queryset()
+        else:
+            queryset = contig_ids
+        limit = settings.CONTIG_BATCH_MAX_CONTIGS
+        if limit is not None:
+            size = len(queryset) if isinstance(queryset, list) else queryset.count()
+            if size > limit:
+                raise ExcessiveContigsException()
+        if isinstance(queryset, list):
+            return queryset
+        return queryset.scalar('contig_id')
+
+    def _contig_region(self):
+        """The region of the contig selected with the start and end params,
+        1-based and inclusive like the GFF coordinates.
+        :return: (start, end) in pysam coordinates (0-based, half-open), None if not set
+        """
+        region = {}
+        for param in ('start', 'end'):
+            value = self.request.GET.get(param)
+            if not value:
+                region[param] = None
+                continue
+            try:
+                region[param] = int(value)
+            except ValueError:
+                raise ValidationError({param: 'Must be an integer.'})
+            if region[param] < 1:
+                raise ValidationError({param: 'Must be greater than 0.'})
+        start, end = region['start'], region['end']
+        if start and end and end < start:
+            raise ValidationError({'end': 'Must be greater than or equal to start.'})
+        return (start - 1 if start else None), end
+
+    def retrieve(self, request, *args, **kwargs):
         """Retrieve a contig fasta file.
         The Fasta file will be retrieved using pysam.
+        A region of the contig can be selected with the start and end params (1-based, inclusive),
+        and a byte range of the file with the Range header.
 
         Example:
         ---
         `/analyses/<accession>/contigs/<contig_id>`
+        `/analyses/<accession>/contigs/<contig_id>?start=1000&end=2000`
         ---
         """
         obj = self.get_object()
         contig = self.kwargs['contig_id']
+        start, end = self._contig_region()
 
-        fasta_path = os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            obj.result_directory,
-            obj.input_file_name + '.fasta.bgz')
-        )
-        fasta_idx_path = os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            obj.result_directory,
-            obj.input_file_name + '.fasta.bgz.fai')
-        )
-        fasta_idx_gzi_path = os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            obj.result_directory,
-            obj.input_file_name + '.fasta.bgz.gzi')
-        )
+        fasta_path, fasta_idx_path, fasta_idx_gzi_path = self._fasta_paths(obj)
 
         if os.path.isfile(fasta_path) and os.path.isfile(fasta_idx_path):
-            output = io.StringIO()
-            # TODO: handle errors
-            with pysam.FastaFile(filename=fasta_path,
-                                 filepath_index=fasta_idx_path,
-                                 filepath_index_compressed=fasta_idx_gzi_path) as fasta:
-                rows = fasta.fetch(contig)
-                output.write('>' + emg_utils.assembly_contig_name(contig) + '\n')
-                for row in rows:
-                    output.write(row)
-            response = HttpResponse()
-            response['Content-Type'] = 'text/x-fasta'
+            fasta, lock = contig_files.fasta_file(fasta_path, fasta_idx_path, fasta_idx_gzi_path)
+            try:
+                record = contig_files.ContigFasta(fasta, lock, contig, start, end)
+            except KeyError:
+                return Response('Contig not found.', status.HTTP_404_NOT_FOUND)
+            size = len(record)
+            try:
+                byte_range = emg_utils.parse_byte_range(request.META.get('HTTP_RANGE'), size)
+            except ValueError:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response['Content-Range'] = 'bytes */{0}'.format(size)
+                return response
+            if byte_range:
+                first, last = byte_range
+                response = StreamingHttpResponse(record.read(first, last), content_type='text/x-fasta',
+                                                 status=status.HTTP_206_PARTIAL_CONTENT)
+                response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(first, last - 1, size)
+                response['Content-Length'] = last - first
+            else:
+                response = StreamingHttpResponse(record, content_type='text/x-fasta')
+                response['Content-Length'] = size
             response['Content-Disposition'] = 'attachment; filename={0}.fasta'.format(contig)
-            output.seek(0, os.SEEK_END)
-            response['Content-Length'] = output.tell()
-            response.write(output.getvalue())
+            response['Accept-Ranges'] = 'bytes'
             return response
 
         if settings.DEBUG:
@@ -1074,49 +1098,26 @@ class AnalysisContigViewSet(MongoReadOnlyModelViewSet):
         - antiSMASH
         By default the action will return the 'main one', unless specified using the querystring param 'antismash=True'
         The GFF file will be parsed with pysam and sliced.
+        Only the features overlapping a region of the contig are returned if
+        the start and end params are set (1-based, inclusive).
         Example:
         ---
         /analyses/<accession>/<contig_id>/annotation
+        /analyses/<accession>/<contig_id>/annotation?start=1000&end=2000
         ---
         """
         obj = self.get_object()
         contig = self.kwargs['contig_id']
+        start, end = self._contig_region()
 
-        file_prefix = 'annotations'
-        folder = 'functional-annotation'
-
-        if self.request.GET.get('antismash', False):
-            file_prefix = 'antismash'
-            folder = 'pathways-systems'
-
-        gff_path = os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            obj.result_directory,
-            folder,
-            '{}.{}.gff.bgz'.format(obj.input_file_name, file_prefix))
-        )
-        gff_idx_path = os.path.abspath(os.path.join(
-            settings.RESULTS_DIR,
-            obj.result_directory,
-            folder,
-            '{}.{}.gff.bgz.tbi'.format(obj.input_file_name, file_prefix))
-        )
+        gff_path, gff_idx_path = self._gff_paths(obj)
 
         if os.path.isfile(gff_path) and os.path.isfile(gff_idx_path):
-            # multiple_iterators = True as many processes
-            # could be using the same file at the same moment
-            output = io.StringIO()
+            gff, lock = contig_files.tabix_file(gff_path, gff_idx_path)
             try:
-                with pysam.TabixFile(filename=gff_path, index=gff_idx_path) as gff:
-                    rows = gff.fetch(contig, multiple_iterators=True)
-                    for row in rows:
-                        output.write(emg_utils.assembly_contig_name(row) + '\n')
-                response = HttpResponse()
-                response['Content-Type'] = 'text/x-gff3'
+                rows = contig_files.contig_gff(gff, lock, contig, start, end)
+                response = StreamingHttpResponse(rows, content_type='text/x-gff3')
                 response['Content-Disposition'] = 'attachment; filename={0}.gff'.format(contig)
-                output.seek(0, os.SEEK_END)
-                response['Content-Length'] = output.tell()
-                response.write(output.getvalue())
                 return response
             except ValueError:
                 return Response('Contig not found on GFF file.', status.HTTP_404_NOT_FOUND)
@@ -1125,3 +1126,50 @@ class AnalysisContigViewSet(MongoReadOnlyModelViewSet):
             return Response('No GFF file for contig {0}.'.format(contig), status.HTTP_404_NOT_FOUND)
         else:
             return Response('No GFF file for contig.', status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['get'], url_path='fasta')
+    def batch_fasta(self, request, *args, **kwargs):
+        """Retrieve the sequences of several contigs as a single multi-FASTA file.
+        The contigs are selected with contig_id (a list of contig ids) or,
+        if not set, with the same filters as the list of contigs (cog, kegg, gt, lt...).
+        Contigs that are not in the FASTA file are skipped.
+        Example:
+        ---
+        `/analyses/<accession>/contigs/fasta?contig_id=<contig_id>,<contig_id>`
+        `/analyses/<accession>/contigs/fasta?kegg=K00001&gt=1000`
+        ---
+        """
+        obj = self.get_object()
+        fasta_path, fasta_idx_path, fasta_idx_gzi_path = self._fasta_paths(obj)
+
+        if not (os.path.isfile(fasta_path) and os.path.isfile(fasta_idx_path)):
+            return Response('No FASTA file for the analysis.', status.HTTP_404_NOT_FOUND)
+
+        contig_ids = self._batch_contig_ids()
+        fasta, lock = contig_files.fasta_file(fasta_path, fasta_idx_path, fasta_idx_gzi_path)
+        records = contig_files.fasta_records(fasta, lock, contig_ids)
+        response = StreamingHttpResponse(contig_files.multi_fasta(records), content_type='text/x-fasta')
+        response['Content-Disposition'] = 'attachment; filename={0}_contigs.fasta'.format(obj.accession)
+        response['Content-Length'] = sum(len(record) + 1 for record in records)
+        return response
+
+    @action(detail=False, methods=['get'], url_path='annotations')
+    def batch_gff(self, request, *args, **kwargs):
+        """Retrieve the annotations of several contigs as a single GFF file.
+        The contigs and the GFF file are selected like in the contig FASTA and annotations endpoints.
+        Example:
+        ---
+        `/analyses/<accession>/contigs/annotations?contig_id=<contig_id>,<contig_id>&antismash=True`
+        ---
+        """
+        obj = self.get_object()
+        gff_path, gff_idx_path = self._gff_paths(obj)
+
+        if not (os.path.isfile(gff_path) and os.path.isfile(gff_idx_path)):
+            return Response('No GFF file for the analysis.', status.HTTP_404_NOT_FOUND)
+
+        contig_ids = self._batch_contig_ids()
+        gff, lock = contig_files.tabix_file(gff_path, gff_idx_path)
+        response = StreamingHttpResponse(contig_files.gff_rows(gff, lock, contig_ids), content_type='text/x-gff3')
+        response['Content-Disposition'] = 'attachment; filename={0}_contigs.gff'.format(obj.accession)
+        return response
@@ -14,11 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bisect import bisect_left
+
 from django.http import Http404
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import mixins
 from rest_framework import filters
+from rest_framework.response import Response
 
 from rest_framework_mongoengine.viewsets import GenericViewSet
 
@@ -26,8 +29,9 @@ from emgapi import mixins as emg_mixins
 from emgapi import serializers as emg_serializers
 from emgapi import models as emg_models
 from emgapi import filters as emg_filters
+from emgapi.renderers import CSVStreamingRenderer
 
-from mongoengine import DoesNotExist
+from . import postings as m_postings
 
 
 class ReadOnlyModelViewSet(mixins.RetrieveModelMixin,
@@ -50,6 +54,34 @@ class ListReadOnlyModelViewSet(emg_mixins.ListModelMixin,
     pass
 
 
+class PostingsAnalyses(object):
+    """The analyses of a postings list, for the paginator: slicing it slices the postings list
+    and loads the analyses of the slice only.
+    `extra_job_ids` are job ids merged into the postings list (not in it, in its order),
+    `queryset` the analyses available to the user.
+    """
+
+    def __init__(self, postings, queryset, extra_job_ids=()):
+        self.postings = postings
+        self.queryset = queryset
+        self.extra_job_ids = sorted(extra_job_ids, reverse=postings.reverse)
+        # their positions in the merged list
+        self.positions = [rank + i for i, rank in enumerate(postings.ranks(self.extra_job_ids))]
+
+    def __len__(self):
+        return len(self.postings) + len(self.extra_job_ids)
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(len(self))
+        before = bisect_left(self.positions, start)
+        extra_job_ids = [job_id for job_id, position in zip(self.extra_job_ids, self.positions)
+                         if start <= position < stop]
+        job_ids = sorted(self.postings[start - before:stop - before - len(extra_job_ids)] + extra_job_ids,
+                         reverse=self.postings.reverse)
+        jobs = dict((job.job_id, job) for job in self.queryset.filter(job_id__in=job_ids))
+        return [jobs[job_id] for job_id in job_ids if job_id in jobs]
+
+
 class AnalysisRelationshipViewSet(ListReadOnlyModelViewSet):
     """Get the the Analysis that have a particular Model
 
@@ -58,9 +90,15 @@ class AnalysisRelationshipViewSet(ListReadOnlyModelViewSet):
 
     For example: get all the analysis that have the Pfam entry X.
 
+    The analyses are read from the postings list of the annotation (see emgapianns.postings).
+    Lists without filters or search are paginated on the postings list itself:
+    the public postings for anonymous users, merged with their private analyses
+    for authenticated users, the postings of all the analyses for superusers.
+    The others query the analyses in the postings list.
+
     Usage:
         `annotation_model`: annotation mongo model
-        `get_job_ids`: method to get all the jobs that have a particular annotation
+        `postings_kind`: kind of the postings of the annotation model
     """
     serializer_class = emg_serializers.AnalysisSerializer
 
@@ -72,11 +110,12 @@ class AnalysisRelationshipViewSet(ListReadOnlyModelViewSet):
         filters.OrderingFilter,
     )
 
+    # the accessions of the analyses are in job_id order
     ordering_fields = (
-        'accession',
+        'job_id',
     )
 
-    ordering = ('-accession',)
+    ordering = ('-job_id',)
 
     search_fields = (
         'sample__metadata__var_val_ucv',
@@ -86,24 +125,73 @@ class AnalysisRelationshipViewSet(ListReadOnlyModelViewSet):
 
     annotation_model = None
 
-    def get_job_ids(self):
-        pass
+    postings_kind = None
 
-    def get_queryset(self):
+    # query params the postings list pagination can serve
+    postings_params = ('page', 'page_size', 'format', 'include', 'ordering')
+
+    def get_postings_kind(self):
+        return self.postings_kind
+
+    def get_postings(self, reverse=True, public=False):
         accession = self.kwargs[self.lookup_field]
-        try:
-            annotation = self.annotation_model.objects.get(accession=accession)
-        except KeyError:
-            raise Http404(("Attribute error '%s'." % self.lookup_field))
-        except DoesNotExist:
+        kind = self.get_postings_kind()
+        postings = m_postings.PostingsList(m_postings.public_kind(kind) if public else kind, accession,
+                                           reverse=reverse)
+        if not len(postings) and not self.annotation_model.objects(accession=accession).count():
             raise Http404(('No %s matches the given query.' %
-                           self.annotation_model.__class__.__name__))
-
-        job_ids = self.get_job_ids(annotation)
+                           self.annotation_model.__name__))
+        return postings
 
+    def get_queryset(self):
+        job_ids = list(self.get_postings())
         return emg_models.AnalysisJob.objects \
             .filter(job_id__in=job_ids) \
             .available(self.request)
 
+    def _postings_ordering(self, request):
+        """The order of the postings list (reverse for descending job ids),
+        None if the request has to query the analyses
+        """
+        if isinstance(request.accepted_renderer, CSVStreamingRenderer):
+            return None
+        for param in request.query_params:
+            if param not in self.postings_params and not param.startswith('fields['):
+                return None
+        ordering = request.query_params.get('ordering', '-job_id')
+        if ordering not in ('job_id', '-job_id'):
+            return None
+        return ordering.startswith('-')
+
+    def get_postings_analyses(self, request, reverse):
+        queryset = emg_models.AnalysisJob.objects.available(request)
+        if request.user.is_superuser:
+            return PostingsAnalyses(self.get_postings(reverse=reverse), queryset)
+        postings = self.get_postings(reverse=reverse, public=True)
+        if not request.user.is_authenticated:
+            return PostingsAnalyses(postings, queryset)
+        # the private analyses of the user in the postings
+        private_job_ids = list(queryset
+                               .filter(study__submission_account_id__iexact=request.user.username)
+                               .exclude(job_id__in=emg_models.AnalysisJob.objects.available(None).values('job_id'))
+                               .values_list('job_id', flat=True))
+        if not private_job_ids:
+            return PostingsAnalyses(postings, queryset)
+        private_job_ids = set(self.get_postings(reverse=reverse).intersection(private_job_ids)) \
+            - set(postings.intersection(private_job_ids))
+        return PostingsAnalyses(postings, queryset, private_job_ids)
+
+    def list(self, request, *args, **kwargs):
+        reverse = self._postings_ordering(request)
+        if reverse is None:
+            return super().list(request, *args, **kwargs)
+        analyses = self.get_postings_analyses(request, reverse)
+        page = self.paginate_queryset(analyses)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(analyses[:], many=True)
+        return Response(serializer.data)
+
     def get_serializer_class(self):
         return emg_serializers.AnalysisSerializer
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextvars
+import json
+import logging
+import time
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Profile of the request being served by the current thread, if any.
+current_request_profile = contextvars.ContextVar('current_request_profile', default=None)
+
+
+class RequestProfile(object):
+    """
+    Counters for the work done while serving a single request.
+    All times are in milliseconds.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.mongo_count = 0
+        self.mongo_time = 0.0
+        self.serializer_time = 0.0
+        self.total_time = 0.0
+        self._render_started = None
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        """Django database execute_wrapper that counts and times every SQL statement.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += (time.perf_counter() - start) * 1000
+
+    def add_mongo_command(self, duration_micros):
+        self.mongo_count += 1
+        self.mongo_time += duration_micros / 1000
+
+    def render_started(self):
+        self._render_started = time.perf_counter()
+
+    def render_finished(self):
+        if self._render_started is not None:
+            self.serializer_time += (time.perf_counter() - self._render_started) * 1000
+            self._render_started = None
+
+    def finish(self):
+        self.total_time = (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self):
+        return {
+            'sql_count': self.sql_count,
+            'sql_time': round(self.sql_time, 3),
+            'mongo_count': self.mongo_count,
+            'mongo_time': round(self.mongo_time, 3),
+            'serializer_time': round(self.serializer_time, 3),
+            'total_time': round(self.total_time, 3),
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            'sql;desc="{} queries";dur={:.3f}'.format(self.sql_count, self.sql_time),
+            'mongo;desc="{} commands";dur={:.3f}'.format(self.mongo_count, self.mongo_time),
+            'serializer;dur={:.3f}'.format(self.serializer_time),
+            'total;dur={:.3f}'.format(self.total_time),
+        ])
+
+
+class MongoCommandProfiler(monitoring.CommandListener):
+    """
+    Adds every Mongo command to the profile of the request being served.
+    pymongo calls the listeners on the thread that issued the command,
+    so the context variable points to the right request.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        profile = current_request_profile.get()
+        if profile is not None:
+            profile.add_mongo_command(event.duration_micros)
+
+
+class RequestProfilingMiddleware(object):
+    """
+    Records the number and duration of the SQL queries and Mongo commands
+    issued by each request, and the time spent rendering (serializing) the response.
+
+    With REQUEST_PROFILING_HEADERS (DEBUG by default) the numbers are
+    returned as X-EMG-* and Server-Timing response headers, otherwise they
+    are logged as a JSON document per request.
+
+    Streaming responses are profiled up to the point the response is returned,
+    the work done while the body is consumed is not included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_request_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            current_request_profile.reset(token)
+        profile.finish()
+
+        if settings.REQUEST_PROFILING_HEADERS:
+            response['X-EMG-SQL-Queries'] = profile.sql_count
+            response['X-EMG-Mongo-Queries'] = profile.mongo_count
+            response['Server-Timing'] = profile.server_timing()
+        else:
+            logger.info(json.dumps(dict(
+                method=request.method,
+                path=request.path,
+                status=response.status_code,
+                **profile.as_dict()
+            )))
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns,
+        # which is where the JSON:API documents and the CSV rows are built.
+        profile = current_request_profile.get()
+        if profile is not None:
+            profile.render_started()
+            response.add_post_render_callback(lambda r: profile.render_finished())
+        return response
@@ -41,6 +41,7 @@ from corsheaders.defaults import default_headers
 from pymongo import monitoring
 
 from emgapianns.utils import MongoCommandLogger
+from emgcli.middleware import MongoCommandProfiler
 
 try:
     from YamJam import yamjam, YAMLError
@@ -213,6 +214,18 @@ try:
 except KeyError:
     DOWNLOADS_BYPASS_NGINX = False
 
+# Open pysam handles of contig files (FASTA/GFF) kept per process
+try:
+    CONTIG_FILE_CACHE_SIZE = EMG_CONF['emg']['contig_file_cache_size']
+except KeyError:
+    CONTIG_FILE_CACHE_SIZE = 64
+
+# Max. contigs of the multi-contig FASTA/GFF exports, null to lift it
+try:
+    CONTIG_BATCH_MAX_CONTIGS = EMG_CONF['emg']['contig_batch_max_contigs']
+except KeyError:
+    CONTIG_BATCH_MAX_CONTIGS = 50000
+
 try:
     GENOME_SEARCH_PROXY = EMG_CONF['emg']['genome_fragment_search_url']
 except KeyError:
@@ -296,6 +309,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request SQL / Mongo / serializer profiling, on in debug mode,
+# opt in elsewhere with emg.request_profiling.
+# Exposed as response headers in debug mode, logged otherwise.
+try:
+    REQUEST_PROFILING = EMG_CONF['emg']['request_profiling']
+except KeyError:
+    REQUEST_PROFILING = DEBUG
+
+REQUEST_PROFILING_HEADERS = DEBUG
+
+if REQUEST_PROFILING:
+    monitoring.register(MongoCommandProfiler())
+    MIDDLEWARE.insert(0, 'emgcli.middleware.RequestProfilingMiddleware')
+
 if DEBUG:
     MIDDLEWARE.insert(0, 'debug_toolbar.middleware.DebugToolbarMiddleware')
 
@@ -457,6 +484,24 @@ try:
 except:
     EMG_DEFAULT_LIMIT = 20
 
+# CSV exports are streamed row by row, the limit only guards against
+# requests running for too long. Set csv_max_rows to null to lift it.
+try:
+    EMG_CSV_MAX_ROWS = EMG_CONF['emg']['csv_max_rows']
+except KeyError:
+    EMG_CSV_MAX_ROWS = 2000 * EMG_DEFAULT_LIMIT
+EMG_CSV_CHUNK_SIZE = 500
+
+# Seconds the QC charts (paths and parsed files) are cached for,
+# entries of rewritten or new files expire at most this long after.
+try:
+    QC_CHART_CACHE_TIMEOUT = EMG_CONF['emg']['qc_chart_cache_timeout']
+except KeyError:
+    QC_CHART_CACHE_TIMEOUT = 60 * 60
+
+# Rows per Arrow record batch / Parquet row group in the columnar exports
+EMG_COLUMNAR_EXPORT_BATCH_SIZE = 10000
+
 # Authentication backends
 try:
     AUTHENTICATION_BACKENDS = EMG_CONF['emg']['auth_backends']
@@ -672,6 +717,12 @@ except KeyError:
     )
     RESULTS_PRODUCTION_DIR = ""
 
+# Index of the result directories of the archive, built by index_result_dirs
+try:
+    RESULTS_DIR_INDEX = EMG_CONF['emg']['results_dir_index']
+except KeyError:
+    RESULTS_DIR_INDEX = None
+
 # Webin - ENA - MGnify #
 try:
     ENA_MGNIFY_PREFIX = EMG_CONF['emg']['ena_mgnify_prefix']
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from django.urls import reverse
+
+from rest_framework import status
+
+from emgapi import models as emg_models
+from emgapi.columnar import StudyMatrix, write_matrix
+
+from test_utils.emg_fixtures import *  # noqa
+
+
+def _content(response):
+    return b''.join(response.streaming_content)
+
+
+@pytest.fixture
+def ipr_matrix(tmp_path, settings, study, pipeline):
+    settings.RESULTS_DIR = str(tmp_path)
+    summary_dir = tmp_path / study.result_directory / 'version_4.1' / 'project-summary'
+    summary_dir.mkdir(parents=True)
+    df = pd.DataFrame({
+        'IPR': ['IPR000001', 'IPR000002', 'IPR000003'],
+        'description': ['Kringle', 'Cdc20/Fizzy', 'Retinoid X receptor'],
+        'ERR0001': [10, 0, 3],
+        'ERR0002': [0, 5, 7],
+        'ERR0003': [1, 1, 1],
+    })
+    write_matrix(df, str(summary_dir / 'IPR_abundances_v4.1.arrow'))
+    emg_models.StudyDownload.objects.create(
+        study=study,
+        pipeline=pipeline,
+        realname='IPR_abundances_v4.1.tsv',
+        alias='SRP01234_IPR_abundances_v4.1.tsv',
+        subdir=emg_models.DownloadSubdir.objects.create(subdir='version_4.1/project-summary'),
+    )
+    return df
+
+
+@pytest.mark.django_db
+class TestColumnarExport:
+
+    def test_studies_parquet(self, client, studies, settings):
+        settings.EMG_COLUMNAR_EXPORT_BATCH_SIZE = 10
+        url = reverse('emgapi_v1:studies-export')
+        response = client.get(url + '?format=parquet')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/vnd.apache.parquet'
+        assert response['Content-Disposition'] == 'attachment; filename="studies.parquet"'
+
+        parquet = pq.ParquetFile(io.BytesIO(_content(response)))
+        # 49 studies in batches of 10
+        assert parquet.metadata.num_rows == 49
+        assert parquet.metadata.num_row_groups == 5
+        table = parquet.read()
+        assert 'MGYS00000001' in table.column('accession').to_pylist()
+        assert set(table.column('biome').to_pylist()) == {'root:foo:bar'}
+
+    def test_studies_filtered(self, client, studies):
+        url = reverse('emgapi_v1:studies-export')
+        response = client.get(url + '?format=parquet&accession=MGYS00000001')
+        table = pq.read_table(io.BytesIO(_content(response)))
+        assert table.column('accession').to_pylist() == ['MGYS00000001']
+        assert table.column('secondary_accession').to_pylist() == ['SRP0001']
+
+    def test_samples_arrow_with_metadata(self, client, sample, var_names):
+        emg_models.SampleAnn.objects.create(
+            sample=sample, var=emg_models.VariableNames.objects.get(var_name='host taxid'), var_val_ucv='9606'
+        )
+        url = reverse('emgapi_v1:samples-export')
+        response = client.get(url + '?format=arrow')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/vnd.apache.arrow.stream'
+
+        table = pa.ipc.open_stream(_content(response)).read_all()
+        assert table.num_rows == 1
+        assert table.column('accession').to_pylist() == ['ERS01234']
+        assert table.column('latitude').to_pylist() == [12.3456]
+        assert table.column('metadata.host taxid').to_pylist() == ['9606']
+
+    def test_empty_export_has_schema(self, client, db):
+        url = reverse('emgapi_v1:analyses-export')
+        response = client.get(url + '?format=parquet')
+        assert response.status_code == status.HTTP_200_OK
+        table = pq.read_table(io.BytesIO(_content(response)))
+        assert table.num_rows == 0
+        assert 'pipeline_version' in table.column_names
+
+
+class TestStudyMatrix:
+
+    def test_slice(self, tmp_path):
+        path = str(tmp_path / 'matrix.arrow')
+        write_matrix(pd.DataFrame({
+            '#SampleID': ['sk__Bacteria', 'sk__Archaea'],
+            'ERR0001': [3, 4],
+            'ERR0002': [0, 9],
+        }), path)
+        assert not os.path.exists(path + '.tmp')
+
+        matrix = StudyMatrix(path)
+        assert matrix.key_columns == ['#SampleID']
+        assert matrix.analyses == ['ERR0001', 'ERR0002']
+        table = matrix.slice(terms=['sk__Archaea'], analyses=['ERR0002'])
+        assert table.to_pydict() == {'#SampleID': ['sk__Archaea'], 'ERR0002': [9]}
+        assert matrix.slice().num_rows == 2
+        with pytest.raises(KeyError):
+            matrix.slice(analyses=['ERR9999'])
+
+
+@pytest.mark.django_db
+class TestStudyMatrixAPI:
+
+    def _url(self):
+        return reverse(
+            'emgapi_v1:studydownload-matrix',
+            args=['MGYS00001234', '4.1', 'SRP01234_IPR_abundances_v4.1.tsv']
+        )
+
+    def test_slice_arrow(self, client, ipr_matrix):
+        response = client.get(self._url() + '?format=arrow&analyses=ERR0002,ERR0003&terms=IPR000002,IPR000003')
+        assert response.status_code == status.HTTP_200_OK
+        table = pa.ipc.open_stream(_content(response)).read_all()
+        assert table.column_names == ['IPR', 'description', 'ERR0002', 'ERR0003']
+        assert table.column('IPR').to_pylist() == ['IPR000002', 'IPR000003']
+        assert table.column('ERR0002').to_pylist() == [5, 7]
+
+    def test_full_matrix_csv(self, client, ipr_matrix):
+        response = client.get(self._url() + '?format=csv')
+        assert response.status_code == status.HTTP_200_OK
+        lines = _content(response).decode().splitlines()
+        assert lines[0] == '"IPR","description","ERR0001","ERR0002","ERR0003"'
+        assert lines[1] == '"IPR000001","Kringle",10,0,1'
+        assert len(lines) == 4
+
+    def test_unknown_analysis(self, client, ipr_matrix):
+        response = client.get(self._url() + '?format=arrow&analyses=ERR9999')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_no_matrix(self, client, ipr_matrix, settings, tmp_path):
+        settings.RESULTS_DIR = str(tmp_path / 'elsewhere')
+        response = client.get(self._url() + '?format=arrow')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -16,8 +16,10 @@
 
 import random
 
+import pysam
 import pytest
 from django.urls import reverse
+from emgapianns import contig_files as contig_files_module
 from emgapianns import models as m_models
 from rest_framework import status
 from test_utils.emg_fixtures import *  # noqa
@@ -110,3 +112,124 @@ class TestContigsAPI:
             db_contig = next(fc for fc in filtered_contigs if fc.contig_id == contig_id)
             assert contig_id == db_contig.contig_id
             assert has_cog == db_contig.has_cog
+
+
+@pytest.fixture()
+def contig_files(tmp_path, settings):
+    """bgzip FASTA and GFF files of the run_v5 analysis"""
+    settings.RESULTS_DIR = str(tmp_path)
+    result_dir = tmp_path / "test_data/version_5.0/ABC_FASTQ"
+    (result_dir / "functional-annotation").mkdir(parents=True)
+    sequences = {
+        "contig_1": "ACGT" * 50000,
+        "contig_2": "GGCC" * 10,
+    }
+    fasta = result_dir / "ABC_FASTQ.fasta"
+    fasta.write_text("".join(">{}\n{}\n".format(name, seq) for name, seq in sequences.items()))
+    pysam.tabix_compress(str(fasta), str(fasta) + ".bgz")
+    pysam.faidx(str(fasta) + ".bgz")
+
+    gff = result_dir / "functional-annotation" / "ABC_FASTQ.annotations.gff"
+    gff.write_text(
+        "contig_1\tProdigal\tCDS\t1\t300\t.\t+\t0\tID=contig_1_1\n"
+        "contig_1\tProdigal\tCDS\t500\t900\t.\t-\t0\tID=contig_1_2\n"
+        "contig_2\tProdigal\tCDS\t1\t30\t.\t+\t0\tID=contig_2_1\n"
+    )
+    pysam.tabix_compress(str(gff), str(gff) + ".bgz")
+    pysam.tabix_index(str(gff) + ".bgz", preset="gff")
+    contig_files_module.handle_cache.clear()
+    return sequences
+
+
+@pytest.mark.django_db
+class TestContigFilesAPI:
+    def test_fasta(self, client, run_v5, contig_files):
+        url = reverse("emgapi_v1:analysis-contigs-detail", args=["MGYA00001234", "contig_1"])
+        for _ in range(2):
+            response = client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert response.streaming
+            content = b"".join(response.streaming_content).decode()
+            assert content == ">contig_1\n" + contig_files["contig_1"]
+            assert int(response["Content-Length"]) == len(content)
+        assert len(contig_files_module.handle_cache.handles) == 1
+
+        url = reverse("emgapi_v1:analysis-contigs-detail", args=["MGYA00001234", "contig_3"])
+        assert client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_gff(self, client, run_v5, contig_files):
+        url = reverse("emgapi_v1:analysis-contigs-retrieve-gff", args=["MGYA00001234", "contig_1"])
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        assert [row.split("\t")[8] for row in rows] == ["ID=contig_1_1", "ID=contig_1_2"]
+
+        url = reverse("emgapi_v1:analysis-contigs-retrieve-gff", args=["MGYA00001234", "contig_3"])
+        assert client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    def test_batch_fasta(self, client, run_v5, contig_files, settings):
+        url = reverse("emgapi_v1:analysis-contigs-batch-fasta", args=["MGYA00001234"])
+        response = client.get(url, {"contig_id": "contig_2,contig_3,contig_1"})
+        assert response.status_code == status.HTTP_200_OK
+        content = b"".join(response.streaming_content).decode()
+        # in the order of the file, contig_3 is not in it
+        assert content == ">contig_1\n{}\n>contig_2\n{}\n".format(contig_files["contig_1"], contig_files["contig_2"])
+        assert int(response["Content-Length"]) == len(content)
+
+        settings.CONTIG_BATCH_MAX_CONTIGS = 1
+        response = client.get(url, {"contig_id": "contig_1,contig_2"})
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+    def test_batch_gff(self, client, run_v5, contig_files):
+        url = reverse("emgapi_v1:analysis-contigs-batch-gff", args=["MGYA00001234"])
+        response = client.get(url + "?contig_id=contig_2&contig_id=contig_1")
+        assert response.status_code == status.HTTP_200_OK
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        assert [row.split("\t")[8] for row in rows] == ["ID=contig_1_1", "ID=contig_1_2", "ID=contig_2_1"]
+
+    def test_fasta_region(self, client, run_v5, contig_files):
+        url = reverse("emgapi_v1:analysis-contigs-detail", args=["MGYA00001234", "contig_1"])
+        response = client.get(url, {"start": 3, "end": 10})
+        assert response.status_code == status.HTTP_200_OK
+        assert b"".join(response.streaming_content).decode() == ">contig_1:3-10\n" + contig_files["contig_1"][2:10]
+
+        response = client.get(url, {"start": 199999})
+        assert b"".join(response.streaming_content).decode() == ">contig_1:199999-200000\nGT"
+
+        for params in ({"start": 0}, {"start": "a"}, {"start": 10, "end": 9}):
+            assert client.get(url, params).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_fasta_byte_range(self, client, run_v5, contig_files):
+        url = reverse("emgapi_v1:analysis-contigs-detail", args=["MGYA00001234", "contig_1"])
+        content = ">contig_1\n" + contig_files["contig_1"]
+        for range_header, expected in (
+            ("bytes=0-4", content[0:5]),
+            ("bytes=8-13", content[8:14]),
+            ("bytes=100000-", content[100000:]),
+            ("bytes=-3", content[-3:]),
+        ):
+            response = client.get(url, HTTP_RANGE=range_header)
+            assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+            assert b"".join(response.streaming_content).decode() == expected
+            assert int(response["Content-Length"]) == len(expected)
+            assert response["Content-Range"].endswith("/{}".format(len(content)))
+
+        response = client.get(url, HTTP_RANGE="bytes=0-1,5-6")
+        assert response.status_code == status.HTTP_200_OK
+
+        response = client.get(url, HTTP_RANGE="bytes=300000-")
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response["Content-Range"] == "bytes */{}".format(len(content))
+
+    def test_gff_region(self, client, run_v5, contig_files):
+        url = reverse("emgapi_v1:analysis-contigs-retrieve-gff", args=["MGYA00001234", "contig_1"])
+        for params, expected in (
+            ({"start": 400, "end": 450}, []),
+            ({"start": 250, "end": 600}, ["ID=contig_1_1", "ID=contig_1_2"]),
+            ({"start": 900}, ["ID=contig_1_2"]),
+            ({"end": 1}, ["ID=contig_1_1"]),
+        ):
+            response = client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            rows = b"".join(response.streaming_content).decode().splitlines()
+            assert [row.split("\t")[8] for row in rows] == expected
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from django.test import RequestFactory
+from django.urls import reverse
+
+from emgapi import models as emg_models
+from emgapi.utils import prepare_results_file_download_response
+
+from test_utils.emg_fixtures import *  # noqa
+
+
+@pytest.fixture
+def results_file(tmp_path, settings):
+    settings.RESULTS_DIR = str(tmp_path)
+    (tmp_path / "2019/01/ERP001").mkdir(parents=True)
+    content = bytes(range(256)) * 1000
+    (tmp_path / "2019/01/ERP001/summary.tsv.gz").write_bytes(content)
+    return content
+
+
+class TestResultsFileDownload:
+
+    def test_nginx_redirect(self, results_file, settings):
+        settings.DOWNLOADS_BYPASS_NGINX = False
+        response = prepare_results_file_download_response("/2019/01/ERP001/summary.tsv.gz", "ERP001_summary.tsv.gz")
+        assert response['X-Accel-Redirect'] == '/results/2019/01/ERP001/summary.tsv.gz'
+        assert response.content == b''
+
+    def test_bypass_nginx(self, results_file, settings):
+        settings.DOWNLOADS_BYPASS_NGINX = True
+        request = RequestFactory().get('/')
+        response = prepare_results_file_download_response(
+            "/2019/01/ERP001/summary.tsv.gz", "ERP001_summary.tsv.gz", request)
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'application/octet-stream'
+        assert 'attachment; filename="ERP001_summary.tsv.gz"' == response['Content-Disposition']
+        assert int(response['Content-Length']) == len(results_file)
+        assert b''.join(response.streaming_content) == results_file
+
+    @pytest.mark.parametrize('range_header, first, last', [
+        ('bytes=0-99', 0, 100),
+        ('bytes=255000-', 255000, 256000),
+        ('bytes=-10', 255990, 256000),
+        ('bytes=1000-999999', 1000, 256000),
+    ])
+    def test_bypass_nginx_range(self, results_file, settings, range_header, first, last):
+        settings.DOWNLOADS_BYPASS_NGINX = True
+        request = RequestFactory().get('/', HTTP_RANGE=range_header)
+        response = prepare_results_file_download_response(
+            "/2019/01/ERP001/summary.tsv.gz", "ERP001_summary.tsv.gz", request)
+        assert response.status_code == 206
+        assert response['Content-Range'] == 'bytes {}-{}/{}'.format(first, last - 1, len(results_file))
+        assert int(response['Content-Length']) == last - first
+        assert b''.join(response.streaming_content) == results_file[first:last]
+
+    def test_bypass_nginx_range_not_satisfiable(self, results_file, settings):
+        settings.DOWNLOADS_BYPASS_NGINX = True
+        request = RequestFactory().get('/', HTTP_RANGE='bytes=256000-')
+        response = prepare_results_file_download_response(
+            "/2019/01/ERP001/summary.tsv.gz", "ERP001_summary.tsv.gz", request)
+        assert response.status_code == 416
+        assert response['Content-Range'] == 'bytes */256000'
+
+
+@pytest.fixture
+def bundle_downloads(tmp_path, settings, study, run_v5, pipelines):
+    settings.RESULTS_DIR = str(tmp_path)
+    taxonomic = emg_models.DownloadGroupType.objects.get_or_create(group_type='Taxonomic analysis')[0]
+    functional = emg_models.DownloadGroupType.objects.get_or_create(group_type='Functional analysis')[0]
+    md5 = emg_models.ChecksumAlgorithm.objects.get_or_create(name='MD5')[0]
+
+    summary_dir = tmp_path / study.result_directory / 'version_5.0' / 'project-summary'
+    summary_dir.mkdir(parents=True)
+    (summary_dir / 'phylum_taxonomy_abundances_v5.0.tsv').write_text('phylum\tERR1\nFirmicutes\t10\n')
+    (summary_dir / 'GO_abundances_v5.0.tsv').write_text('GO\tERR1\nGO:0001\t3\n')
+    subdir = emg_models.DownloadSubdir.objects.create(subdir='version_5.0/project-summary')
+    pipeline = pipelines.filter(release_version='5.0').first()
+    for realname, group in (('phylum_taxonomy_abundances_v5.0.tsv', taxonomic),
+                            ('GO_abundances_v5.0.tsv', functional),
+                            ('missing_v5.0.tsv', functional)):
+        emg_models.StudyDownload.objects.create(
+            study=study, pipeline=pipeline, subdir=subdir, group_type=group,
+            realname=realname, alias='SRP01234_' + realname,
+            file_checksum='md5-of-' + realname, checksum_algorithm=md5,
+        )
+
+    job = emg_models.AnalysisJob.objects.get(pk=1234)
+    analysis_dir = tmp_path / job.result_directory
+    analysis_dir.mkdir(parents=True)
+    (analysis_dir / 'ABC_FASTQ_MERGED.fasta.gz').write_bytes(bytes(range(256)) * 5000)
+    emg_models.AnalysisJobDownload.objects.create(
+        job=job, pipeline=pipeline, group_type=taxonomic,
+        realname='ABC_FASTQ_MERGED.fasta.gz', alias='ABC_FASTQ_MERGED.fasta.gz',
+    )
+    return job
+
+
+@pytest.mark.django_db
+class TestDownloadBundles:
+
+    def test_study_zip(self, client, bundle_downloads):
+        url = reverse('emgapi_v1:studydownload-bundle', args=['MGYS00001234'])
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/zip'
+        assert response.streaming
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == [
+            'MGYS00001234/5.0/SRP01234_GO_abundances_v5.0.tsv',
+            'MGYS00001234/5.0/SRP01234_phylum_taxonomy_abundances_v5.0.tsv',
+            'MGYS00001234/manifest.tsv',
+        ]
+        assert archive.read('MGYS00001234/5.0/SRP01234_GO_abundances_v5.0.tsv') == b'GO\tERR1\nGO:0001\t3\n'
+        manifest = archive.read('MGYS00001234/manifest.tsv').decode().splitlines()
+        assert manifest[0] == 'path\tchecksum\tchecksum_algorithm\tdescription'
+        assert 'MGYS00001234/5.0/SRP01234_GO_abundances_v5.0.tsv\tmd5-of-GO_abundances_v5.0.tsv\tMD5\t' in manifest
+        assert len(manifest) == 3
+
+    def test_study_tar_with_analyses(self, client, bundle_downloads):
+        url = reverse('emgapi_v1:studydownload-bundle', args=['SRP01234'])
+        response = client.get(url, {'archive': 'tar', 'analyses': 'true', 'group': 'Taxonomic analysis'})
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/x-tar'
+        archive = tarfile.open(fileobj=io.BytesIO(b''.join(response.streaming_content)))
+        assert archive.getnames() == [
+            'MGYS00001234/manifest.tsv',
+            'MGYS00001234/5.0/SRP01234_phylum_taxonomy_abundances_v5.0.tsv',
+            'MGYS00001234/{}/ABC_FASTQ_MERGED.fasta.gz'.format(bundle_downloads.accession),
+        ]
+        member = archive.extractfile('MGYS00001234/{}/ABC_FASTQ_MERGED.fasta.gz'.format(bundle_downloads.accession))
+        assert member.read() == bytes(range(256)) * 5000
+
+    def test_analysis_bundle(self, client, bundle_downloads):
+        url = reverse('emgapi_v1:analysisdownload-bundle', args=[bundle_downloads.accession])
+        response = client.get(url)
+        assert response.status_code == 200
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        assert sorted(archive.namelist()) == [
+            '{}/ABC_FASTQ_MERGED.fasta.gz'.format(bundle_downloads.accession),
+            '{}/manifest.tsv'.format(bundle_downloads.accession),
+        ]
+
+        assert client.get(url, {'archive': 'rar'}).status_code == 400
@@ -67,3 +67,65 @@ class TestGenomesAPI:
         assert rsp['data'][0]['attributes']['genome-id'] == genome.pk
         assert rsp['data'][0]['attributes']['accession'] == 'MGYG000000001'
         assert rsp['data'][0]['attributes']['taxon-lineage'] == 'd__Test;'
+
+    @pytest.mark.parametrize('lineage_filter, expected', [
+        ('g__Bacteroides', ['MGYG000000002', 'MGYG000000003']),
+        ('g__Bacteroides_A', ['MGYG000000003']),
+        ('f__Bacteroidaceae;g__Bacteroides', ['MGYG000000002', 'MGYG000000003']),
+        ('s__Bacteroides fragilis', ['MGYG000000002']),
+        ('p__Bacteroidota;c__Bacteroidia', ['MGYG000000002', 'MGYG000000003']),
+        ('d__Bacteria', ['MGYG000000001', 'MGYG000000002', 'MGYG000000003']),
+        # not consecutive ranks, matched as a substring of the lineage
+        ('d__Bacteria;g__Bacteroides', []),
+        ('Bacteroides', ['MGYG000000002', 'MGYG000000003']),
+        # case-sensitive, as the substring match (SQLite's LIKE isn't, so only the exact ranks are tested)
+        ('p__bacteroidota;c__Bacteroidia', []),
+    ])
+    def test_genomes_taxon_lineage_filter(self, client, genome, lineage_filter, expected):
+        genome.taxon_lineage = 'd__Bacteria;p__Firmicutes_A;c__Clostridia;o__Peptostreptococcales;' \
+                               'f__Peptostreptococcaceae;g__GCA-900066495;s__'
+        genome.save()
+        for accession, lineage in (
+            ('MGYG000000002', 'd__Bacteria;p__Bacteroidota;c__Bacteroidia;o__Bacteroidales;'
+                              'f__Bacteroidaceae;g__Bacteroides;s__Bacteroides fragilis'),
+            ('MGYG000000003', 'd__Bacteria;p__Bacteroidota;c__Bacteroidia;o__Bacteroidales;'
+                              'f__Bacteroidaceae;g__Bacteroides_A;s__'),
+        ):
+            other = emg_models.Genome.objects.get(pk=genome.pk)
+            other.pk = None
+            other.accession = accession
+            other.taxon_lineage = lineage
+            other.save()
+
+        assert emg_models.Genome.objects.get(accession='MGYG000000002').taxon_genus == 'Bacteroides'
+        assert emg_models.Genome.objects.get(accession='MGYG000000003').taxon_species is None
+
+        url = reverse('emgapi_v1:genomes-list')
+        response = client.get(url, {'taxon_lineage': lineage_filter, 'ordering': 'accession'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [d['id'] for d in response.json()['data']] == expected
+
+    def test_genomes_accession_filter(self, client, genome):
+        genome.ena_genome_accession = 'ERZ0000001'
+        genome.ncbi_sample_accession = 'SAMN0000001'
+        genome.save()
+        other = emg_models.Genome.objects.get(pk=genome.pk)
+        other.pk = None
+        other.accession = 'MGYG000000002'
+        other.ena_genome_accession = 'ERZ0000002'
+        other.save()
+        # written without save(), so its aliases are synced by the writer
+        emg_models.Genome.objects.filter(pk=other.pk).update(img_genome_accession='IMG0000002')
+        emg_models.AccessionAlias.objects.sync(emg_models.Genome, [other.pk])
+
+        url = reverse('emgapi_v1:genomes-list')
+        for accessions, expected in (
+            ('MGYG000000001', ['MGYG000000001']),
+            ('ERZ0000002', ['MGYG000000002']),
+            ('SAMN0000001', ['MGYG000000001', 'MGYG000000002']),
+            ('ERZ0000001,IMG0000002', ['MGYG000000001', 'MGYG000000002']),
+            ('ERZ0000003', []),
+        ):
+            response = client.get(url, {'accession': accessions, 'ordering': 'accession'})
+            assert response.status_code == status.HTTP_200_OK
+            assert [d['id'] for d in response.json()['data']] == expected
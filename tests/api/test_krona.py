@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import os
+
+import pytest
+
+from django.urls import reverse
+
+from rest_framework import status
+
+from emgapi import krona
+
+from test_utils.emg_fixtures import *  # noqa
+
+KRONA = '<html><body>' + 'krona ' * 1000 + '</body></html>'
+
+
+@pytest.fixture
+def krona_files(tmp_path, settings, run_v5):
+    settings.RESULTS_DIR = str(tmp_path)
+    settings.DOWNLOADS_BYPASS_NGINX = True
+    taxonomy_dir = tmp_path / 'test_data/version_5.0/ABC_FASTQ/taxonomy-summary'
+    (taxonomy_dir / 'LSU').mkdir(parents=True)
+    (taxonomy_dir / 'LSU' / 'krona.html').write_text(KRONA)
+    (taxonomy_dir / 'krona.html').write_text(KRONA)
+    return taxonomy_dir
+
+
+def krona_url(subdir=None):
+    if subdir is None:
+        return reverse('emgapi_v1:analysis-krona-list', args=['MGYA00001234'])
+    return reverse('emgapi_v1:analysis-krona-detail', args=['MGYA00001234', subdir])
+
+
+def test_accepted_encodings(rf):
+    request = rf.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0, deflate, br;q=0.5')
+    assert krona.accepted_encodings(request) == {'deflate', 'br'}
+
+
+def test_compress_charts(tmp_path):
+    (tmp_path / 'LSU').mkdir()
+    (tmp_path / 'LSU' / 'krona.html').write_text(KRONA)
+    (tmp_path / 'krona.html').write_text(KRONA)
+    assert krona.compress_charts(str(tmp_path)) == 2
+    with gzip.open(tmp_path / 'LSU' / 'krona.html.gz', 'rt') as f:
+        assert f.read() == KRONA
+
+
+@pytest.mark.django_db
+class TestKronaAPI:
+
+    def test_gzip(self, client, krona_files):
+        response = client.get(krona_url('lsu'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Encoding'] == 'gzip'
+        assert response['Content-Type'] == 'text/html; charset=utf-8'
+        assert 'Accept-Encoding' in response['Vary']
+        assert gzip.decompress(b''.join(response.streaming_content)).decode() == KRONA
+        assert os.path.isfile(krona_files / 'LSU' / 'krona.html.gz')
+
+    def test_uncompressed(self, client, krona_files):
+        response = client.get(krona_url())
+        assert response.status_code == status.HTTP_200_OK
+        assert not response.has_header('Content-Encoding')
+        assert b''.join(response.streaming_content).decode() == KRONA
+
+    def test_etag(self, client, krona_files):
+        response = client.get(krona_url('lsu'), HTTP_ACCEPT_ENCODING='gzip')
+        etag = response['ETag']
+        assert etag != client.get(krona_url('lsu'))['ETag']
+
+        response = client.get(krona_url('lsu'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        path = krona_files / 'LSU' / 'krona.html'
+        path.write_text(KRONA + '\n')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        response = client.get(krona_url('lsu'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert gzip.decompress(b''.join(response.streaming_content)).decode() == KRONA + '\n'
+
+    def test_nginx_redirect(self, client, krona_files, settings):
+        settings.DOWNLOADS_BYPASS_NGINX = False
+        response = client.get(krona_url('lsu'), HTTP_ACCEPT_ENCODING='gzip')
+        # NGINX drops Content-Encoding on internal redirects, gzip_static serves the copy
+        assert response['X-Accel-Redirect'] == \
+            '/results/test_data/version_5.0/ABC_FASTQ/taxonomy-summary/LSU/krona.html'
+        assert response['Content-Type'] == 'text/html; charset=utf-8'
+        assert not response.has_header('Content-Encoding')
+        assert os.path.isfile(krona_files / 'LSU' / 'krona.html.gz')
+
+    def test_not_found(self, client, krona_files):
+        response = client.get(krona_url('unite'))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = client.get(reverse('emgapi_v1:analysis-krona-list', args=['MGYA00009999']))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from rest_framework import status
+
+from emgapi import qc_charts
+
+from test_utils.emg_fixtures import *  # noqa
+
+SEQ_LENGTH = ''.join('{}\t{}\n'.format(length, length * 10) for length in range(100, 110))
+
+
+@pytest.fixture
+def qc_files(tmp_path, settings, run_v5):
+    settings.RESULTS_DIR = str(tmp_path)
+    cache.clear()
+    qc_dir = tmp_path / 'test_data/version_5.0/ABC_FASTQ/qc-statistics'
+    qc_dir.mkdir(parents=True)
+    (qc_dir / 'seq-length.out.full').write_text(SEQ_LENGTH)
+    (qc_dir / 'summary.out').write_text('bp_count\t161527046\naverage_length\t134.95\n')
+    (qc_dir / 'nucleotide-distribution.out').write_text('pos\tA\tT\n1\t25.5\t24.5\n2\t26.0\t24.0\n')
+    yield qc_dir
+    cache.clear()
+
+
+def qc_chart_url(chart):
+    return reverse('emgapi_v1:analysis-qcchart-detail', args=['MGYA00001234', chart])
+
+
+def test_parse_chart():
+    assert qc_charts.parse_chart('100\t1\n101\t2\n', 'seq-length') == {'length': [100, 101], 'count': [1, 2]}
+    assert qc_charts.parse_chart('pos\tA\n1\t25.5\n', 'nucleotide-distribution') == {'pos': [1], 'A': [25.5]}
+    assert qc_charts.parse_chart('bp_count\t10\n', 'summary') == {'bp_count': 10}
+    assert qc_charts.parse_chart('', 'nucleotide-distribution') == {}
+    assert qc_charts.parse_chart('', 'summary') == {}
+
+
+def test_downsample():
+    data = {'length': [1, 2, 3, 4, 5], 'count': [1, 1, 1, 1, 1]}
+    assert qc_charts.downsample(data, 2) == {'length': [1, 4], 'count': [3, 2]}
+    assert qc_charts.downsample(data, 10) == data
+
+
+@pytest.mark.django_db
+class TestQCChartAPI:
+
+    def test_tsv(self, client, qc_files):
+        response = client.get(qc_chart_url('seq-length'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.content.decode() == SEQ_LENGTH
+
+    def test_json(self, client, qc_files):
+        response = client.get(qc_chart_url('seq-length'), {'format': 'json'})
+        assert response.status_code == status.HTTP_200_OK
+        data = response.json()
+        assert data['length'] == list(range(100, 110))
+        assert data['count'] == [length * 10 for length in range(100, 110)]
+
+        response = client.get(qc_chart_url('summary'), {'format': 'json'})
+        assert response.json() == {'bp_count': 161527046, 'average_length': 134.95}
+
+        response = client.get(qc_chart_url('nucleotide-distribution'), {'format': 'json'})
+        assert response.json() == {'pos': [1, 2], 'A': [25.5, 26.0], 'T': [24.5, 24.0]}
+
+    def test_json_bins(self, client, qc_files):
+        response = client.get(qc_chart_url('seq-length'), {'format': 'json', 'bins': 5})
+        assert response.json() == {
+            'length': [100, 102, 104, 106, 108],
+            'count': [2010, 2050, 2090, 2130, 2170],
+        }
+        response = client.get(qc_chart_url('seq-length'), {'format': 'json', 'bins': 0})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cached_by_mtime(self, client, qc_files):
+        path = qc_files / 'seq-length.out.full'
+        client.get(qc_chart_url('seq-length'), {'format': 'json'})
+
+        path.write_text('1\t1\n')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        response = client.get(qc_chart_url('seq-length'), {'format': 'json'})
+        assert response.json() == {'length': [1], 'count': [1]}
+
+    def test_cache_expires(self, client, qc_files, settings):
+        settings.QC_CHART_CACHE_TIMEOUT = 0
+        client.get(qc_chart_url('seq-length'), {'format': 'json'})
+
+        # a file with a preferred suffix, written after the path was cached
+        (qc_files / 'seq-length.out').write_text('1\t1\n')
+        response = client.get(qc_chart_url('seq-length'), {'format': 'json'})
+        assert response.json() == {'length': [1], 'count': [1]}
+
+    def test_empty_file(self, client, qc_files):
+        (qc_files / 'nucleotide-distribution.out').write_text('')
+        response = client.get(qc_chart_url('nucleotide-distribution'), {'format': 'json'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {}
+
+    def test_not_found(self, client, qc_files):
+        response = client.get(qc_chart_url('gc-distribution'), {'format': 'json'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = client.get(qc_chart_url('gc-distribution'))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
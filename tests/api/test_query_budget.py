@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from django.urls import reverse
+
+from rest_framework import status
+
+from test_utils.emg_fixtures import *  # noqa
+
+
+# Regression budgets for the per-request work, as reported by the
+# emgcli.middleware.RequestProfilingMiddleware.
+# (url name, url args, query string, fixtures, max SQL queries, max latency in ms)
+# The fixtures create a full page of rows (or more) so an N+1 query regression
+# shows up as a blown budget. The budgets are the current query counts,
+# lower them when an endpoint is optimised.
+# The latency baselines are deliberately loose, they only catch gross regressions.
+ENDPOINT_BUDGETS = [
+    ('emgapi_v1:biomes-list', [], '', ['biome'], 2, 2000),
+    ('emgapi_v1:studies-list', [], '', ['studies'], 27, 2000),
+    ('emgapi_v1:studies-detail', ['MGYS00001234'], '', ['study'], 3, 2000),
+    ('emgapi_v1:super-studies-list', [], '', ['super_study'], 2, 2000),
+    ('emgapi_v1:samples-list', [], '', ['samples'], 29, 2000),
+    ('emgapi_v1:samples-detail', ['ERS01234'], '', ['sample'], 4, 2000),
+    ('emgapi_v1:runs-list', [], '', ['runs'], 52, 2000),
+    ('emgapi_v1:analyses-list', [], '', ['runs'], 2, 2000),
+    ('emgapi_v1:studies-analyses-list', ['MGYS00001234'], '', ['runs'], 2, 2000),
+    ('emgapi_v1:studies-samples-list', ['MGYS00001234'], '', ['sample'], 6, 2000),
+    ('emgapi_v1:assemblies-list', [], '', ['assemblies'], 1, 2000),
+    ('emgapi_v1:pipelines-list', [], '', ['pipelines'], 7, 2000),
+    ('emgapi_v1:genomes-list', [], '', ['genome'], 3, 2000),
+    ('emgapi_v1:genome-catalogues-list', [], '', ['genome_catalogue'], 3, 2000),
+    ('emgapi_v1:studies-list', ['csv'], '', ['studies'], 51, 2000),
+]
+
+
+@pytest.fixture(autouse=True)
+def request_profiling(settings):
+    # off by default outside debug mode
+    if 'emgcli.middleware.RequestProfilingMiddleware' not in settings.MIDDLEWARE:
+        settings.MIDDLEWARE = ['emgcli.middleware.RequestProfilingMiddleware'] + list(settings.MIDDLEWARE)
+
+
+@pytest.mark.django_db
+class TestQueryBudget:
+
+    @pytest.mark.parametrize(
+        'url_name, args, query, fixtures, max_queries, max_latency',
+        ENDPOINT_BUDGETS
+    )
+    def test_endpoint_within_budget(self, request, client, settings, url_name, args, query,
+                                    fixtures, max_queries, max_latency):
+        for fixture in fixtures:
+            request.getfixturevalue(fixture)
+        settings.REQUEST_PROFILING_HEADERS = True
+
+        if args == ['csv']:
+            url = reverse(url_name, kwargs={'format': 'csv'})
+        else:
+            url = reverse(url_name, args=args)
+        response = client.get(url + query)
+        assert response.status_code == status.HTTP_200_OK
+
+        sql_queries = int(response['X-EMG-SQL-Queries'])
+        assert sql_queries <= max_queries, \
+            '{} issued {} SQL queries, the budget is {}'.format(url, sql_queries, max_queries)
+
+        timings = dict(
+            (t.split(';')[0], float(t.split('dur=')[-1]))
+            for t in response['Server-Timing'].split(', ')
+        )
+        assert timings['total'] <= max_latency, \
+            '{} took {}ms, the baseline is {}ms'.format(url, timings['total'], max_latency)
+
+    def test_profiling_headers(self, client, settings, study):
+        settings.REQUEST_PROFILING_HEADERS = True
+        response = client.get(reverse('emgapi_v1:studies-detail', args=['MGYS00001234']))
+        assert int(response['X-EMG-SQL-Queries']) > 0
+        assert int(response['X-EMG-Mongo-Queries']) == 0
+        assert 'serializer;dur=' in response['Server-Timing']
+
+    def test_profiling_logs_without_headers(self, client, settings, study, caplog):
+        settings.REQUEST_PROFILING_HEADERS = False
+        with caplog.at_level('INFO', logger='emgcli.middleware'):
+            response = client.get(reverse('emgapi_v1:studies-detail', args=['MGYS00001234']))
+        assert 'X-EMG-SQL-Queries' not in response
+        assert '"path": "/v1/studies/MGYS00001234"' in caplog.text
+        assert '"sql_count": ' in caplog.text
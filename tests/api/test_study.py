@@ -21,6 +21,10 @@ from django.urls import reverse
 
 from rest_framework import status
 
+from emgapi import models as emg_models
+from emgapi.renderers import CSVStreamingRenderer
+from emgapi.utils import queryset_iterator
+
 from test_utils.emg_fixtures import *  # noqa
 
 
@@ -124,3 +128,66 @@ class TestStudyAPI:
             if expected_element is not None:
                 assert response_element == expected_element
 
+
+    def test_csv_is_streamed(self, client, studies, settings):
+        settings.EMG_CSV_CHUNK_SIZE = 10
+        url = reverse("emgapi_v1:studies-list", kwargs={'format': 'csv'})
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        rows = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        # header + 49 studies, more than one chunk
+        assert len(rows) == 50
+        assert len(set(rows)) == 50
+
+    def test_csv_too_long(self, client, studies, settings):
+        settings.EMG_CSV_MAX_ROWS = 10
+        url = reverse("emgapi_v1:studies-list", kwargs={'format': 'csv'})
+        response = client.get(url)
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+        settings.EMG_CSV_MAX_ROWS = None
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(b''.join(response.streaming_content).splitlines()) == 50
+
+    def test_csv_column_of_last_row(self):
+        # a column first set in the last row
+        def rows():
+            return ({'accession': i, 'biomes': [{'id': 'root'}] if i == 999 else []} for i in range(1000))
+        content = b''.join(CSVStreamingRenderer().render_rows(rows)).decode()
+        lines = content.splitlines()
+        assert lines[0] == '"accession","biomes.0.id"'
+        assert lines[1] == '0,""'
+        assert lines[-1] == '999,"root"'
+
+    def test_queryset_iterator_prefetch(self, studies):
+        queryset = emg_models.Study.objects.prefetch_related('publications').order_by('-study_id')
+        pks = [study.pk for study in queryset_iterator(queryset, 10)]
+        assert pks == list(range(49, 0, -1))
+
+    @pytest.mark.parametrize('accession', ['SRP01234', 'PRJDB1234'])
+    def test_details_by_alias(self, client, study, accession):
+        assert emg_models.AccessionAlias.objects.filter(entity_type='study', entity_id=study.pk).count() == 2
+
+        url = reverse("emgapi_v1:studies-detail", args=[accession])
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['data']['id'] == "MGYS00001234"
+
+    def test_sync_keeps_aliases_current(self, client, study):
+        # written without save(), e.g. by a bulk import, which then syncs the aliases
+        emg_models.Study.objects.filter(pk=study.pk).update(secondary_accession='SRP05678')
+        emg_models.AccessionAlias.objects.sync(emg_models.Study, [study.pk])
+        assert set(emg_models.AccessionAlias.objects.filter(entity_type='study').values_list('alias', flat=True)) \
+            == {'SRP05678', 'PRJDB1234'}
+
+        response = client.get(reverse("emgapi_v1:studies-detail", args=["SRP05678"]))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()['data']['id'] == "MGYS00001234"
+        response = client.get(reverse("emgapi_v1:studies-detail", args=["SRP01234"]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_delete_removes_aliases(self, study):
+        study.delete()
+        assert not emg_models.AccessionAlias.objects.filter(entity_type='study').exists()
@@ -149,7 +149,9 @@ def studies(biome):
                 project_id='PRJDB0{:0>3}'.format(pk),
             )
         )
-    return emg_models.Study.objects.bulk_create(studies)
+    studies = emg_models.Study.objects.bulk_create(studies)
+    emg_models.AccessionAlias.objects.sync(emg_models.Study, [study.pk for study in studies])
+    return studies
 
 
 @pytest.fixture
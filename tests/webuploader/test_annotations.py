@@ -22,9 +22,19 @@ from django.core.management import call_command
 
 from rest_framework import status
 
+from emgapi import models as emg_models
+from emgapianns import models as m_models
+from emgapianns import postings as m_postings
+from emgapianns import viewsets as m_viewsets
+
 from test_utils.emg_fixtures import *  # noqa
 
 
+def test_postings_encoding():
+    postings = [(5, 3), (7, 1), (70000, 300), (10 ** 7, 2)]
+    assert m_postings.decode(m_postings.encode(postings)) == postings
+
+
 @pytest.mark.django_db
 class TestAnnotations:
     @property
@@ -171,6 +181,101 @@ class TestAnnotations:
         rsp = response.json()
         assert rsp["data"]["id"] == "IPR009739"
 
+    def test_go_term_analyses(self, client, run):
+        """Test the analyses of a GO term, from the postings list"""
+        for suffix in [".go", ".go_slim"]:
+            call_command(
+                "import_summary",
+                run.accession,
+                os.path.dirname(os.path.abspath(__file__)),
+                suffix=suffix,
+                pipeline="4.1",
+            )
+
+        assert list(m_postings.PostingsList("go-terms", "GO:0030170")) == [1234]
+        assert list(m_postings.PostingsList("go-terms-public", "GO:0030170")) == [1234]
+
+        url = reverse("emgapi_v1:goterms-analyses-list", args=["GO:0030170"])
+        response = client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        rsp = response.json()
+        assert rsp["meta"]["pagination"]["count"] == 1
+        assert [a["id"] for a in rsp["data"]] == ["MGYA00001234"]
+
+        response = client.get(url, {"search": "nothing"})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()["data"]) == 0
+
+        url = reverse("emgapi_v1:goterms-analyses-list", args=["GO:9999"])
+        response = client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_go_term_analyses_private(self, apiclient, django_user_model, run):
+        """Test the analyses made private leave the public postings list,
+        and are listed to their owner only
+        """
+        call_command(
+            "import_summary",
+            run.accession,
+            os.path.dirname(os.path.abspath(__file__)),
+            suffix=".go",
+            pipeline="4.1",
+        )
+        emg_models.Run.objects.filter(pk=run.pk).update(is_private=True)
+        emg_models.AnalysisJob.objects.filter(pk=1234).update(is_private=True)
+        call_command("index_annotation_postings", "go-terms", "--public-only")
+
+        assert list(m_postings.PostingsList("go-terms", "GO:0030170")) == [1234]
+        assert list(m_postings.PostingsList("go-terms-public", "GO:0030170")) == []
+
+        url = reverse("emgapi_v1:goterms-analyses-list", args=["GO:0030170"])
+        for username, expected in ((None, []), ("User-456", []), ("User-123", ["MGYA00001234"])):
+            if username:
+                apiclient.force_authenticate(django_user_model.objects.create(username=username))
+            response = apiclient.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            rsp = response.json()
+            assert rsp["meta"]["pagination"]["count"] == len(expected)
+            assert [a["id"] for a in rsp["data"]] == expected
+
+    def test_postings_list_ranks(self):
+        """Test the positions of job ids in a postings list, and the merge of extra job ids"""
+        for job_id in [1, 5, m_postings.BLOCK_SIZE + 3]:
+            m_postings.update_postings("go-terms", job_id, {"GO:0000001": 1})
+
+        postings = m_postings.PostingsList("go-terms", "GO:0000001")
+        assert postings.ranks([3, m_postings.BLOCK_SIZE + 1]) == [1, 2]
+        assert postings.intersection([5, 6, m_postings.BLOCK_SIZE + 3]) == [5, m_postings.BLOCK_SIZE + 3]
+        postings = m_postings.PostingsList("go-terms", "GO:0000001", reverse=True)
+        assert postings.ranks([3, m_postings.BLOCK_SIZE + 1]) == [2, 1]
+
+        class Jobs(object):
+            def filter(self, job_id__in):
+                return [emg_models.AnalysisJob(job_id=job_id) for job_id in job_id__in]
+
+        analyses = m_viewsets.PostingsAnalyses(postings, Jobs(), [3, m_postings.BLOCK_SIZE + 4, 0])
+        job_ids = [m_postings.BLOCK_SIZE + 4, m_postings.BLOCK_SIZE + 3, 5, 3, 1, 0]
+        assert len(analyses) == len(job_ids)
+        for start in range(len(job_ids)):
+            for stop in range(start, len(job_ids) + 1):
+                assert [job.job_id for job in analyses[start:stop]] == job_ids[start:stop]
+
+    def test_index_annotation_postings(self, run):
+        """Test the postings lists are rebuilt from the analyses"""
+        call_command(
+            "import_summary",
+            run.accession,
+            os.path.dirname(os.path.abspath(__file__)),
+            suffix=".go",
+            pipeline="4.1",
+        )
+        m_models.AnnotationPostings.objects.delete()
+        assert list(m_postings.PostingsList("go-terms", "GO:0030170")) == []
+
+        call_command("index_annotation_postings", "go-terms")
+
+        assert list(m_postings.PostingsList("go-terms", "GO:0030170")) == [1234]
+
     def test_object_does_not_exist(self, client):
         """Test results for an existent annotation"""
         url = reverse("emgapi_v1:goterms-detail", args=["GO:9999"])
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+
+import pytest
+
+from emgapianns.management.lib.batch_import import read_accessions, ImportReport, BatchEntry
+
+
+class TestBatchImport:
+
+    def test_read_accessions(self):
+        lines = [
+            "# accession\tbiome\tlibrary strategy\n",
+            "ERR1234\n",
+            "\n",
+            "ERZ5678\troot:Host-associated:Human\tASSEMBLY\n",
+            "ERR1234\troot:Engineered\tAMPLICON\n",
+        ]
+        entries = read_accessions(lines, biome="root:Environmental:Aquatic:Marine", library_strategy="WGS")
+        assert entries == [
+            BatchEntry("ERR1234", "root:Environmental:Aquatic:Marine", "WGS"),
+            BatchEntry("ERZ5678", "root:Host-associated:Human", "ASSEMBLY"),
+        ]
+
+    def test_read_accessions_without_biome(self):
+        with pytest.raises(ValueError):
+            read_accessions(["ERR1234\n"], library_strategy="WGS")
+
+    def test_report(self):
+        report = ImportReport(["ERR1", "ERR2", "ERR3"])
+        report.set_study("ERR1", "ERP1")
+        report.set_study("ERR2", "ERP1")
+        report.fail("ERR2", "sanity_check", ValueError("missing file"))
+        report.fail("ERR3", "metadata", KeyError())
+        assert report.pending() == ["ERR1"]
+        report.succeed("ERR1")
+        assert report.failed() == ["ERR2", "ERR3"]
+
+        stream = io.StringIO()
+        report.write(stream)
+        assert stream.getvalue().splitlines() == [
+            "accession\tstudy\tstatus\tstage\tmessage",
+            "ERR1\tERP1\timported\t\t",
+            "ERR2\tERP1\tfailed\tsanity_check\tmissing file",
+            "ERR3\t\tfailed\tmetadata\tKeyError()",
+        ]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import gzip
+import os
+from subprocess import check_output
+
+import pytest
+
+from emgapianns.management.lib import file_counter
+
+
+def _test_data_dir():
+    return os.path.join(os.path.dirname(__file__), "test_data")
+
+
+@pytest.fixture
+def fasta_gz(tmp_path):
+    filepath = str(tmp_path / "seqs.fasta.gz")
+    with gzip.open(filepath, "wt") as f:
+        for i in range(50):
+            f.write(">seq{}\nACGTACGTAC\nGGCC\n".format(i))
+    return filepath
+
+
+class TestFileCounter:
+
+    @pytest.mark.parametrize("filepath", sorted(glob.glob(
+        os.path.join(_test_data_dir(), "**", "*.fasta.gz"), recursive=True))[:5])
+    def test_count_seqs_like_zcat_grep(self, filepath):
+        expected = int(check_output("zcat {} | grep -c '>' || true".format(filepath), shell=True).rstrip())
+        assert expected == file_counter.count_seqs(filepath)
+
+    @pytest.mark.parametrize("filepath", sorted(glob.glob(
+        os.path.join(_test_data_dir(), "**", "*.gz"), recursive=True))[:5])
+    def test_count_lines_compressed_like_zcat_wc(self, filepath):
+        expected = int(check_output("zcat {} | wc -l".format(filepath), shell=True).rstrip())
+        assert expected == file_counter.count_lines(filepath, compressed=True)
+
+    def test_count_lines_uncompressed(self, tmp_path):
+        filepath = tmp_path / "annotations.tsv"
+        filepath.write_text("a\tb\nc\td\nno newline at the end")
+        assert 2 == file_counter.count_lines(str(filepath))
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7])
+    def test_headers_split_between_chunks(self, fasta_gz, monkeypatch, chunk_size):
+        monkeypatch.setattr(file_counter, "CHUNK_SIZE", chunk_size)
+        file_counter._count_seqs.cache_clear()
+        assert 50 == file_counter.count_seqs(fasta_gz)
+
+    def test_counts_cached_until_file_changes(self, fasta_gz):
+        assert 50 == file_counter.count_seqs(fasta_gz)
+        hits = file_counter._count_seqs.cache_info().hits
+        assert 50 == file_counter.count_seqs(fasta_gz)
+        assert hits + 1 == file_counter._count_seqs.cache_info().hits
+
+        with gzip.open(fasta_gz, "at") as f:
+            f.write(">one more\nACGT\n")
+        os.utime(fasta_gz, ns=(0, os.stat(fasta_gz).st_mtime_ns + 1000))
+        assert 51 == file_counter.count_seqs(fasta_gz)
+
+    def test_missing_file_has_no_seqs(self, tmp_path):
+        assert 0 == file_counter.count_seqs(str(tmp_path / "missing.fasta.gz"))
+
+    def test_count_files(self, fasta_gz, tmp_path):
+        other = str(tmp_path / "empty.fasta.gz")
+        with gzip.open(other, "wt"):
+            pass
+        counts = file_counter.count_files([fasta_gz, other], file_counter.count_seqs, workers=2)
+        assert {fasta_gz: 50, other: 0} == counts
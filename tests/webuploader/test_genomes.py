@@ -16,6 +16,7 @@
 
 import pytest
 import os
+import shutil
 
 from django.urls import reverse
 from django.core.management import call_command
@@ -26,9 +27,31 @@ from model_bakery import baker
 
 import emgapi.models as emg_models
 
+from emgapianns.management.lib.genome_util import get_expected_genome_files
+
 from test_utils.emg_fixtures import *  # noqa
 
 
+@pytest.fixture
+def complete_catalogue(tmp_path):
+    """A copy of the uhgg 2.0 test catalogue, with placeholders for the files left out of the test data
+    """
+    path = tmp_path / 'genomes' / 'uhgg' / '2.0'
+    shutil.copytree(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data/genomes/uhgg/2.0'),
+        str(path)
+    )
+    (path / 'phylo_tree.json').write_text('{}')
+    for genome_dir in path.iterdir():
+        if not genome_dir.is_dir():
+            continue
+        for filename in get_expected_genome_files(genome_dir.name) | {genome_dir.name + '.fna.fai'}:
+            genome_file = genome_dir / 'genome' / filename
+            if not genome_file.exists():
+                genome_file.write_text('placeholder\n')
+    return str(tmp_path)
+
+
 class TestGenomes:
     """Genomes API tests
     """
@@ -90,6 +113,12 @@ class TestGenomes:
                 compression=fformat[2],
             )
 
+        # seeded by the migrations, but flushed by the transactional tests
+        for group_type in ("Genome analysis", "Pan-Genome analysis"):
+            emg_models.DownloadGroupType.objects.get_or_create(group_type=group_type)
+        for subdir in ("genome", "pan-genome"):
+            emg_models.DownloadSubdir.objects.get_or_create(subdir=subdir)
+
     @pytest.mark.django_db
     def test_import_genomes(self, client):
         """Assert that the import worked for genome 'MGYG000000001'
@@ -168,4 +197,83 @@ class TestGenomes:
 
         assert genome.accession == 'MGYG000000001'
         assert genome.completeness == 90.59
-        assert genome.pangenome_geographic_range.filter(name__in=["North America", "South America"]).count() == 2
\ No newline at end of file
+        assert genome.pangenome_geographic_range.filter(name__in=["North America", "South America"]).count() == 2
+
+    @pytest.mark.django_db
+    def test_import_genomes_in_batches(self, complete_catalogue):
+        self._setup()
+        baker.make('emgapi.Biome',
+                   lineage='root:Host-Associated:Human:Digestive System:Large intestine')
+        args = (
+            'import_genomes',
+            complete_catalogue,
+            'genomes/uhgg/2.0',
+            'UHGG',
+            '2.0',
+            'root:Host-Associated:Human:Digestive System:Large intestine',
+            'v1.2.1',
+            'prokaryotes',
+            '--workers', '2',
+            '--batch-size', '2',
+        )
+        call_command(*args)
+
+        genome = emg_models.Genome.objects.get(accession='MGYG000000001')
+        assert genome.completeness == 98.59
+        assert genome.geographic_origin == 'Europe'
+        assert sorted(genome.geographic_range) == ['Europe', 'North America']
+        assert genome.taxon_genus == 'GCA-900066495'
+        assert genome.taxon_species == 'GCA-900066495 sp902362365'
+        assert emg_models.GenomeCogCounts.objects.get(genome=genome, cog__name='L').genome_count == 176
+        assert emg_models.GenomeKeggClassCounts.objects.get(
+            genome=genome, kegg_class__class_id='09182').genome_count == 493
+        assert emg_models.GenomeKeggModuleCounts.objects.get(
+            genome=genome, kegg_module__name='M00096').genome_count == 8
+        downloads = emg_models.GenomeDownload.objects.filter(genome=genome)
+        assert downloads.filter(alias='MGYG000000001.gff').exists()
+        assert downloads.filter(alias='mashtree.nwk', subdir__subdir='pan-genome').exists()
+        assert emg_models.GenomeCatalogue.objects.get(catalogue_id='uhgg-v2-0').genome_count == 3
+        assert emg_models.AccessionAlias.objects.resolve(
+            emg_models.Genome, [genome.accession, genome.ena_genome_accession])[0] == {genome.pk}
+
+        counts = emg_models.GenomeCogCounts.objects.count()
+        downloads = emg_models.GenomeDownload.objects.count()
+        download_ids = set(emg_models.GenomeDownload.objects.values_list('pk', flat=True))
+
+        # importing again updates the genomes in place
+        call_command(*args)
+        assert emg_models.Genome.objects.count() == 3
+        assert emg_models.GenomeCogCounts.objects.count() == counts
+        assert emg_models.GenomeDownload.objects.count() == downloads
+        assert set(emg_models.GenomeDownload.objects.values_list('pk', flat=True)) == download_ids
+        assert emg_models.CogCat.objects.filter(name='L').count() == 1
+
+    @pytest.mark.django_db
+    def test_remove_catalogue_in_chunks(self, complete_catalogue):
+        self._setup()
+        baker.make('emgapi.Biome',
+                   lineage='root:Host-Associated:Human:Digestive System:Large intestine')
+        call_command(
+            'import_genomes',
+            complete_catalogue,
+            'genomes/uhgg/2.0',
+            'UHGG',
+            '2.0',
+            'root:Host-Associated:Human:Digestive System:Large intestine',
+            'v1.2.1',
+            'prokaryotes',
+        )
+        other_catalogue = baker.make('emgapi.GenomeCatalogue', catalogue_id='other-v1-0', name='Other v1.0')
+        other_genome = baker.make('emgapi.Genome', catalogue=other_catalogue, accession='MGYG000000099')
+        baker.make('emgapi.GenomeCogCounts', genome=other_genome, cog=emg_models.CogCat.objects.first())
+        assert emg_models.GenomeCogCounts.objects.count() > 1
+
+        call_command('remove_genomes_catalogue', 'uhgg-v2-0', '--chunk-size', '2', confirm=True)
+
+        assert not emg_models.GenomeCatalogue.objects.filter(catalogue_id='uhgg-v2-0').exists()
+        assert list(emg_models.Genome.objects.values_list('accession', flat=True)) == ['MGYG000000099']
+        assert list(emg_models.GenomeCogCounts.objects.values_list('genome_id', flat=True)) == [other_genome.pk]
+        assert not emg_models.GenomeKeggClassCounts.objects.exists()
+        assert not emg_models.GenomeDownload.objects.exists()
+        assert not emg_models.Genome.pangenome_geographic_range.through.objects.exists()
+        assert set(emg_models.AccessionAlias.objects.values_list('entity_id', flat=True)) == {other_genome.pk}
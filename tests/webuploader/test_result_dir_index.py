@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 EMBL - European Bioinformatics Institute
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+
+import pytest
+
+from django.core.management import call_command
+
+from emgapianns.management.lib.result_dir_index import ResultDirIndex
+
+
+def _test_data_dir():
+    return os.path.join(os.path.dirname(__file__), "test_data", "results")
+
+
+@pytest.fixture
+def results(tmp_path):
+    rootpath = str(tmp_path / "results")
+    shutil.copytree(_test_data_dir(), rootpath)
+    return rootpath
+
+
+class TestResultDirIndex:
+
+    def test_lookup(self, results, tmp_path):
+        index_path = str(tmp_path / "index.sqlite")
+        call_command("index_result_dirs", "--rootpath", results, "--index", index_path, "--workers", "2")
+
+        with ResultDirIndex(index_path) as index:
+            assert index.find_study_dirs("ERP117125") == [os.path.join(results, "2019/09/ERP117125")]
+            assert index.find_result_dirs("ERP117125", "ERR3506532", "4.1") == [
+                os.path.join(results, "2019/09/ERP117125/version_4.1/ERR350/002/ERR3506532_MERGED_FASTQ")
+            ]
+            assert index.find_result_dirs("ERP117125", "ERR3506532", "5.0") == []
+            assert index.find_result_dirs("ERP021864", "ERR1864826", "4.1") == [
+                os.path.join(results, "2019/02/ERP021864/version_4.1/ERR1864826_FASTQ")
+            ]
+
+    def test_incremental_update(self, results, tmp_path):
+        with ResultDirIndex(str(tmp_path / "index.sqlite")) as index:
+            studies = index.update(results, workers=2)
+            assert studies > 0
+            assert index.update(results, workers=2) == 0
+
+            new_run = os.path.join(results, "2019/02/ERP021864/version_4.1/ERR9999999_FASTQ")
+            os.mkdir(new_run)
+            assert index.update(results, workers=2) == 1
+            assert index.find_result_dirs("ERP021864", "ERR9999999", "4.1") == [new_run]
+
+            shutil.rmtree(os.path.join(results, "2019/02/ERP021864"))
+            assert index.update(results, workers=2) == 0
+            assert index.find_study_dirs("ERP021864") == []
+            assert index.find_result_dirs("ERP021864", "ERR9999999", "4.1") == []
+
+            assert index.update(results, workers=2, full=True) == studies - 1
@@ -14,12 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import os
+import shutil
 from unittest.mock import patch
 import pytest
 import logging
 
-from emgapianns.management.lib import sanity_check  # noqa: E402
+from emgapianns.management.lib import file_counter, sanity_check  # noqa: E402
 from emgapianns.management.lib.uploader_exceptions import (NoAnnotationsFoundException,
                                                            UnexpectedLibraryStrategyException, QCNotPassedException,
                                                            CoverageCheckException)
@@ -243,3 +245,39 @@ class TestSanityCheck:
         test_instance = sanity_check.SanityCheck(accession, result_dir, experiment_type, version, result_status)
         with pytest.raises(CoverageCheckException):
             test_instance.run_coverage_check()
+
+    @pytest.mark.parametrize("accession, experiment_type, version, result_folder, result_status", [
+        ("ERR3506532", "wgs", "4.1",
+         "results/2019/09/ERP117125/version_4.1/ERR350/002/ERR3506532_MERGED_FASTQ", None),
+        ("ERR1697182", "wgs", "5.0", "sanity_check/version_5.0/wgs/ERR1697182_MERGED_FASTQ", "full")
+    ])
+    def test_coverage_check_reuses_manifest(self, tmp_path, accession, experiment_type, version, result_folder,
+                                            result_status):
+        root_dir = os.path.join(os.path.dirname(__file__), "test_data")
+        result_dir = str(tmp_path / os.path.basename(result_folder))
+        shutil.copytree(os.path.join(root_dir, result_folder), result_dir)
+
+        test_instance = sanity_check.SanityCheck(accession, result_dir, experiment_type, version, result_status,
+                                                 use_manifest=True)
+        test_instance.run_coverage_check()
+        manifest_path = os.path.join(result_dir, sanity_check.SanityCheckManifest.FILENAME)
+        with open(manifest_path) as f:
+            counts = json.load(f)["counts"]
+        assert len(counts) > 0
+
+        # unchanged files are not decompressed again
+        test_instance = sanity_check.SanityCheck(accession, result_dir, experiment_type, version, result_status,
+                                                 use_manifest=True)
+        with patch.object(file_counter, "count_lines", side_effect=AssertionError), \
+                patch.object(file_counter, "count_seqs", side_effect=AssertionError):
+            test_instance.run_coverage_check()
+
+        # changed files are
+        changed = next(iter(counts)).split(":", 1)[1]
+        os.utime(changed, ns=(0, os.stat(changed).st_mtime_ns + 1000))
+        test_instance = sanity_check.SanityCheck(accession, result_dir, experiment_type, version, result_status,
+                                                 use_manifest=True)
+        with patch.object(file_counter, "count_lines", side_effect=file_counter.count_lines) as count_lines, \
+                patch.object(file_counter, "count_seqs", side_effect=file_counter.count_seqs) as count_seqs:
+            test_instance.run_coverage_check()
+        assert count_lines.call_count + count_seqs.call_count == 1
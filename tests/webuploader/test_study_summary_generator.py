@@ -14,14 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import gzip
 import os
+import shutil
+from unittest.mock import patch
 
 import pandas as pd
 import pytest
 from model_bakery import baker
 from pandas.testing import assert_frame_equal
 
+from emgapi.columnar import StudyMatrix
 from emgapianns.management.lib import study_summary_generator  # noqa: E402
+from emgapianns.management.lib.count_vector_cache import CountVectorCache
 
 
 @pytest.fixture
@@ -86,6 +92,65 @@ class TestStudySummaryGenerator:
         study_df = study_summary.generate_taxonomy_phylum_summary_v5(analysis_result_dirs, rna_type)
         self.compare_dataframes(study_df, "phylum_taxonomy_abundances_{}_v5.tsv".format(rna_type))
 
+    @pytest.mark.parametrize("rna_type", [
+        ("unite"),
+        ("LSU")
+    ])
+    def test_generate_taxonomy_phylum_summary_v5_workers(self, study_summary, rna_type):
+        analysis_result_dirs = dict()
+        analysis_result_dirs["ERR2237853_MERGED_FASTQ"] = os.path.join(self._test_data_dir(),
+                                                                       "ERR2237853_MERGED_FASTQ")
+        analysis_result_dirs["ERR2237860_MERGED_FASTQ"] = os.path.join(self._test_data_dir(),
+                                                                       "ERR2237860_MERGED_FASTQ")
+        study_summary.workers = 2
+        with study_summary.process_pool():
+            assert study_summary.executor is not None
+            study_df = study_summary.generate_taxonomy_phylum_summary_v5(analysis_result_dirs, rna_type)
+        assert study_summary.executor is None
+        self.compare_dataframes(study_df, "phylum_taxonomy_abundances_{}_v5.tsv".format(rna_type))
+
+    def test_generate_ipr_summary_v5_workers(self, study_summary_v5_assembly):
+        analysis_result_dirs = dict()
+        analysis_result_dirs["ERZ782882_FASTA"] = os.path.join(self._test_data_dir(),
+                                                               "study_summary_generator/version_5.0/assembly/ERZ782882_FASTA")
+        analysis_result_dirs["ERZ782883_FASTA"] = os.path.join(self._test_data_dir(),
+                                                               "study_summary_generator/version_5.0/assembly/ERZ782883_FASTA")
+        study_summary_v5_assembly.workers = 2
+        with study_summary_v5_assembly.process_pool():
+            study_df = study_summary_v5_assembly.generate_ips_summary_v5(analysis_result_dirs)
+        self.compare_dataframes(study_df, "IPR_abundances_v5.tsv")
+
+    def test_count_vectors_cached(self, study_summary_v5_assembly, tmp_path):
+        """
+            Only the analyses with new or changed result files are parsed again.
+        :return:
+        """
+        analysis_result_dirs = dict()
+        for accession in ["ERZ782882_FASTA", "ERZ782883_FASTA"]:
+            analysis_result_dirs[accession] = str(tmp_path / "results" / accession)
+            shutil.copytree(os.path.join(self._test_data_dir(),
+                                         "study_summary_generator/version_5.0/assembly", accession),
+                            analysis_result_dirs[accession])
+        generator = study_summary_v5_assembly
+        generator.cache = CountVectorCache(str(tmp_path / "project-summary-cache"))
+
+        study_df = generator.generate_ips_summary_v5(analysis_result_dirs)
+        self.compare_dataframes(study_df, "IPR_abundances_v5.tsv")
+
+        read_count_vector = study_summary_generator.StudySummaryGenerator.read_count_vector
+        with patch.object(study_summary_generator.StudySummaryGenerator, "read_count_vector",
+                          side_effect=read_count_vector) as parser:
+            cached_df = generator.generate_ips_summary_v5(analysis_result_dirs)
+            assert parser.call_count == 0
+            assert_frame_equal(study_df.reset_index(drop=True), cached_df.reset_index(drop=True))
+
+            changed = os.path.join(analysis_result_dirs["ERZ782883_FASTA"], "functional-annotation",
+                                   "ERZ782883_FASTA.summary.ips")
+            os.utime(changed, ns=(0, os.stat(changed).st_mtime_ns + 1000))
+            generator.generate_ips_summary_v5(analysis_result_dirs)
+            assert parser.call_count == 1
+            assert parser.call_args[0][0] == changed
+
     def test_generate_ipr_summary_v5(self, study_summary_v5_assembly):
         """
             Tests InterProScan summary file generation on v5 assembly data.
@@ -146,6 +211,84 @@ class TestStudySummaryGenerator:
         study_df = study_summary_v4_assembly.generate_go_summary_v4(analysis_result_dirs, "slim")
         self.compare_dataframes(study_df, "GO-slim_abundances_v4.tsv")
 
+    @pytest.mark.parametrize("chunk_size", [1, 7, 100000])
+    def test_parse_phylum_counts_v5_parity(self, study_summary, tmp_path, chunk_size):
+        """
+            The chunked/vectorised parser must give the same counts as
+            normalising every row of the mapseq file one by one.
+        :return:
+        """
+        lineages = ["sk__Bacteria;k__", "sk__Bacteria;k__;p__Acidobacteria;c__;o__",
+                    "sk__Eukaryota;k__Fungi;p__Ascomycota;c__Sordariomycetes", "sk__Archaea;k__;p__Euryarchaeota",
+                    "sk__Eukaryota;k__Metazoa", "sk__Eukaryota;k__;p__Apicomplexa;c__;o__", ""]
+        rows = [lineages[(i * 7) % len(lineages)] for i in range(100)]
+        mapseq_file = str(tmp_path / "ERR0000001_SSU.fasta.mseq.gz")
+        with gzip.open(mapseq_file, "wt") as f:
+            f.write("# mapseq v1.2.3\n#query\tdbhit\tbitscore\tidentity\tmatches\tmismatches\tgaps\tquery_start"
+                    "\tquery_end\tdbhit_start\tdbhit_end\tstrand\t\tSILVA\t\n")
+            for i, lineage in enumerate(rows):
+                f.write("read{}\tX.1\t33\t0.83\t41\t8\t0\t1\t50\t3\t52\t+\t\t{}\t\n".format(i, lineage))
+
+        expected = collections.Counter()
+        for lineage in filter(None, rows):
+            index = lineage.find(";c__")
+            expected[study_summary.normalize_taxa_hierarchy(lineage[0:index] if index > 0 else lineage)] += 1
+        expected["Unassigned;Unassigned;Unassigned"] += 120 - sum(expected.values())
+
+        data = study_summary.parse_phylum_counts_v5(mapseq_file, 120, "SSU", chunk_size=chunk_size)
+        actual = collections.Counter()
+        for superkingdom, kingdom, phylum, count in data.values():
+            actual[";".join([superkingdom, kingdom, phylum])] += count
+        assert expected == actual
+
+    def test_pivot_count_dfs_matches_outer_merge(self, study_summary, tmp_path):
+        """
+            The single pass pivot must write the same TSV as
+            outer-merging the analyses one at a time.
+        :return:
+        """
+        key = ["GO", "description", "category"]
+        dataframes = {
+            "ERR0000002": pd.DataFrame({"GO": ["GO:3", "GO:1", "GO:4"], "description": ["c", "a", None],
+                                        "category": ["bp", "mf", "cc"], "count": [3, 1, 9]}),
+            "ERR0000001": pd.DataFrame({"GO": ["GO:1", "GO:2"], "description": ["a", "b"],
+                                        "category": ["mf", "bp"], "count": [5, 2]}),
+            "ERR0000003": pd.DataFrame({"GO": ["GO:4", "GO:2"], "description": [None, "b"],
+                                        "category": ["cc", "bp"], "count": [1, 7]}),
+        }
+        expected = pd.DataFrame(columns=key)
+        for accession, df in dataframes.items():
+            expected = expected.merge(df.rename(columns={"count": accession}), on=key, how="outer")
+        expected = study_summary.clean_summary_df(expected.sort_values(by=key))
+
+        actual = study_summary.merge_dfs_v5(dataframes, key=key)
+        study_summary.summary_dir = str(tmp_path)
+        study_summary.write_results_file(expected, "expected.tsv")
+        study_summary.write_results_file(actual, "actual.tsv")
+        assert (tmp_path / "expected.tsv").read_text() == (tmp_path / "actual.tsv").read_text()
+        assert list(actual.columns) == key + ["ERR0000002", "ERR0000001", "ERR0000003"]
+
+    def test_pivot_count_dfs_empty(self, study_summary):
+        study_df = study_summary.merge_dfs_v5({}, key=["IPR", "description"])
+        assert study_df.empty
+        assert list(study_df.columns) == ["IPR", "description"]
+
+    def test_write_results_file_columnar(self, study_summary_v5_assembly, tmp_path):
+        analysis_result_dirs = dict()
+        analysis_result_dirs["ERZ782882_FASTA"] = os.path.join(self._test_data_dir(),
+                                                               "study_summary_generator/version_5.0/assembly/ERZ782882_FASTA")
+        analysis_result_dirs["ERZ782883_FASTA"] = os.path.join(self._test_data_dir(),
+                                                               "study_summary_generator/version_5.0/assembly/ERZ782883_FASTA")
+        study_df = study_summary_v5_assembly.generate_ips_summary_v5(analysis_result_dirs)
+        study_summary_v5_assembly.summary_dir = str(tmp_path)
+        study_summary_v5_assembly.write_results_file(study_df, "IPR_abundances_v5.tsv", columnar=True)
+
+        assert (tmp_path / "IPR_abundances_v5.tsv").exists()
+        matrix = StudyMatrix(str(tmp_path / "IPR_abundances_v5.arrow"))
+        assert matrix.key_columns == ["IPR", "description"]
+        assert matrix.analyses == ["ERZ782882", "ERZ782883"]
+        assert_frame_equal(matrix.slice().to_pandas(), study_df.reset_index(drop=True))
+
     @pytest.mark.parametrize("given,expected", [
         ("sk__Eukaryota", "Eukaryota;Unassigned;Unassigned"),
         ("sk__Eukaryota;k__", "Eukaryota;Unassigned;Unassigned"),
@@ -21,6 +21,8 @@ from django.core.management import call_command
 from django.urls import reverse
 from rest_framework import status
 
+from emgapianns import postings as m_postings
+
 from test_utils.emg_fixtures import *  # noqa
 
 
@@ -74,6 +76,40 @@ class TestTaxonomy(object):
         ids = [a['id'] for a in rsp['data']]
         assert ids == expected
 
+    def test_organism_analyses_pipeline_v1(self, client, runjob_pipeline_v1):
+        run_accession = runjob_pipeline_v1.run.accession
+
+        call_command('import_taxonomy', run_accession,
+                     os.path.dirname(os.path.abspath(__file__)),
+                     pipeline='1.0')
+
+        postings = m_postings.PostingsList('organisms', 'Bacteria:Proteobacteria')
+        assert list(postings) == [12345]
+        assert list(m_postings.PostingsList('organisms', 'Bacteria:Chlorobi')) == []
+        assert list(m_postings.PostingsList('organism-subtrees', 'Bacteria:Chlorobi')) == [12345]
+        assert list(m_postings.PostingsList('organism-subtrees-public', 'Bacteria:Chlorobi')) == [12345]
+
+        # the analyses with the organism
+        for lineage in ['Bacteria', 'Bacteria:Proteobacteria:Alphaproteobacteria']:
+            url = reverse('emgapi_v1:organisms-analyses-list', args=[lineage])
+            response = client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            rsp = response.json()
+            assert [a['id'] for a in rsp['data']] == ['MGYA00012345']
+
+        # the analyses with the organism or any of its descendants
+        url = reverse('emgapi_v1:organisms-analyses-list', args=['Bacteria:Proteobacteria:Gammaproteobacteria'])
+        response = client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = client.get(url, {'descendants': 'true'})
+        assert response.status_code == status.HTTP_200_OK
+        rsp = response.json()
+        assert [a['id'] for a in rsp['data']] == ['MGYA00012345']
+
+        url = reverse('emgapi_v1:organisms-analyses-list', args=['abc'])
+        response = client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
     def test_object_does_not_exist(self, client):
         url = reverse('emgapi_v1:organisms-children-list', args=['abc'])
         response = client.get(url)